@@ -1,5 +1,8 @@
 from match import *
 from card import *
+from packed_world import spell_attack_cidx
+import zobrist
+from contextlib import contextmanager
 import random
 import mycopy as copy
 
@@ -25,15 +28,46 @@ class Action:
         self.update_after_apply(game_world)
 
     def virtual_apply(self, game_world) -> 'GameWorld':
-        """ apply this action to the copy of game_world. """
+        """ apply this action to the (copy-on-write) copy of game_world. """
         new_game_world = game_world.copy()
         self.apply(new_game_world)
         return new_game_world
 
+    @contextmanager
+    def trial_apply(self, game_world):
+        """ apply this action to game_world in place and roll it back on exit.
+        This is the undo-log alternative to virtual_apply, which needs no copy at all:
+
+            with action.trial_apply(game_world) as new_game_world:
+                ...
+        """
+        mark = game_world.begin_undo()
+        try:
+            self.apply(game_world)
+            yield game_world
+        finally:
+            game_world.rollback(mark)
+
+    def virtual_apply_packed(self, game_world) -> 'PackedWorld':
+        """ apply this action to the copy of the packed version of game_world. """
+        packed = game_world.packed().copy()
+        self.packed_apply(packed, game_world)
+        return packed
+
+    def packed_apply(self, packed, game_world):
+        """ apply this action to packed, which is a copy of game_world.packed().
+        game_world is only used to locate src_card and target_unit in packed. """
+        self.__packed_apply__(packed, game_world)
+        self.update_after_packed_apply(packed)
+
     def __apply__(self, game_world):
         """ the real action taken place """
         pass
 
+    def __packed_apply__(self, packed, game_world):
+        """ the real action taken place on the packed world. Must mirror __apply__ """
+        pass
+
     def update_after_apply(self, game_world: 'GameWorld'):
         """ update this game world after this action is executed.
         1. The updates include clear dead minions on table,
@@ -41,27 +75,47 @@ class Action:
         3. save to player's used cards
         """
         for player in game_world.data.keys():
-            new_intable = []
-            for card in game_world.intable(player):
-                if card.health > 0:
-                    new_intable.append(card)
-            game_world.update_intable(player, new_intable)
+            # only replace intable when some minion dies so that it keeps being shared otherwise
+            if any(card.health <= 0 for card in game_world.intable(player)):
+                new_intable = []
+                for card in game_world.intable(player):
+                    if card.health > 0:
+                        new_intable.append(card)
+                game_world.update_intable(player, new_intable)
 
         for pawn in game_world.intable(self.src_player):
             if pawn.last_played_card_effect:
                 if isinstance(self, SpellPlay) and pawn.last_played_card_effect == "cast_spell_attack+1":
-                    pawn.attack += 1
+                    game_world.mutable_intable_card(self.src_player, pawn).attack += 1
 
         if isinstance(self, SpellPlay) or isinstance(self, MinionPlay):
             game_world.add_count_to_used_cards(self.src_player, card_name=self.src_card.name)
 
+    def update_after_packed_apply(self, packed: 'PackedWorld'):
+        """ update_after_apply on the packed world """
+        packed.clear_dead_minions()
+
+        if isinstance(self, SpellPlay):
+            intable = packed[self.src_player]['intable']
+            intable['attack'][spell_attack_cidx[intable['cidx']]] += 1
+
+        if isinstance(self, SpellPlay) or isinstance(self, MinionPlay):
+            packed[self.src_player]['used_cards'][self.src_card.cidx] += 1
+
     def copy(self):
         return copy.deepcopy(self)
 
+    def key(self) -> int:
+        """ 64-bit key of this action, which covers the same information as str(action) """
+        pass
+
 
 class NullAction(Action):
     """ do nothing as an action """
 
+    def key(self):
+        return zobrist.action_key(0)
+
     def __repr__(self):
         return "End Turn"
 
@@ -88,6 +142,7 @@ class MinionPlay(Action):
         # a table could have at most 7 minions
         if game_world.len_intable(self.src_player) < 7:
             game_world.play_card_to_intable(self.src_player, new_minion)
+            new_minion = game_world.mutable_intable_card(self.src_player, new_minion)
             if new_minion.charge:
                 new_minion.used_this_turn = False
             else:
@@ -97,6 +152,22 @@ class MinionPlay(Action):
                     MinionPlay(src_player=self.src_player, from_inhands=False, src_card=Card.init_card(summon))\
                         .apply(game_world)
 
+    def __packed_apply__(self, packed: 'PackedWorld', game_world: 'GameWorld'):
+        if self.from_inhands:
+            packed.play_card_from_inhands(self.src_player,
+                                          Card.find_card_idx(game_world.inhands(self.src_player), self.src_card))
+            packed[self.src_player]['mana'] -= self.src_card.mana_cost
+
+        if packed.len_intable(self.src_player) < 7:
+            packed.play_card_to_intable(self.src_player, self.src_card, used_this_turn=not self.src_card.charge)
+            if self.src_card.summon:
+                for summon in self.src_card.summon:
+                    MinionPlay(src_player=self.src_player, from_inhands=False, src_card=Card.init_card(summon))\
+                        .packed_apply(packed, game_world)
+
+    def key(self):
+        return zobrist.action_key(1, src_card=self.src_card)
+
     def __repr__(self):
         return "MinionPlay(%r)" % self.src_card
 
@@ -129,7 +200,7 @@ class SpellPlay(Action):
             if self.target_unit == 'hero':
                 game_world.dec_health(self.target_player, 6)
             else:
-                target_pawn = Card.find_card(game_world.intable(self.target_player), self.target_unit)
+                target_pawn = game_world.mutable_intable_card(self.target_player, self.target_unit)
                 target_pawn.health -= 6
         elif sp_eff == 'transform_to_a_1/1sheep':
             game_world.replace_intable_minion(player=self.target_player,
@@ -140,6 +211,35 @@ class SpellPlay(Action):
             MinionPlay(src_player=self.src_player, from_inhands=False,
                        src_card=Card.init_card('Mirror Image 0/2 Taunt')).apply(game_world)
 
+    def __packed_apply__(self, packed: 'PackedWorld', game_world: 'GameWorld'):
+        packed.play_card_from_inhands(self.src_player,
+                                      Card.find_card_idx(game_world.inhands(self.src_player), self.src_card))
+        packed[self.src_player]['mana'] -= self.src_card.mana_cost
+
+        sp_eff = self.src_card.spell_play_effect
+        if sp_eff == 'this_turn_mana+1':
+            packed[self.src_player]['mana'] += 1
+        elif sp_eff == 'damage_to_a_target_6':
+            if self.target_unit == 'hero':
+                packed[self.target_player]['health'] -= 6
+            else:
+                target_pawn_idx = Card.find_card_idx(game_world.intable(self.target_player), self.target_unit)
+                packed[self.target_player]['intable']['health'][target_pawn_idx] -= 6
+        elif sp_eff == 'transform_to_a_1/1sheep':
+            target_pawn_idx = Card.find_card_idx(game_world.intable(self.target_player), self.target_unit)
+            sheep = Card.init_card('Sheep')
+            packed[self.target_player]['intable'][target_pawn_idx] = \
+                (sheep.cidx, sheep.attack, sheep.health, sheep.divine, sheep.taunt, sheep.used_this_turn)
+        elif sp_eff == 'summon two 0/2 taunt minions':
+            MinionPlay(src_player=self.src_player, from_inhands=False,
+                       src_card=Card.init_card('Mirror Image 0/2 Taunt')).packed_apply(packed, game_world)
+            MinionPlay(src_player=self.src_player, from_inhands=False,
+                       src_card=Card.init_card('Mirror Image 0/2 Taunt')).packed_apply(packed, game_world)
+
+    def key(self):
+        return zobrist.action_key(2, src_card=self.src_card, target_unit=self.target_unit,
+                                  target_self=self.target_player == self.src_player)
+
     def __repr__(self):
         if self.target_player:
             return "SpellPlay(src_card=%r, target_player=%r, target_unit=%r)" % \
@@ -164,12 +264,12 @@ class MinionAttack(Action):
 
     def __apply__(self, game_world: 'GameWorld'):
         assert self.src_card.is_minion
-        pawn = Card.find_card(game_world.intable(self.src_player), self.src_card)
+        pawn = game_world.mutable_intable_card(self.src_player, self.src_card)
 
         if self.target_unit == 'hero':
             game_world.dec_health(self.target_player, pawn.attack)
         else:
-            target_pawn = Card.find_card(game_world.intable(self.target_player), self.target_unit)
+            target_pawn = game_world.mutable_intable_card(self.target_player, self.target_unit)
             if target_pawn.divine:
                 target_pawn.divine = False
             else:
@@ -181,6 +281,30 @@ class MinionAttack(Action):
 
         pawn.used_this_turn = True
 
+    def __packed_apply__(self, packed: 'PackedWorld', game_world: 'GameWorld'):
+        intable = packed[self.src_player]['intable']
+        pawn_idx = Card.find_card_idx(game_world.intable(self.src_player), self.src_card)
+
+        if self.target_unit == 'hero':
+            packed[self.target_player]['health'] -= intable['attack'][pawn_idx]
+        else:
+            target_intable = packed[self.target_player]['intable']
+            target_pawn_idx = Card.find_card_idx(game_world.intable(self.target_player), self.target_unit)
+            if target_intable['divine'][target_pawn_idx]:
+                target_intable['divine'][target_pawn_idx] = False
+            else:
+                target_intable['health'][target_pawn_idx] -= intable['attack'][pawn_idx]
+            if intable['divine'][pawn_idx]:
+                intable['divine'][pawn_idx] = False
+            else:
+                intable['health'][pawn_idx] -= target_intable['attack'][target_pawn_idx]
+
+        intable['used'][pawn_idx] = True
+
+    def key(self):
+        return zobrist.action_key(3, src_card=self.src_card, target_unit=self.target_unit, src_minion=True,
+                                  target_self=self.target_player == self.src_player)
+
     def __repr__(self):
         return "MinionAttack(source=%r, target_player=%r, target_unit=%r)" \
                % (self.src_card, self.target_player, self.target_unit)
@@ -201,12 +325,12 @@ class HeroPowerAttack(Action):
         self.target_unit = target_unit
 
     def __apply__(self, game_world: 'GameWorld'):
-        heropower = game_world.hero_power(self.src_player)  # need to find src card in the new game world
+        heropower = game_world.mutable_hero_power(self.src_player)  # need to find src card in the new game world
         game_world.dec_mana(self.src_player, heropower.mana_cost)
         if self.target_unit == 'hero':
             game_world.dec_health(self.target_player, heropower.attack)
         else:
-            target_pawn = Card.find_card(game_world.intable(self.target_player), self.target_unit)
+            target_pawn = game_world.mutable_intable_card(self.target_player, self.target_unit)
             if target_pawn.divine:
                 target_pawn.divine = False
             else:
@@ -214,6 +338,24 @@ class HeroPowerAttack(Action):
 
         heropower.used_this_turn = True
 
+    def __packed_apply__(self, packed: 'PackedWorld', game_world: 'GameWorld'):
+        heropower = game_world.hero_power(self.src_player)
+        packed[self.src_player]['mana'] -= heropower.mana_cost
+        if self.target_unit == 'hero':
+            packed[self.target_player]['health'] -= heropower.attack
+        else:
+            target_intable = packed[self.target_player]['intable']
+            target_pawn_idx = Card.find_card_idx(game_world.intable(self.target_player), self.target_unit)
+            if target_intable['divine'][target_pawn_idx]:
+                target_intable['divine'][target_pawn_idx] = False
+            else:
+                target_intable['health'][target_pawn_idx] -= heropower.attack
+
+        packed[self.src_player]['hp_used'] = True
+
+    def key(self):
+        return zobrist.action_key(4, target_unit=self.target_unit, target_self=self.target_player == self.src_player)
+
     def __repr__(self):
         return 'HeroPowerAttack(target_player=%r, target_unit=%r)' % (self.target_player, self.target_unit)
 
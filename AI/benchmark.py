@@ -0,0 +1,138 @@
+"""
+Micro-benchmarks for the AI search.
+
+Run from the AI folder:
+
+    python benchmark.py
+"""
+import random
+import time
+from match import Match     # match must be imported first to resolve circular imports
+import constant
+import mycopy
+from card import HeroClass
+from actions import NullAction
+from player import RandomPlayer, QValueFunctionApprox, MonteCarloQValueDQNApprox
+from game_world import GameWorld
+
+ARBITRARY_SEED = 1857
+
+
+def collect_game_worlds(num_matches=20, seed=ARBITRARY_SEED):
+    """ play random matches and return (player, game world) at every decision point """
+    random.seed(seed)
+    player1 = RandomPlayer(cls=HeroClass.MAGE, name='player1', first_player=True,
+                           start_health=30, fix_deck=constant.mage_fix_deck)
+    player2 = RandomPlayer(cls=HeroClass.MAGE, name='player2', first_player=False,
+                           start_health=30, fix_deck=constant.mage_fix_deck)
+    player1.opponent = player2
+    player2.opponent = player1
+    decisions = []
+
+    for _ in range(num_matches):
+        turn = 0
+        match_end = False
+        while not match_end:
+            turn += 1
+            player = player1 if turn % 2 else player2
+            if player.turn_begin_init(turn):
+                break
+            game_world = GameWorld(player1, player2, turn)
+            while True:
+                # players mutate their cards in place at the beginning of a turn,
+                # so the stored game worlds must not share anything with them
+                decisions.append((player, mycopy.deepcopy(game_world)))
+                act = player.search_and_pick_action(game_world)
+                if isinstance(act, NullAction):
+                    break
+                act.apply(game_world)
+                game_world.update_player(player1, player2)
+                if game_world.health(player1) <= 0 or game_world.health(player2) <= 0:
+                    match_end = True
+                    break
+        player1.reset()
+        player2.reset()
+
+    return decisions
+
+
+def decide_pickle_deepcopy(approx, game_world, all_acts):
+    """ how every candidate action was evaluated before copy-on-write game worlds """
+    for act in all_acts:
+        new_game_world = mycopy.deepcopy(game_world)
+        act.apply(new_game_world)
+        approx.extract_world_features(new_game_world)
+
+
+def decide_copy_on_write(approx, game_world, all_acts):
+    for act in all_acts:
+        approx.extract_world_features(act.virtual_apply(game_world))
+
+
+def decide_undo_log(approx, game_world, all_acts):
+    for act in all_acts:
+        with act.trial_apply(game_world) as new_game_world:
+            approx.extract_world_features(new_game_world)
+
+
+def decide_packed(approx, game_world, all_acts):
+    for act in all_acts:
+        act.virtual_apply_packed(game_world).features(approx.player.name)
+
+
+def bench_game_world_copy(decisions, rounds=5):
+    """ decisions per second when evaluating the afterstate of every candidate action """
+    approxes = {}
+    for player, _ in decisions:
+        if player.name not in approxes:
+            approxes[player.name] = QValueFunctionApprox(player)
+    decisions = [(approxes[player.name], game_world, player.search_one_action(game_world))
+                 for player, game_world in decisions]
+
+    for name, decide in (('pickle deepcopy', decide_pickle_deepcopy),
+                         ('copy-on-write', decide_copy_on_write),
+                         ('undo log', decide_undo_log),
+                         ('packed array', decide_packed)):
+        t1 = time.time()
+        for _ in range(rounds):
+            for approx, game_world, all_acts in decisions:
+                decide(approx, game_world, all_acts)
+        duration = time.time() - t1
+        print("{0:>20}: {1:10.1f} decisions/s".format(name, rounds * len(decisions) / duration))
+
+
+def bench_qvalues(decisions, hidden_dim=50, rounds=1):
+    """ decisions per second when scoring every candidate action with the DQN """
+    qvalues_impls = {}
+    for player, _ in decisions:
+        if player.name not in qvalues_impls:
+            qvalues_impls[player.name] = MonteCarloQValueDQNApprox(player, hidden_dim, gamma=1.0, epsilon=0.2,
+                                                                   alpha=0.01, annotation='benchmark')
+    decisions = [(qvalues_impls[player.name], game_world, player.search_one_action(game_world))
+                 for player, game_world in decisions]
+
+    for name, numpy_forward, batched in (('keras per action', False, False),
+                                         ('keras batched', False, True),
+                                         ('numpy batched', True, True)):
+        t1 = time.time()
+        for _ in range(rounds):
+            for qvalues_impl, game_world, all_acts in decisions:
+                qvalues_impl.numpy_forward = numpy_forward
+                if batched:
+                    qvalues_impl.qvalues(game_world, all_acts)
+                else:
+                    [qvalues_impl.qvalue(game_world, act) for act in all_acts]
+        duration = time.time() - t1
+        print("{0:>20}: {1:10.1f} decisions/s".format(name, rounds * len(decisions) / duration))
+
+
+def main():
+    decisions = collect_game_worlds()
+    print("{0} decisions, {1:.1f} candidate actions per decision".format(
+        len(decisions), sum(len(p.search_one_action(g)) for p, g in decisions) / len(decisions)))
+    bench_game_world_copy(decisions)
+    bench_qvalues(decisions)
+
+
+if __name__ == "__main__":
+    main()
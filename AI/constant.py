@@ -8,10 +8,12 @@ ql_exact_data_path = 'data/ql_tab'
 ql_linear_data_path = 'data/ql_linear'
 ql_dqn_data_path = 'data/ql_dqn'
 ql_exact_save_freq = 5000  # num of matches to save q-learning tabular values once
+ql_exact_max_delta_segments = 20  # num of q-learning tabular delta segments on disk before they are merged
 ql_linear_save_freq = 100  # num of matches to save q-learning linear weights once
 ql_dqn_save_freq = 500     # num of matches to save q-learning DQN weights once
 
 ql_epsilon_cap = 0.7       # maximum epsilon to start with
+ql_zobrist_debug = False   # verify incremental zobrist hashes and detect q-value table key collisions
 
 ql_dqn_memory_start_train_size = 50
 ql_dqn_pos_batch_size = 20
@@ -22,6 +24,13 @@ ql_dqn_k = (1 + 1 + 1 + 1 + Card.all_diff_cards_size * 2 + 35 * 2) * 2
 ql_dqn_mem_pos_size = 500000
 ql_dqn_mem_neg_size = 500000
 ql_dqn_train_loss_hist_size = 500
+# prioritized experience replay
+ql_dqn_per_alpha = 0.6             # how much priorities are used. 0 is uniform sampling
+ql_dqn_per_beta = 0.4              # importance-sampling exponent to start with, annealed to 1
+ql_dqn_per_beta_increment = 0.001  # beta increment per sampling
+ql_dqn_per_epsilon = 0.01          # small amount to avoid zero priority
+
+ql_parallel_sync_freq = 50     # num of matches to broadcast learner parameters to self-play workers once
 
 # logger
 # logger = logging.getLogger('hearthstone')
@@ -1,10 +1,30 @@
 from player import Player
 from typing import Union
-import mycopy as copy
+import copy
 from card import *
+from packed_world import PackedWorld
+import zobrist
 
 
 class GameWorld:
+    """
+    A mirror of both players' states.
+
+    Game worlds use structural sharing: copy() only clones the two player dicts, while card lists,
+    hero powers and used card counts are shared with the original world (and with the players the
+    world was created from). Every mutation goes through a write barrier (_writable, _writable_card,
+    _set) which clones a shared container or card the first time this world writes to it
+    (copy-on-write). Alternatively, begin_undo()/rollback() apply changes in place and record an
+    undo log so that the world can be restored without any copy (see Action.trial_apply).
+
+    packed() returns the PackedWorld of this game world, which is cached until the next write.
+
+    zobrist_key() returns a 64-bit hash of the state from the perspective of a player. The hash of each
+    player (see zobrist.player_hash) is maintained incrementally by the mutating methods. Cards returned
+    by mutable_intable_card/mutable_hero_power are mutated by the caller afterwards, so their
+    contributions are removed at once and added back lazily (_flush_pending).
+    """
+
     def __init__(self, player1, player2, turn):
         self.data = {player1.name: {'intable': player1.intable,
                                     'inhands': player1.inhands,
@@ -24,8 +44,18 @@ class GameWorld:
         self.player1_name = player1.name
         self.player2_name = player2.name
         self.turn = turn
-        self.data = copy.deepcopy(self.data)  # make sure game world is a copy of player states
-                                              # so altering game world will not really affect player states
+        self._init_bookkeeping()
+
+    def _init_bookkeeping(self):
+        """ initialize the ownership, undo log, caches and hashes of a game world whose data is set """
+        # nothing is owned at the beginning. the player states are shared and
+        # will be cloned before the first write, so altering game world will not affect player states
+        self._owned = set()         # (player name, key) of containers owned by this game world
+        self._owned_cards = {}      # id(card) -> card owned by this game world
+        self._undo_log = None       # list of undo entries when the undo log is active
+        self._packed = None         # cached PackedWorld
+        self._zobrist = {player: zobrist.player_hash(pdata) for player, pdata in self.data.items()}
+        self._pending = {}          # id(card) -> (player name, card, is hero power) of cards being mutated
 
     def __repr__(self):
         """ representation of this game world, which looks like a simple game UI """
@@ -46,12 +76,155 @@ class GameWorld:
     def __getitem__(self, player_name):
         return self.data[player_name]
 
+    def __getstate__(self):
+        # ownership is meaningless for the (deep) copies pickle creates
+        self._flush_pending()
+        state = self.__dict__.copy()
+        state['_owned'] = set()
+        state['_owned_cards'] = {}
+        state['_undo_log'] = None
+        state['_packed'] = None
+        return state
+
     def copy(self):
-        return copy.deepcopy(self)
+        """ copy-on-write snapshot of this game world. Only the player dicts are cloned. """
+        new_game_world = GameWorld.__new__(GameWorld)
+        new_game_world.data = {player: pdata.copy() for player, pdata in self.data.items()}
+        new_game_world.player1_name = self.player1_name
+        new_game_world.player2_name = self.player2_name
+        new_game_world.turn = self.turn
+        new_game_world._owned = set()
+        new_game_world._owned_cards = {}
+        new_game_world._undo_log = None
+        new_game_world._packed = self._packed
+        self._flush_pending()
+        new_game_world._zobrist = {player: h.copy() for player, h in self._zobrist.items()}
+        new_game_world._pending = {}
+        # containers and cards are now shared with the new game world,
+        # so this game world must clone them before writing to them as well
+        self.release()
+        return new_game_world
+
+    def release(self):
+        """ give up the ownership of all containers and cards """
+        self._owned = set()
+        self._owned_cards = {}
+
+    def packed(self) -> 'PackedWorld':
+        """ packed array representation of this game world """
+        if self._packed is None:
+            self._packed = PackedWorld.from_game_world(self)
+        return self._packed
+
+    def zobrist_key(self, player: Union[Player, str]) -> int:
+        """ 64-bit hash of this game world from the perspective of player.
+        It covers the same information as QValueTabular.state2str. """
+        if isinstance(player, Player):
+            player = player.name
+        self._flush_pending()
+        oppo = self.player2_name if player == self.player1_name else self.player1_name
+        return zobrist.state_key(self._zobrist[player], self._zobrist[oppo], Player.max_mana_this_turn(self.turn + 1))
+
+    def zobrist_hash(self, player: Union[Player, str]) -> list:
+        """ incrementally maintained [board, private] hash of player """
+        if isinstance(player, Player):
+            player = player.name
+        self._flush_pending()
+        return self._zobrist[player]
+
+    def _hash_add(self, player: str, part: int, value: int):
+        h = self._zobrist[player]
+        h[part] = (h[part] + value) & zobrist.MASK
+
+    def _hash_remove_minion(self, player: str, card: 'Card'):
+        """ remove the contribution of an intable minion which is leaving the table """
+        if self._pending.pop(id(card), None) is None:
+            self._hash_add(player, zobrist.BOARD, -zobrist.minion_hash(card))
+
+    def _hash_pend(self, player: str, card: 'Card', is_heropower: bool):
+        """ remove the contribution of card which is about to be mutated. It is added back by _flush_pending """
+        if id(card) in self._pending:
+            return
+        if is_heropower:
+            self._hash_add(player, zobrist.PRIVATE, -zobrist.hp_used_hash(card))
+        else:
+            self._hash_add(player, zobrist.BOARD, -zobrist.minion_hash(card))
+        self._pending[id(card)] = (player, card, is_heropower)
+
+    def _flush_pending(self):
+        """ add back the contributions of mutated cards """
+        for player, card, is_heropower in self._pending.values():
+            if is_heropower:
+                self._hash_add(player, zobrist.PRIVATE, zobrist.hp_used_hash(card))
+            else:
+                self._hash_add(player, zobrist.BOARD, zobrist.minion_hash(card))
+        self._pending = {}
+
+    def begin_undo(self) -> int:
+        """ start recording an undo log. Return a mark to be passed to rollback().
+        While recording, changes are applied in place instead of copy-on-write. """
+        if self._undo_log is None:
+            self._undo_log = []
+        self._flush_pending()
+        self._undo_log.append((self.__dict__, '_zobrist',
+                               {player: h.copy() for player, h in self._zobrist.items()}))
+        return len(self._undo_log) - 1
+
+    def rollback(self, mark: int):
+        """ revert all the changes recorded after mark """
+        self._packed = None
+        self._pending = {}
+        while len(self._undo_log) > mark:
+            target, key, old_value = self._undo_log.pop()
+            if key is None:
+                # card state
+                target.__dict__.clear()
+                target.__dict__.update(old_value)
+            else:
+                target[key] = old_value
+        if mark == 0:
+            self._undo_log = None
+
+    def _set(self, player: str, key, value):
+        """ set data[player][key] to value """
+        pdata = self[player]
+        self._packed = None
+        if self._undo_log is not None:
+            self._undo_log.append((pdata, key, pdata[key]))
+        pdata[key] = value
+
+    def _writable(self, player: str, key):
+        """ return the container (list or dict) data[player][key] which is safe to be mutated in place """
+        pdata = self[player]
+        self._packed = None
+        if self._undo_log is not None:
+            # never mutate a recorded container. the undo entry keeps the original one
+            self._undo_log.append((pdata, key, pdata[key]))
+            pdata[key] = pdata[key].copy()
+        elif (player, key) not in self._owned:
+            pdata[key] = pdata[key].copy()
+            self._owned.add((player, key))
+        return pdata[key]
+
+    def _writable_card(self, card: 'Card') -> 'Card':
+        """ return a version of card which is safe to be mutated in place.
+        The caller must put the returned card where the original card is. """
+        self._packed = None
+        if self._undo_log is not None:
+            self._undo_log.append((card, None, card.__dict__.copy()))
+            return card
+        if id(card) in self._owned_cards:
+            return card
+        # cards keep their cid, so Card.find_card still finds the clone
+        card = copy.copy(card)
+        self._owned_cards[id(card)] = card
+        return card
 
     def update_player(self, player1: 'Player', player2: 'Player'):
         """ update player1 and player2 according to this game world
         This represents the real updates, the updates really affect player states """
+        # containers and cards are shared with players from now on
+        self.release()
         player1.intable = self[player1.name]['intable']
         player1.inhands = self[player1.name]['inhands']
         player1.health = self[player1.name]['health']
@@ -74,12 +247,16 @@ class GameWorld:
     def dec_health(self, player: Union[Player, str], used_health):
         if isinstance(player, Player):
             player = player.name
-        self[player]['health'] -= used_health
+        self._set_health(player, self[player]['health'] - used_health)
 
     def incr_health(self, player: Union[Player, str], boost_health):
         if isinstance(player, Player):
             player = player.name
-        self[player]['health'] += boost_health
+        self._set_health(player, self[player]['health'] + boost_health)
+
+    def _set_health(self, player: str, health):
+        self._hash_add(player, zobrist.BOARD, zobrist.health_hash(health) - zobrist.health_hash(self[player]['health']))
+        self._set(player, 'health', health)
 
     def mana(self, player: Union[Player, str]):
         if isinstance(player, Player):
@@ -89,12 +266,16 @@ class GameWorld:
     def dec_mana(self, player: Union[Player, str], used_mana):
         if isinstance(player, Player):
             player = player.name
-        self[player]['mana'] -= used_mana
+        self._set_mana(player, self[player]['mana'] - used_mana)
 
     def incr_mana(self, player: Union[Player, str], boost_mana):
         if isinstance(player, Player):
             player = player.name
-        self[player]['mana'] += boost_mana
+        self._set_mana(player, self[player]['mana'] + boost_mana)
+
+    def _set_mana(self, player: str, mana):
+        self._hash_add(player, zobrist.PRIVATE, zobrist.mana_hash(mana) - zobrist.mana_hash(self[player]['mana']))
+        self._set(player, 'mana', mana)
 
     def rem_deck(self, player: Union[Player, str]):
         if isinstance(player, Player):
@@ -111,6 +292,16 @@ class GameWorld:
             player = player.name
         return self.hero_power(player).used_this_turn
 
+    def mutable_hero_power(self, player: Union[Player, str]) -> 'Card':
+        """ return the hero power of player which is safe to be mutated """
+        if isinstance(player, Player):
+            player = player.name
+        heropower = self._writable_card(self.hero_power(player))
+        self._hash_pend(player, heropower, is_heropower=True)
+        if heropower is not self.hero_power(player):
+            self._set(player, 'heropower', heropower)
+        return heropower
+
     def inhands(self, player: Union[Player, str]):
         if isinstance(player, Player):
             player = player.name
@@ -120,26 +311,53 @@ class GameWorld:
         if isinstance(player, Player):
             player = player.name
         # card should be one element from inhands (the object reference should exist in the list)
-        self.inhands(player).remove(card)
+        self._writable(player, 'inhands').remove(card)
+        self._hash_add(player, zobrist.PRIVATE, -zobrist.hand_hash(card))
 
     def intable(self, player: Union[Player, str]):
         if isinstance(player, Player):
             player = player.name
         return self[player]['intable']
 
+    def mutable_intable_card(self, player: Union[Player, str], card) -> 'Card':
+        """ return the card with the same cid in player's intable which is safe to be mutated """
+        if isinstance(player, Player):
+            player = player.name
+        intable = self._writable(player, 'intable')
+        target_pawn_idx = Card.find_card_idx(intable, card)
+        intable[target_pawn_idx] = self._writable_card(intable[target_pawn_idx])
+        self._hash_pend(player, intable[target_pawn_idx], is_heropower=False)
+        return intable[target_pawn_idx]
+
     def replace_intable_minion(self, player: Union[Player, str], old_card, new_card):
-        target_pawn_idx = Card.find_card_idx(self.intable(player), old_card)
-        self.intable(player)[target_pawn_idx] = new_card
+        if isinstance(player, Player):
+            player = player.name
+        intable = self._writable(player, 'intable')
+        target_pawn_idx = Card.find_card_idx(intable, old_card)
+        self._hash_remove_minion(player, intable[target_pawn_idx])
+        self._hash_add(player, zobrist.BOARD, zobrist.minion_hash(new_card))
+        intable[target_pawn_idx] = new_card
 
     def update_intable(self, player: Union[Player, str], update_intable: list):
         if isinstance(player, Player):
             player = player.name
-        self[player]['intable'] = update_intable
+        old_ids = set(map(id, self.intable(player)))
+        new_ids = set(map(id, update_intable))
+        for card in self.intable(player):
+            if id(card) not in new_ids:
+                self._hash_remove_minion(player, card)
+        for card in update_intable:
+            if id(card) not in old_ids:
+                self._hash_add(player, zobrist.BOARD, zobrist.minion_hash(card))
+        self._set(player, 'intable', update_intable)
+        if self._undo_log is None:
+            self._owned.add((player, 'intable'))
 
     def play_card_to_intable(self, player: Union[Player, str], card):
         if isinstance(player, Player):
             player = player.name
-        self.intable(player).append(card)
+        self._writable(player, 'intable').append(card)
+        self._hash_add(player, zobrist.BOARD, zobrist.minion_hash(card))
 
     def len_intable(self, player: Union[Player, str]):
         if isinstance(player, Player):
@@ -162,7 +380,7 @@ class GameWorld:
     def add_count_to_used_cards(self, player, card_name):
         if isinstance(player, Player):
             player = player.name
-        self[player]['used_cards'][card_name] += 1
+        self._writable(player, 'used_cards')[card_name] += 1
 
     def used_cards(self, player):
         if isinstance(player, Player):
@@ -1,17 +1,148 @@
-from collections import deque
 import random
 import numpy
-import pickle
+import os.path
 import constant
 
 
+class RingBuffer:
+    """
+    Preallocated fixed-capacity storage of transitions as numpy arrays.
+    When it is full, the oldest transitions are overwritten.
+    """
+    def __init__(self, capacity, k):
+        self.capacity = capacity
+        # numpy.zeros does not touch memory until rows are written
+        self.features = numpy.zeros((capacity, k), dtype=numpy.float32)
+        self.reward = numpy.zeros(capacity, dtype=numpy.float32)
+        self.size = 0
+        self.next_idx = 0       # where the next transition is written
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, features, reward) -> numpy.ndarray:
+        """ append transitions. features: (n, k) array, reward: (n,) array. Return where they are written """
+        features, reward = features[-self.capacity:], reward[-self.capacity:]
+        idx = (self.next_idx + numpy.arange(len(reward))) % self.capacity
+        self.features[idx] = features
+        self.reward[idx] = reward
+        self.next_idx = (self.next_idx + len(reward)) % self.capacity
+        self.size = min(self.size + len(reward), self.capacity)
+        return idx
+
+    def sample_idx(self, size):
+        """ indices of size transitions sampled without replacement """
+        return numpy.array(random.sample(range(self.size), size))
+
+    def ordered_idx(self):
+        """ indices of transitions from the oldest to the newest """
+        return (self.next_idx - self.size + numpy.arange(self.size)) % self.capacity
+
+    def save(self, file_name):
+        idx = self.ordered_idx()
+        numpy.save(file_name + '.features.npy', self.features[idx])
+        numpy.save(file_name + '.reward.npy', self.reward[idx])
+
+    def load(self, file_name):
+        # memory-mapped so that the saved transitions are copied into the buffer without another full copy
+        self.size = self.next_idx = 0
+        self.extend(numpy.load(file_name + '.features.npy', mmap_mode='r'),
+                    numpy.load(file_name + '.reward.npy', mmap_mode='r'))
+
+
+class SumTree:
+    """
+    Binary tree stored in an array, in which every node is the sum of the priorities of its children.
+    tree[1] is the root and the leaves tree[leaf_start:] are the priorities of data indices 0, 1, ...
+    The number of leaves is padded to a power of two so that all leaves have the same depth,
+    which lets a batch of updates and searches walk the tree level by level.
+    """
+    def __init__(self, capacity):
+        self.leaf_start = 1
+        while self.leaf_start < capacity:
+            self.leaf_start *= 2
+        self.tree = numpy.zeros(2 * self.leaf_start)
+
+    def total(self) -> float:
+        return self.tree[1]
+
+    def priorities(self, data_idx) -> numpy.ndarray:
+        return self.tree[self.leaf_start + data_idx]
+
+    def update(self, data_idx, priorities):
+        """ set the priorities of data indices. O(len(data_idx) * log(capacity)) """
+        tree_idx = self.leaf_start + numpy.asarray(data_idx)
+        self.tree[tree_idx] = priorities
+        tree_idx = numpy.unique(tree_idx // 2)
+        while len(tree_idx) and tree_idx[0] > 0:
+            self.tree[tree_idx] = self.tree[2 * tree_idx] + self.tree[2 * tree_idx + 1]
+            tree_idx = numpy.unique(tree_idx // 2)
+
+    def find(self, values) -> numpy.ndarray:
+        """ data indices whose cumulative priority intervals contain values. O(len(values) * log(capacity)) """
+        tree_idx = numpy.ones(len(values), dtype=numpy.int64)
+        values = numpy.asarray(values, dtype=numpy.float64)
+        while tree_idx[0] < self.leaf_start:
+            left = 2 * tree_idx
+            go_right = values > self.tree[left]
+            values = numpy.where(go_right, values - self.tree[left], values)
+            tree_idx = left + go_right
+        return tree_idx - self.leaf_start
+
+
+class PrioritizedRingBuffer(RingBuffer):
+    """
+    Ring buffer whose transitions are sampled with probability proportional to their priorities.
+    New transitions get the max priority so far, so that every transition is sampled at least once.
+    """
+    def __init__(self, capacity, k):
+        super().__init__(capacity, k)
+        self.sum_tree = SumTree(capacity)
+        self.max_priority = 1.
+
+    def extend(self, features, reward):
+        idx = super().extend(features, reward)
+        self.sum_tree.update(idx, self.max_priority)
+        return idx
+
+    def sample_idx_weights(self, size, beta):
+        """ stratified sampling of size transitions, and their importance-sampling weights """
+        total = self.sum_tree.total()
+        values = (numpy.arange(size) + numpy.random.uniform(size=size)) * (total / size)
+        # rounding errors could lead to the padded leaves
+        idx = numpy.minimum(self.sum_tree.find(values), self.size - 1)
+        probs = self.sum_tree.priorities(idx) / total
+        weights = (self.size * probs) ** -beta
+        # normalized by the max weight of this batch instead of the max weight of the whole memory
+        return idx, weights / weights.max()
+
+    def update_priorities(self, idx, errors):
+        priorities = (numpy.abs(errors) + constant.ql_dqn_per_epsilon) ** constant.ql_dqn_per_alpha
+        self.sum_tree.update(idx, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    def save(self, file_name):
+        super().save(file_name)
+        numpy.save(file_name + '.priority.npy', self.sum_tree.priorities(self.ordered_idx()))
+
+    def load(self, file_name):
+        super().load(file_name)
+        if os.path.isfile(file_name + '.priority.npy'):
+            priorities = numpy.load(file_name + '.priority.npy')
+            self.sum_tree.update(self.ordered_idx(), priorities)
+            if len(priorities):
+                self.max_priority = priorities.max()
+
+
 class MonteCarloMemory:
     """
-    Memory used for experience replay
+    Memory used for experience replay.
+    Every transition is stored with its discounted Monte Carlo return as reward,
+    so Q(s,a) is regressed directly on the reward (No max a' Q(s',a')).
     """
     def __init__(self, qvalues_impl):
-        self.neg_memory = deque(maxlen=constant.ql_dqn_mem_neg_size)
-        self.pos_memory = deque(maxlen=constant.ql_dqn_mem_pos_size)
+        self.neg_memory = RingBuffer(constant.ql_dqn_mem_neg_size, qvalues_impl.k)
+        self.pos_memory = RingBuffer(constant.ql_dqn_mem_pos_size, qvalues_impl.k)
         self.qvalues_impl = qvalues_impl
         self.buffer = []
 
@@ -27,28 +158,8 @@ class MonteCarloMemory:
             len(self.pos_memory), len(self.neg_memory))
 
     def sample_minibatch(self, mem, size):
-        mini_batch = random.sample(mem, size)
-        features = numpy.zeros((size, self.qvalues_impl.k))
-        target = numpy.zeros(size)
-
-        for i in range(size):
-            features[i] = mini_batch[i][0]
-            r = mini_batch[i][1]
-            next_features_over_acts = mini_batch[i][2]
-            match_end = mini_batch[i][3]
-            if match_end:
-                target[i] = r
-            else:
-                # Double DQN
-                # action selection is from model, target q(s', a') is from lag_model
-                max_a_idx = numpy.argmax(self.qvalues_impl.model.predict(next_features_over_acts))
-                max_q_s_a = self.qvalues_impl.lag_model.predict(next_features_over_acts)[max_a_idx]
-                # normal DQN
-                # max_a_idx = numpy.argmax(self.qvalues_impl.lag_model.predict(next_features_over_acts))
-                # max_q_s_a = self.qvalues_impl.lag_model.predict(next_features_over_acts)[max_a_idx]
-                target[i] = r + self.qvalues_impl.gamma * max_q_s_a
-
-        return features, target
+        idx = mem.sample_idx(size)
+        return mem.features[idx], mem.reward[idx]
 
     def sample(self):
         features_pos, target_pos = self.sample_minibatch(self.pos_memory, constant.ql_dqn_pos_batch_size)
@@ -59,26 +170,64 @@ class MonteCarloMemory:
         random.shuffle(idx)
         return features[idx], target[idx]
 
+    def file_names(self):
+        file_name = self.qvalues_impl.file_name_memory()
+        return file_name + '.pos', file_name + '.neg'
+
     def save(self):
-        with open(self.qvalues_impl.file_name_memory(), 'wb') as f:
-            pickle.dump((self.pos_memory, self.neg_memory), f, protocol=4)
+        pos_file_name, neg_file_name = self.file_names()
+        self.pos_memory.save(pos_file_name)
+        self.neg_memory.save(neg_file_name)
 
     def load(self):
-        with open(self.qvalues_impl.file_name_memory(), 'rb') as f:
-            self.pos_memory, self.neg_memory = pickle.load(f)
+        pos_file_name, neg_file_name = self.file_names()
+        if os.path.isfile(pos_file_name + '.reward.npy'):
+            self.pos_memory.load(pos_file_name)
+            self.neg_memory.load(neg_file_name)
 
     def append(self, features, reward, next_features_over_acts, match_end):
-        self.buffer.append([features, reward, next_features_over_acts, match_end])
+        # next_features_over_acts is not stored. monte carlo q-learning does not need it
+        self.buffer.append(features)
         if match_end:
             len_buffer = len(self.buffer)
-            for idx, b in enumerate(self.buffer):
-                discount = self.qvalues_impl.gamma ** (len_buffer - (idx + 1))
-                b[1] = discount * reward
-                b[3] = True   # make match_end=True so that only reward is used
-                              # to approximate Q(s,a) (No max a' Q(s',a'))
-                if reward < 0:
-                    self.neg_memory.append(b)
-                else:
-                    self.pos_memory.append(b)
+            discounts = self.qvalues_impl.gamma ** numpy.arange(len_buffer - 1, -1, -1)
+            if reward < 0:
+                self.neg_memory.extend(numpy.array(self.buffer), discounts * reward)
+            else:
+                self.pos_memory.extend(numpy.array(self.buffer), discounts * reward)
             self.buffer = []
 
+
+class PrioritizedMonteCarloMemory(MonteCarloMemory):
+    """
+    Prioritized experience replay (proportional variant). Transitions are sampled with probability
+    proportional to (|TD error| + epsilon) ^ alpha, and the bias is corrected by importance-sampling
+    weights whose exponent beta is annealed to 1.
+    """
+    def __init__(self, qvalues_impl):
+        super().__init__(qvalues_impl)
+        self.neg_memory = PrioritizedRingBuffer(constant.ql_dqn_mem_neg_size, qvalues_impl.k)
+        self.pos_memory = PrioritizedRingBuffer(constant.ql_dqn_mem_pos_size, qvalues_impl.k)
+        self.beta = constant.ql_dqn_per_beta
+        self.last_sample = None     # (pos idx, neg idx, order) of the last sample, used by update_priorities
+
+    def sample(self):
+        """ return features, target and importance-sampling weights """
+        self.beta = min(1., self.beta + constant.ql_dqn_per_beta_increment)
+        idx_pos, weights_pos = self.pos_memory.sample_idx_weights(constant.ql_dqn_pos_batch_size, self.beta)
+        idx_neg, weights_neg = self.neg_memory.sample_idx_weights(constant.ql_dqn_neg_batch_size, self.beta)
+        features = numpy.vstack((self.pos_memory.features[idx_pos], self.neg_memory.features[idx_neg]))
+        target = numpy.concatenate((self.pos_memory.reward[idx_pos], self.neg_memory.reward[idx_neg]))
+        weights = numpy.concatenate((weights_pos, weights_neg))
+        order = list(range(len(target)))
+        random.shuffle(order)
+        self.last_sample = (idx_pos, idx_neg, order)
+        return features[order], target[order], weights[order]
+
+    def update_priorities(self, errors):
+        """ update the priorities of the last sampled transitions by their errors (in the sampled order) """
+        idx_pos, idx_neg, order = self.last_sample
+        unshuffled_errors = numpy.empty(len(order))
+        unshuffled_errors[order] = errors
+        self.pos_memory.update_priorities(idx_pos, unshuffled_errors[:len(idx_pos)])
+        self.neg_memory.update_priorities(idx_neg, unshuffled_errors[len(idx_pos):])
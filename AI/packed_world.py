@@ -0,0 +1,210 @@
+"""
+Compact array-backed representation of GameWorld.
+
+Each player is one fixed-width record of a numpy structured array, so that copying a packed world is
+a memcpy of a few hundred bytes, and hashing and feature extraction work on contiguous arrays
+instead of walking Card objects.
+"""
+import numpy
+from collections import defaultdict
+from card import Card
+
+MAX_INTABLE = 7     # a table could have at most 7 minions
+MAX_INHANDS = 10    # you can maximally hold 10 cards
+
+# every field is int16 so that a packed world can be viewed as a flat int16 array
+minion_dtype = numpy.dtype([('cidx', numpy.int16),
+                            ('attack', numpy.int16),
+                            ('health', numpy.int16),
+                            ('divine', numpy.int16),
+                            ('taunt', numpy.int16),
+                            ('used', numpy.int16)])
+
+player_dtype = numpy.dtype([('health', numpy.int16),
+                            ('mana', numpy.int16),
+                            ('rem_deck', numpy.int16),
+                            ('heropower', numpy.int16),     # cidx of hero power
+                            ('hp_used', numpy.int16),
+                            ('n_intable', numpy.int16),
+                            ('intable', minion_dtype, (MAX_INTABLE,)),
+                            ('n_inhands', numpy.int16),
+                            ('inhands', numpy.int16, (MAX_INHANDS,)),                 # cidx of inhands cards
+                            ('used_cards', numpy.int16, (Card.all_diff_cards_size,))])  # used counts indexed by cidx
+
+# rank of card names indexed by cidx. Cards are sorted by name (Card.__lt__) in state strings
+name_rank = numpy.zeros(Card.all_diff_cards_size, dtype=numpy.int16)
+for _rank, _name in enumerate(sorted(Card.name2cidx_dict)):
+    name_rank[Card.name2cidx_dict[_name]] = _rank
+
+# cidx of minions whose attack increases by one whenever a spell is cast
+spell_attack_cidx = numpy.zeros(Card.all_diff_cards_size, dtype=numpy.bool_)
+for _name, _args in Card.CARD_DB.items():
+    if _args.get('last_played_card_effect') == 'cast_spell_attack+1':
+        spell_attack_cidx[Card.name2cidx_dict[_name]] = True
+
+
+
+def _field_idx(name, player_idx):
+    """ positions of the field name of player player_idx in the flat int16 view of a packed world """
+    dtype, offset = player_dtype.fields[name][:2]
+    start = player_idx * player_dtype.itemsize // 2 + offset // 2
+    return numpy.arange(start, start + dtype.itemsize // 2)
+
+
+def _feature_idx(player_idx):
+    """ positions of features in the flat int16 view of a packed world from the perspective of player_idx
+    (self_h, oppo_h, self_m, self_hp_used, self_used_cards, oppo_used_cards, self_intable, oppo_intable) """
+    oppo_idx = 1 - player_idx
+    idx = [_field_idx('health', player_idx), _field_idx('health', oppo_idx),
+           _field_idx('mana', player_idx), _field_idx('hp_used', player_idx),
+           _field_idx('used_cards', player_idx), _field_idx('used_cards', oppo_idx)]
+    # (taunt, divine, used_this_turn, attack, health) * (minions at most)
+    for p in (player_idx, oppo_idx):
+        intable = _field_idx('intable', p).reshape((MAX_INTABLE, len(minion_dtype)))
+        idx.append(intable[:, [minion_dtype.names.index(name)
+                               for name in ('taunt', 'divine', 'used', 'attack', 'health')]].ravel())
+    return numpy.concatenate(idx)
+
+
+# see QValueFunctionApprox.extract_world_features
+feature_idx = (_feature_idx(0), _feature_idx(1))
+feature_size = len(feature_idx[0])
+# positions of cidx and health of all minion slots of both players
+_intable_idx = numpy.concatenate([_field_idx('intable', 0), _field_idx('intable', 1)])\
+    .reshape((2 * MAX_INTABLE, len(minion_dtype)))
+_intable_cidx_idx = _intable_idx[:, minion_dtype.names.index('cidx')]
+_intable_health_idx = _intable_idx[:, minion_dtype.names.index('health')]
+
+
+class PackedWorld:
+    """
+    GameWorld packed into a structured array of two player records (player1 first).
+    A PackedWorld is never mutated after it is shared; apply actions to a copy().
+    """
+
+    def __init__(self, arr, player_names, turn):
+        self.arr = arr
+        self.player_names = player_names
+        self.turn = turn
+
+    @staticmethod
+    def from_game_world(game_world: 'GameWorld') -> 'PackedWorld':
+        player_names = (game_world.player1_name, game_world.player2_name)
+        arr = numpy.zeros(2, dtype=player_dtype)
+        for p, rec in zip(player_names, arr):
+            pdata = game_world[p]
+            rec['health'] = pdata['health']
+            rec['mana'] = pdata['mana']
+            rec['rem_deck'] = pdata['rem_deck']
+            rec['heropower'] = pdata['heropower'].cidx
+            rec['hp_used'] = pdata['heropower'].used_this_turn
+            rec['n_intable'] = len(pdata['intable'])
+            rec['intable'][:len(pdata['intable'])] = [(mn.cidx, mn.attack, mn.health, mn.divine,
+                                                       mn.taunt, mn.used_this_turn) for mn in pdata['intable']]
+            rec['n_inhands'] = len(pdata['inhands'])
+            rec['inhands'][:len(pdata['inhands'])] = [card.cidx for card in pdata['inhands']]
+            for card_name, count in pdata['used_cards'].items():
+                rec['used_cards'][Card.name2cidx_dict[card_name]] = count
+        return PackedWorld(arr, player_names, game_world.turn)
+
+    def to_game_world(self) -> 'GameWorld':
+        """ unpack into a GameWorld with new Card objects """
+        from game_world import GameWorld
+        game_world = GameWorld.__new__(GameWorld)
+        game_world.data = {}
+        for p, rec in zip(self.player_names, self.arr):
+            heropower = Card.init_card(Card.cidx2name_dict[int(rec['heropower'])])
+            heropower.used_this_turn = bool(rec['hp_used'])
+            intable = []
+            for mn in rec['intable'][:rec['n_intable']]:
+                card = Card.init_card(Card.cidx2name_dict[int(mn['cidx'])])
+                card.attack, card.health = int(mn['attack']), int(mn['health'])
+                card.divine, card.taunt, card.used_this_turn = bool(mn['divine']), bool(mn['taunt']), bool(mn['used'])
+                intable.append(card)
+            used_cards = defaultdict(int)
+            for cidx in numpy.flatnonzero(rec['used_cards']):
+                used_cards[Card.cidx2name_dict[int(cidx)]] = int(rec['used_cards'][cidx])
+            game_world.data[p] = {'intable': intable,
+                                  'inhands': [Card.init_card(Card.cidx2name_dict[int(cidx)])
+                                              for cidx in rec['inhands'][:rec['n_inhands']]],
+                                  'health': int(rec['health']),
+                                  'mana': int(rec['mana']),
+                                  'heropower': heropower,
+                                  'rem_deck': int(rec['rem_deck']),
+                                  'used_cards': used_cards}
+        game_world.player1_name, game_world.player2_name = self.player_names
+        game_world.turn = self.turn
+        game_world._init_bookkeeping()
+        game_world._packed = self
+        return game_world
+
+    def copy(self) -> 'PackedWorld':
+        # copying the flat int16 view is much cheaper than copying the structured array
+        return PackedWorld(self.arr.view(numpy.int16).copy().view(player_dtype), self.player_names, self.turn)
+
+    def index(self, player: str) -> int:
+        """ index of player's record """
+        return 0 if player == self.player_names[0] else 1
+
+    def __getitem__(self, player: str):
+        return self.arr[self.index(player)]
+
+    def __eq__(self, other):
+        return isinstance(other, PackedWorld) and self.turn == other.turn and self.tobytes() == other.tobytes()
+
+    def __hash__(self):
+        return hash(self.tobytes())
+
+    def tobytes(self) -> bytes:
+        return self.arr.tobytes()
+
+    def inhands_sorted(self, player: str) -> numpy.ndarray:
+        """ cidx of inhands cards, sorted by card name """
+        rec = self[player]
+        inhands = rec['inhands'][:rec['n_inhands']]
+        return inhands[numpy.argsort(name_rank[inhands], kind='stable')]
+
+    def intable_sorted(self, player: str) -> numpy.ndarray:
+        """ intable minions, sorted by card name """
+        rec = self[player]
+        intable = rec['intable'][:rec['n_intable']]
+        return intable[numpy.argsort(name_rank[intable['cidx']], kind='stable')]
+
+    def features(self, player: str) -> numpy.ndarray:
+        """ raw features from the perspective of player. See QValueFunctionApprox.extract_world_features """
+        return self.arr.view(numpy.int16)[feature_idx[self.index(player)]].astype(numpy.float64)
+
+    # the following methods mutate this packed world. They mirror the GameWorld methods used by actions
+
+    def play_card_from_inhands(self, player: str, hand_idx: int):
+        rec = self[player]
+        n = rec['n_inhands']
+        inhands = rec['inhands']
+        inhands[hand_idx:(n - 1)] = inhands[(hand_idx + 1):n]
+        inhands[n - 1] = 0
+        rec['n_inhands'] = n - 1
+
+    def len_intable(self, player: str) -> int:
+        return int(self[player]['n_intable'])
+
+    def play_card_to_intable(self, player: str, card: 'Card', used_this_turn: bool):
+        """ put card to the end of intable """
+        rec = self[player]
+        n = rec['n_intable']
+        rec['intable'][n] = (card.cidx, card.attack, card.health, card.divine, card.taunt, used_this_turn)
+        rec['n_intable'] = n + 1
+
+    def clear_dead_minions(self):
+        flat = self.arr.view(numpy.int16)
+        if ((flat[_intable_health_idx] <= 0) & (flat[_intable_cidx_idx] != 0)).any():
+            self._compact_intable()
+
+    def _compact_intable(self):
+        for rec in self.arr:
+            n = rec['n_intable']
+            intable = rec['intable']
+            alive = intable[:n][intable['health'][:n] > 0]
+            if len(alive) < n:
+                intable[:len(alive)] = alive
+                intable[len(alive):] = 0
+                rec['n_intable'] = len(alive)
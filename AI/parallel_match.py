@@ -0,0 +1,163 @@
+"""
+Parallel self-play on a pool of worker processes.
+"""
+from match import Match
+from player import QLearningPlayer
+from collections import deque
+import multiprocessing
+import queue
+import random
+import logging
+import numpy
+import constant
+
+
+logger = logging.getLogger('hearthstone')
+
+
+def _play_matches(worker_idx, seed, player_factory, num_matches, test, init_params, param_queue, episode_queue):
+    """
+    Worker process: play num_matches matches between its own pair of players.
+    Transitions of QLearningPlayers are not learned here but sent to the learner process after every match.
+    """
+    try:
+        random.seed(seed)
+        numpy.random.seed(seed)
+        logger.setLevel(logging.FATAL)
+
+        player1, player2 = player_factory()
+        learning_players = [p for p in (player1, player2) if isinstance(p, QLearningPlayer)]
+        for p in learning_players:
+            p.qvalues_impl.set_params(init_params[p.name])
+            p.reset(test=test)
+            if not test:
+                p.transitions = []
+        match = Match(player1, player2)
+
+        for match_idx in range(num_matches):
+            # only the latest parameters matter
+            params = None
+            try:
+                while True:
+                    params = param_queue.get_nowait()
+            except queue.Empty:
+                pass
+            if params is not None:
+                for p in learning_players:
+                    p.qvalues_impl.set_params(params[p.name])
+
+            match.play_one_match(match_idx)
+            episode = {p.name: p.transitions for p in learning_players if p.transitions is not None}
+            episode_queue.put((worker_idx, episode, match.recent_player1_win_lose[-1]))
+            for p in learning_players:
+                if p.transitions is not None:
+                    p.transitions = []
+    finally:
+        # tell the learner this worker has finished, even if it failed
+        episode_queue.put((worker_idx, None, None))
+
+
+class ParallelMatch:
+    """
+    Self-play on a pool of worker processes.
+
+    Every worker plays matches between its own pair of players created by player_factory, with its own seed.
+    Transitions of every finished match are streamed back to this (learner) process, which learns them
+    on its own pair of players as if the match had been played here. Updated parameters are broadcast to
+    workers every constant.ql_parallel_sync_freq matches.
+
+    player_factory must be picklable (e.g. a module level function) and return a new (player1, player2) pair.
+    """
+
+    def __init__(self, player_factory, num_workers=None, seed=0):
+        self.player_factory = player_factory
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.seed = seed
+        self.player1, self.player2 = player_factory()
+        self.learning_players = {p.name: p for p in (self.player1, self.player2) if isinstance(p, QLearningPlayer)}
+        self.recent_player1_win_lose = deque(maxlen=constant.player1_win_rate_num_games)
+        self.recent_test_player1_win_ratio = []
+        self.num_match = 0
+        # number of workers started so far, every worker is seeded differently
+        self.num_workers_started = 0
+        # tensorflow does not survive fork
+        self.context = multiprocessing.get_context('spawn')
+
+    def params(self, full):
+        return {name: p.qvalues_impl.get_params(full=full) for name, p in self.learning_players.items()}
+
+    def play_n_match(self, n, test=False):
+        """ play n matches on all workers. Return player 1 win rate.
+        In test mode, players of workers do not explore, nothing is learned and the win rate is
+        the one of these n matches only. """
+        init_params = self.params(full=True)
+        episode_queue = self.context.Queue()
+        param_queues = []
+        workers = []
+        for worker_idx in range(self.num_workers):
+            num_matches = n // self.num_workers + (1 if worker_idx < n % self.num_workers else 0)
+            if num_matches == 0:
+                continue
+            param_queue = self.context.Queue()
+            worker = self.context.Process(target=_play_matches,
+                                          args=(worker_idx, self.seed + self.num_workers_started,
+                                                self.player_factory, num_matches, test, init_params,
+                                                param_queue, episode_queue),
+                                          daemon=True)
+            worker.start()
+            self.num_workers_started += 1
+            param_queues.append(param_queue)
+            workers.append(worker)
+
+        player1_win_lose = deque(maxlen=n) if test else self.recent_player1_win_lose
+        num_running = len(workers)
+        while num_running:
+            try:
+                worker_idx, episode, player1_win = episode_queue.get(timeout=1)
+            except queue.Empty:
+                # a killed worker never tells it has finished
+                self._check_workers(workers)
+                continue
+            if episode is None:
+                num_running -= 1
+                continue
+
+            player1_win_lose.append(player1_win)
+            if test:
+                continue
+            for name, transitions in episode.items():
+                qvalues_impl = self.learning_players[name].qvalues_impl
+                for transition in transitions:
+                    qvalues_impl.learn(transition, test=False)
+                qvalues_impl.post_match()
+            self.num_match += 1
+            if self.num_match % constant.ql_parallel_sync_freq == 0:
+                params = self.params(full=False)
+                for param_queue in param_queues:
+                    param_queue.put(params)
+
+        for worker in workers:
+            worker.join()
+        for param_queue in param_queues:
+            # parameters never read by finished workers must not block this process from exiting
+            param_queue.cancel_join_thread()
+            param_queue.close()
+        self._check_workers(workers)
+        if test:
+            test_player1_win_rate = numpy.mean(player1_win_lose) if player1_win_lose else 0
+            self.recent_test_player1_win_ratio.append(test_player1_win_rate)
+            return test_player1_win_rate
+        return self.player1_win_rate
+
+    @staticmethod
+    def _check_workers(workers):
+        failed = [worker.exitcode for worker in workers if worker.exitcode not in (None, 0)]
+        if failed:
+            raise RuntimeError("%d self-play worker(s) failed, exit codes: %r" % (len(failed), failed))
+
+    @property
+    def player1_win_rate(self):
+        if len(self.recent_player1_win_lose) == 0:
+            return 0
+        else:
+            return numpy.mean(self.recent_player1_win_lose)
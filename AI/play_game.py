@@ -1,4 +1,5 @@
 from match import Match
+from parallel_match import ParallelMatch
 import constant
 from card import HeroClass
 from player import RandomPlayer, QLearningPlayer
@@ -77,6 +78,34 @@ def test_rd_vs_ql_exact_mage_fix_deck():
     match.play_n_match(n=100)
 
 
+def rd_vs_ql_exact_mage_fix_deck_players():
+    """ player factory of test_rd_vs_ql_exact_mage_fix_deck_parallel. It must be picklable. """
+    start_health = 30
+    deck = constant.mage_fix_deck
+    player1 = RandomPlayer(cls=HeroClass.MAGE, name='player1', first_player=True,
+                           start_health=start_health, fix_deck=deck)
+    player2 = QLearningPlayer(cls=HeroClass.MAGE, name='player2', first_player=False,
+                              start_health=start_health, fix_deck=deck, method='exact',
+                              annotation='mage_fix_deck_strthl{0}'.format(start_health),
+                              gamma=1.0, epsilon=0.2, alpha=1.0, test=False)
+    return player1, player2
+
+
+def test_rd_vs_ql_exact_mage_fix_deck_parallel():
+    """ the same as test_rd_vs_ql_exact_mage_fix_deck, but self-play runs on all cores """
+    logger = logging.getLogger('hearthstone')
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.WARNING)
+    match = ParallelMatch(rd_vs_ql_exact_mage_fix_deck_players)
+    # train
+    for i in range(1000):
+        train_win_rate = match.play_n_match(n=constant.test_win_rate_num_games)
+        # test
+        test_win_rate = match.play_n_match(n=constant.player1_win_rate_num_games, test=True)
+        logger.warning("player 1 train win rate: {0}, player 1 test win rate: {1}"
+                       .format(train_win_rate, test_win_rate))
+
+
 def test_rd_vs_ql_la_all_fireblast_deck():
     """
     test q learning linear approximation with deck=all_fireblast deck.
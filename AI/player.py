@@ -15,7 +15,10 @@ from collections import deque, defaultdict
 from keras.layers import Dense
 from keras.optimizers import Adam,SGD
 from keras.models import Sequential
-from memory import MonteCarloMemory
+from memory import MonteCarloMemory, PrioritizedMonteCarloMemory
+from packed_world import feature_size
+import zobrist
+import qtable_store
 
 numpy.set_printoptions(threshold=10)
 logger = logging.getLogger('hearthstone')
@@ -217,39 +220,72 @@ class QValueTabular:
         self.num_match = 0                  # number of total matches
         self.annotation = annotation
 
-        # key: state_str, value: dict() with key as act_str and value as (Q(s,a), # of times visiting (s,a)) tuple
+        # key: state key, value: dict() with key as action key and value as (Q(s,a), # of times visiting (s,a)) tuple
+        # see state2key and action2key
         self.qvalues_tab = dict()
+        self.updated_states = set()         # state keys updated since the last get_params()
+        self.unsaved_states = set()         # state keys updated since the last save()
+        # state key -> (state_str, canonical state), used to detect hash collisions in debug mode
+        self.key2str = dict()
 
         # load existing tabular if necessary
         self.load()
 
     def file_name(self):
         """ file name to associate with this qvalue table """
-        file_name = "{0}_gamma{1}_epsilon{2}_alpha{3}_{4}". \
+        file_name = "{0}_gamma{1}_epsilon{2}_alpha{3}_{4}_zobrist". \
             format(constant.ql_exact_data_path, self.gamma, self.epsilon, self.alpha, self.annotation)
         return file_name
 
+    def state2key(self, game_world: 'GameWorld') -> int:
+        """ 64-bit zobrist hash of the game world, which will be used as index in q-value table.
+        It covers the same information as state2str. """
+        state_key = game_world.zobrist_key(self.player)
+        if constant.ql_zobrist_debug:
+            self.check_state_key(game_world, state_key)
+        return state_key
+
+    def check_state_key(self, game_world: 'GameWorld', state_key: int):
+        """ debug mode: check the incremental hash against the one computed from scratch and detect collisions """
+        for player in (self.player.name, self.player.opponent.name):
+            if game_world.zobrist_hash(player) != zobrist.player_hash(game_world[player]):
+                logger.error("incremental zobrist hash of %r is stale: %r" % (player, game_world))
+        # minions with the same name may come in any order in state2str, while hashes are order-independent
+        packed = game_world.packed()
+        state_str = self.state2str(game_world)
+        canonical = (state_str.split(', self-inhands:')[0],
+                     sorted(packed.inhands_sorted(self.player.name).tolist()),
+                     sorted(x[:5] for x in packed.intable_sorted(self.player.name).tolist()),
+                     sorted(x[:5] for x in packed.intable_sorted(self.player.opponent.name).tolist()))
+        old_state_str, old_canonical = self.key2str.setdefault(state_key, (state_str, canonical))
+        if old_canonical != canonical:
+            logger.error("zobrist hash collision %016x: %r and %r" % (state_key, old_state_str, state_str))
+
+    @staticmethod
+    def action2key(action: 'Action') -> int:
+        return action.key()
+
     def state2str(self, game_world: 'GameWorld') -> str:
         """ convert the game world into a short string, which will be used as index in q-value table. """
         player = self.player
+        packed = game_world.packed()
+        self_rec, oppo_rec = packed[player.name], packed[player.opponent.name]
         state_str = "self h:{0}, m:{1}, rem_deck:{2}, hp_used: {3}, oppo h:{4}, mana next turn:{5}, rem_deck:{6}".\
-            format(game_world[player.name]['health'], game_world[player.name]['mana'],
-                   game_world[player.name]['rem_deck'], int(game_world[player.name]['heropower'].used_this_turn),
-                   game_world[player.opponent.name]['health'], player.max_mana_this_turn(game_world.turn + 1),
-                   game_world[player.opponent.name]['rem_deck'])
+            format(self_rec['health'], self_rec['mana'], self_rec['rem_deck'], int(self_rec['hp_used']),
+                   oppo_rec['health'], player.max_mana_this_turn(game_world.turn + 1), oppo_rec['rem_deck'])
 
         # only use cidx list to represent self inhands cards
-        inhands_str = "self-inhands:" + ','.join(map(lambda x: str(x.cidx), sorted(game_world[player.name]['inhands'])))
+        inhands_str = "self-inhands:" + ','.join(map(str, packed.inhands_sorted(player.name).tolist()))
 
         # use (cidx, attack, health, divine, taunt) tuple lists to represent intable cards
         intable_str = "self-intable:" + \
                       ','.join(map(lambda x: '({0}, {1}, {2}, {3}, {4})'.
-                                   format(x.cidx, x.attack, x.health, int(x.divine), int(x.taunt)),
-                                   sorted(game_world[player.name]['intable'])))
+                                   format(x[0], x[1], x[2], int(x[3]), int(x[4])),
+                                   packed.intable_sorted(player.name).tolist()))
         oppo_intable_str = "oppo-intable:" + \
                            ','.join(map(lambda x: '({0}, {1}, {2}, {3}, {4})'.
-                                    format(x.cidx, x.attack, x.health, int(x.divine), int(x.taunt)),
-                                    sorted(game_world[player.opponent.name]['intable'])))
+                                    format(x[0], x[1], x[2], int(x[3]), int(x[4])),
+                                    packed.intable_sorted(player.opponent.name).tolist()))
         return state_str + ", " + inhands_str + ", " + intable_str + ", " + oppo_intable_str
 
     @staticmethod
@@ -260,12 +296,12 @@ class QValueTabular:
         return len(self.qvalues_tab)
 
     def __repr__(self):
-        # print q-value table
+        # print q-value table. state and action strings are only known for the keys seen in debug mode
         s = "Q-table:\n"
-        for state_str, act_qvalue in self.qvalues_tab.items():
-            s += state_str + "\n"
-            for act_str, (qvalue, num_sa) in act_qvalue.items():
-                s += '\t{0}={1}, {2}\n'.format(act_str, qvalue, num_sa)
+        for state_key, act_qvalue in self.qvalues_tab.items():
+            s += self.key2str.get(state_key, ('{0:016x}'.format(state_key),))[0] + "\n"
+            for act_key, (qvalue, num_sa) in act_qvalue.items():
+                s += '\t{0:016x}={1}, {2}\n'.format(act_key, qvalue, num_sa)
         return s
 
     def post_match(self):
@@ -287,97 +323,127 @@ class QValueTabular:
                        % (self.num_match, len(self), self.state_act_visit_times))
 
     def load(self):
-        file_name = self.file_name()
-        # load q values table
-        if os.path.isfile(file_name):
-            with open(file_name, 'rb') as f:
-                self.gamma, self.epsilon, self.alpha, self.num_match, self.state_act_visit_times, self.qvalues_tab \
-                    = pickle.load(f)
+        # load q values table. a test player memory-maps the table instead of reading all of it
+        loaded = qtable_store.load(self.file_name(), mmap=self.player.test)
+        if loaded:
+            (self.gamma, self.epsilon, self.alpha, self.num_match, self.state_act_visit_times), self.qvalues_tab \
+                = loaded
 
     def save(self):
+        """ only the states updated since the last save are written, see qtable_store """
         t1 = time.time()
-        file_name = self.file_name()
-        with open(file_name, 'wb') as f:
-            pickle.dump((self.gamma, self.epsilon, self.alpha,
-                         self.num_match, self.state_act_visit_times, self.qvalues_tab), f, protocol=4)
-        logger.warning("save q values to disk in %d seconds" % (time.time() - t1))
-
-    def qvalue(self, state_str: Union[None, str]=None, act_str: Union[None, str]=None,
+        num_entries = qtable_store.save(self.file_name(),
+                                        (self.gamma, self.epsilon, self.alpha,
+                                         self.num_match, self.state_act_visit_times),
+                                        self.qvalues_tab, self.unsaved_states, constant.ql_exact_max_delta_segments)
+        self.unsaved_states = set()
+        logger.warning("save %d q values to disk in %.2f seconds" % (num_entries, time.time() - t1))
+
+    def qvalue(self, state_key: Union[None, int]=None, act_key: Union[None, int]=None,
                game_world: Union[None, 'GameWorld']=None, action: Union[None, 'Action']=None) -> float:
         """ Q(s,a) """
-        assert (state_str or game_world) and (act_str or action)
-        if not state_str:
-            state_str = self.state2str(game_world)
-        if not act_str:
-            act_str = self.action2str(action)
-        return self.qvalues_tab.get(state_str, dict()).get(act_str, (0, 0))[0]
-
-    def qvalues(self, state_str: Union[None, str]=None, act_strs: Union[None, List[str]]=None,
+        assert (state_key is not None or game_world) and (act_key is not None or action)
+        if state_key is None:
+            state_key = self.state2key(game_world)
+        if act_key is None:
+            act_key = self.action2key(action)
+        return self.qvalues_tab.get(state_key, dict()).get(act_key, (0, 0))[0]
+
+    def qvalues(self, state_key: Union[None, int]=None, act_keys: Union[None, List[int]]=None,
                 game_world: Union[None, 'GameWorld']=None, actions: Union[None, List['Action']]=None) \
             -> List[float]:
         """ Q(s,a) for all a in actions """
-        assert (state_str or game_world) and (act_strs or actions)
-        if not state_str:
-            state_str = self.state2str(game_world)
+        assert (state_key is not None or game_world) and (act_keys or actions)
+        if state_key is None:
+            state_key = self.state2key(game_world)
 
-        if act_strs:
-            return list(map(lambda act_str: self.qvalue(state_str=state_str, act_str=act_str), act_strs))
+        if act_keys:
+            return list(map(lambda act_key: self.qvalue(state_key=state_key, act_key=act_key), act_keys))
         else:
-            return list(map(lambda action: self.qvalue(state_str=state_str, action=action), actions))
+            return list(map(lambda action: self.qvalue(state_key=state_key, action=action), actions))
 
-    def count(self, state_str: str, act_str: str) -> int:
+    def count(self, state_key: int, act_key: int) -> int:
         """ number of visits at (s,a) """
-        return self.qvalues_tab.get(state_str, dict()).get(act_str, (0, 0))[1]
+        return self.qvalues_tab.get(state_key, dict()).get(act_key, (0, 0))[1]
 
     def gen_last_state_act_repr(self, last_state, last_act):
-        last_state_str = self.state2str(last_state)
-        last_act_str = self.action2str(last_act)
-        return (last_state_str, last_act_str)
+        last_state_key = self.state2key(last_state)
+        last_act_key = self.action2key(last_act)
+        return (last_state_key, last_act_key)
 
     def max_qvalue(self, game_world: 'GameWorld') -> float:
         """ max_a Q(s,a)"""
-        state_str = self.state2str(game_world)
+        state_key = self.state2key(game_world)
         all_acts = self.player.search_one_action(game_world)
-        max_state_qvalue = max(map(lambda action: self.qvalue(state_str=state_str, action=action), all_acts))
+        max_state_qvalue = max(map(lambda action: self.qvalue(state_key=state_key, action=action), all_acts))
         return max_state_qvalue
 
-    def set_qvaluetab(self, state_str: str, act_str: str, update_qvalue: float, update_count: int):
-        if not self.qvalues_tab.get(state_str):
-            self.qvalues_tab[state_str] = dict()
-        self.qvalues_tab[state_str][act_str] = (update_qvalue, update_count)
+    def set_qvaluetab(self, state_key: int, act_key: int, update_qvalue: float, update_count: int):
+        if not self.qvalues_tab.get(state_key):
+            self.qvalues_tab[state_key] = dict()
+        self.qvalues_tab[state_key][act_key] = (update_qvalue, update_count)
+        self.updated_states.add(state_key)
+        self.unsaved_states.add(state_key)
+
+    def get_params(self, full=True):
+        """ parameters to be broadcast to copies of this q-value table in other processes.
+        If not full, only the states updated since the last call are included. """
+        if full:
+            qvalues_tab = self.qvalues_tab
+        else:
+            qvalues_tab = {state_key: self.qvalues_tab[state_key] for state_key in self.updated_states}
+        self.updated_states = set()
+        return self.num_match, qvalues_tab
+
+    def set_params(self, params):
+        self.num_match, qvalues_tab = params
+        self.qvalues_tab.update(qvalues_tab)
 
     def update(self, last_state_act_repr, new_game_world: 'GameWorld', r: float, match_end: bool, test: bool):
         """ update Q(s,a) <- (1-alpha) * Q(s,a) + alpha * [R + gamma * max_a' Q(s',a')] """
-        last_state_str, last_act_str = last_state_act_repr
-        new_state_str = self.state2str(new_game_world)
-        old_qvalue = self.qvalue(state_str=last_state_str, act_str=last_act_str)
+        self.learn(self.transition(last_state_act_repr, new_game_world, r, match_end), test)
+
+    def transition(self, last_state_act_repr, new_game_world: 'GameWorld', r: float, match_end: bool):
+        """ compact and picklable representation of an update, which can be learned in another process """
+        last_state_key, last_act_key = last_state_act_repr
+        new_state_key = self.state2key(new_game_world)
+        if match_end:
+            new_act_keys = None
+        else:
+            new_act_keys = list(map(self.action2key, self.player.search_one_action(new_game_world)))
+        return last_state_key, last_act_key, new_state_key, new_act_keys, r, match_end
+
+    def learn(self, transition, test: bool):
+        """ update Q(s,a) from a transition """
+        last_state_key, last_act_key, new_state_key, new_act_keys, r, match_end = transition
+        old_qvalue = self.qvalue(state_key=last_state_key, act_key=last_act_key)
 
         # determine max Q(s',a')
         if match_end:
             max_new_state_qvalue = 0
         else:
-            max_new_state_qvalue = self.max_qvalue(new_game_world)
+            max_new_state_qvalue = max(self.qvalues(state_key=new_state_key, act_keys=new_act_keys))
 
         # not necessary to write to qvalues_tab if
         # R == 0 and  max Q(s',a) == 0 and Q(s,a) == 0
         if r == 0 and max_new_state_qvalue == 0 and old_qvalue == 0:
             return
 
-        update_count = self.count(last_state_str, last_act_str) + 1
+        update_count = self.count(last_state_key, last_act_key) + 1
         alpha = self.alpha / (update_count ** 0.5)
         update_qvalue = (1 - alpha) * old_qvalue + alpha * (r + self.gamma * max_new_state_qvalue)
         self.state_act_visit_times += 1
 
-        logger.info("Q-learning update. this state: %r, this action: %r" % (last_state_str, last_act_str))
+        logger.info("Q-learning update. this state: %016x, this action: %016x" % (last_state_key, last_act_key))
         logger.info(
-            "Q-learning update. new_state_str: %r, max_new_state_qvalue: %f" % (new_state_str, max_new_state_qvalue))
+            "Q-learning update. new_state_key: %016x, max_new_state_qvalue: %f" % (new_state_key, max_new_state_qvalue))
         logger.info("Q-learning update. Q(s,a) <- (1 - alpha) * Q(s,a) + alpha * [R + gamma * max_a' Q(s', a')]:   "
                     "{0} <- (1 - {1}) * {2} + {1} * [{3} + {4} * {5}], # of (s,a) visits: {6}".format
                     (update_qvalue, alpha, old_qvalue, r, self.gamma, max_new_state_qvalue, update_count))
 
         # only update in training phase
         if not test:
-            self.set_qvaluetab(last_state_str, last_act_str, update_qvalue, update_count)
+            self.set_qvaluetab(last_state_key, last_act_key, update_qvalue, update_count)
 
     def determine_r(self, match_end: bool, winner: bool):
         """ determine reward """
@@ -419,15 +485,22 @@ class QLearningPlayer(Player):
         degree = kwargs.get('degree', 1)      # degree for polynomial feature transformation
         hidden_dim = kwargs.get('hidden_dim', 10)
                                               # hidden unit number in DQN
+        numpy_forward = kwargs.get('numpy_forward', False)
+                                              # DQN inference by numpy instead of Keras
+        prioritized = kwargs.get('prioritized', False)
+                                              # DQN prioritized experience replay
         method = kwargs['method']
         annotation = kwargs['annotation']     # additional note for this player
         self.epsilon = epsilon
         self.last_state_act_repr = None
+        self.transitions = None               # when it is a list, transitions are collected here instead of
+                                              # being learned. They are learned in another process (ParallelMatch)
 
         if method == 'exact':
             self.qvalues_impl = QValueTabular(self, gamma, epsilon, alpha, annotation)
         elif method == 'dqn':
-            self.qvalues_impl = MonteCarloQValueDQNApprox(self, hidden_dim, gamma, epsilon, alpha, annotation)
+            self.qvalues_impl = MonteCarloQValueDQNApprox(self, hidden_dim, gamma, epsilon, alpha, annotation,
+                                                          numpy_forward=numpy_forward, prioritized=prioritized)
 
     def pick_action(self, all_acts, game_world) -> 'Action':
         if len(all_acts) == 1:
@@ -444,11 +517,16 @@ class QLearningPlayer(Player):
         """ called when an action is applied.
         update Q values """
         R = self.qvalues_impl.determine_r(match_end, winner)
-        self.qvalues_impl.update(self.last_state_act_repr, new_game_world, R, match_end, self.test)
+        if self.transitions is not None:
+            self.transitions.append(self.qvalues_impl.transition(self.last_state_act_repr, new_game_world,
+                                                                 R, match_end))
+        else:
+            self.qvalues_impl.update(self.last_state_act_repr, new_game_world, R, match_end, self.test)
 
     def post_match(self):
         """ called when a match finishes """
-        self.qvalues_impl.post_match()
+        if self.transitions is None:
+            self.qvalues_impl.post_match()
 
     def epsilon_greedy(self, game_world: 'GameWorld', all_acts: List['Action'], test: bool):
         """ pick actions based on epsilon greedy """
@@ -527,31 +605,45 @@ class QValueFunctionApprox:
 
     def update(self, last_state_act_repr, new_game_world: 'GameWorld',
                r: float, match_end: bool, test: bool):
+        self.learn(self.transition(last_state_act_repr, new_game_world, r, match_end), test)
+
+    def transition(self, last_state_act_repr, new_game_world: 'GameWorld', r: float, match_end: bool):
+        """ compact and picklable representation of an update, which can be learned in another process """
+        pass
+
+    def learn(self, transition, test: bool):
+        pass
+
+    def get_params(self, full=True):
+        """ parameters to be broadcast to copies of this approximation in other processes """
+        pass
+
+    def set_params(self, params):
         pass
 
     def state2str(self, game_world: 'GameWorld') -> str:
         """ convert the game world into a short string """
         player = self.player
         oppo = self.player.opponent
+        packed = game_world.packed()
+        self_rec, oppo_rec = packed[player.name], packed[oppo.name]
         state_str = "self h:{0}, m:{1}, rem_deck:{2}, hp_used: {3}, oppo h:{4}, mana next turn:{5}, rem_deck:{6}". \
-                        format(game_world.health(player), game_world.mana(player),
-                               game_world.rem_deck(player), game_world.hp_used(player),
-                               game_world.health(oppo), player.max_mana_this_turn(game_world.turn + 1),
-                               game_world.rem_deck(oppo))
+                        format(self_rec['health'], self_rec['mana'], self_rec['rem_deck'], bool(self_rec['hp_used']),
+                               oppo_rec['health'], player.max_mana_this_turn(game_world.turn + 1),
+                               oppo_rec['rem_deck'])
 
         # only use cidx list to represent self inhands cards
-        inhands_str = "self-inhands:" + ','.join(
-            map(lambda x: str(x.cidx), sorted(game_world.inhands(player))))
+        inhands_str = "self-inhands:" + ','.join(map(str, packed.inhands_sorted(player.name).tolist()))
 
         # use (cidx, attack, health, divine, taunt) tuple lists to represent intable cards
         intable_str = "self-intable:" + \
                       ','.join(map(lambda x: '({0}, {1}, {2}, {3}, {4})'.
-                                   format(x.cidx, x.attack, x.health, int(x.divine), int(x.taunt)),
-                                   sorted(game_world.intable(player))))
+                                   format(x[0], x[1], x[2], int(x[3]), int(x[4])),
+                                   packed.intable_sorted(player.name).tolist()))
         oppo_intable_str = "oppo-intable:" + \
                            ','.join(map(lambda x: '({0}, {1}, {2}, {3}, {4})'.
-                                        format(x.cidx, x.attack, x.health, int(x.divine), int(x.taunt)),
-                                        sorted(game_world.intable(oppo))))
+                                        format(x[0], x[1], x[2], int(x[3]), int(x[4])),
+                                        packed.intable_sorted(oppo.name).tolist()))
         return state_str + ", " + inhands_str + ", " + intable_str + ", " + oppo_intable_str
 
     @ staticmethod
@@ -607,9 +699,15 @@ class QValueFunctionApprox:
         if it is an end-turn action, we extract the feature from current game world
         otherwise, we extract the feature from the game world AFTER the action is applied
         """
-        if not isinstance(action, NullAction):
-            game_world = action.virtual_apply(game_world)
+        if isinstance(action, NullAction):
+            packed = game_world.packed()
+        else:
+            packed = action.virtual_apply_packed(game_world)
+        return packed.features(self.player.name)
 
+    def extract_world_features(self, game_world: 'GameWorld') -> numpy.ndarray:
+        """ extract raw features by walking the cards of a game world.
+        The same features as PackedWorld.features(), which is what extract_raw_features uses """
         player = self.player
         oppo = self.player.opponent
 
@@ -670,12 +768,20 @@ class QValueFunctionApprox:
         features = self.raw_feature_to_full_feature(features, action)
         return features
 
+    def to_features(self, game_world: 'GameWorld', actions: List['Action']) -> numpy.ndarray:
+        """ full feature arrays of all actions, one row per action. Same rows as to_feature """
+        features = numpy.zeros((len(actions), 2 * feature_size))
+        for i, action in enumerate(actions):
+            if isinstance(action, NullAction):
+                features[i, feature_size:] = self.extract_raw_features(game_world, action)
+            else:
+                features[i, :feature_size] = self.extract_raw_features(game_world, action)
+        return features
+
     def to_feature_over_acts(self, game_world: 'GameWorld'):
-        """ """
+        """ full feature arrays of all available actions in game_world """
         all_acts = self.player.search_one_action(game_world)
-        features_over_acts = numpy.array(
-            list(map(lambda action: self.to_feature(game_world, action), all_acts)))
-        return features_over_acts
+        return self.to_features(game_world, all_acts)
 
     def determine_r(self, match_end: bool, winner: bool):
         """ determine reward """
@@ -691,7 +797,8 @@ class QValueFunctionApprox:
 
 class MonteCarloQValueDQNApprox(QValueFunctionApprox):
     """ use monte-carlo based deep q network for function approximation """
-    def __init__(self, player, hidden_dim, gamma, epsilon, alpha, annotation):
+    def __init__(self, player, hidden_dim, gamma, epsilon, alpha, annotation, numpy_forward=False,
+                 prioritized=False):
         self.hidden_dim = hidden_dim  # hidden dim of 1-layer deep q network
         self.gamma = gamma            # discount factor
         self.epsilon = epsilon        # epsilon-greedy rate
@@ -704,7 +811,16 @@ class MonteCarloQValueDQNApprox(QValueFunctionApprox):
         self.train_hist = deque(maxlen=constant.ql_dqn_train_loss_hist_size)
                                       # Keras model train loss value. update after every fit
         self.k = constant.ql_dqn_k
-        self.memory = MonteCarloMemory(qvalues_impl=self)
+        self.prioritized = prioritized
+                                      # whether to use prioritized experience replay
+        if prioritized:
+            self.memory = PrioritizedMonteCarloMemory(qvalues_impl=self)
+        else:
+            self.memory = MonteCarloMemory(qvalues_impl=self)
+        self.numpy_forward = numpy_forward
+                                      # whether to predict by a numpy forward pass instead of Keras
+        self.numpy_weights = None     # self.model weights for the numpy forward pass.
+                                      # reset whenever self.model weights change
         super().__init__(player)
         # features consist of two parts:
         # 1. features of the afterstate if it is a non-end-turn action. (simulate the action and resulting world)
@@ -735,6 +851,7 @@ class MonteCarloQValueDQNApprox(QValueFunctionApprox):
             with open(self.file_name_pickle(), 'rb') as f:
                 self.gamma, self.epsilon, self.alpha, self.num_match, self.train_hist = pickle.load(f)
             self.model.load_weights(self.file_name_h5())
+            self.numpy_weights = None
             self.memory.load()
         self.sync_lag_model()
 
@@ -771,12 +888,28 @@ class MonteCarloQValueDQNApprox(QValueFunctionApprox):
          feature(s,a) are afterstate, i.e., the state after action is acted on game_world """
         # model.predict only takes 2D array
         features = self.to_feature(game_world, action).reshape((1, -1))
-        qvalue = self.model.predict(features)[0, 0]
+        qvalue = self.predict(features)[0]
         if return_feature:
             return qvalue, features
         else:
             return qvalue
 
+    def qvalues(self, game_world: 'GameWorld', actions: List['Action']) -> List[float]:
+        """ Q(s,a) for a in actions, predicted in one batch """
+        return self.predict(self.to_features(game_world, actions)).tolist()
+
+    def predict(self, features: numpy.ndarray) -> numpy.ndarray:
+        """ Q values of a 2D feature array, one row per state-action pair """
+        if not self.numpy_forward:
+            return self.model.predict(features)[:, 0]
+        if self.numpy_weights is None:
+            self.numpy_weights = self.model.get_weights()
+        # the same network as init_weight: two relu hidden layers and a linear output
+        w1, b1, w2, b2, w3, b3 = self.numpy_weights
+        hidden = numpy.maximum(features.astype(numpy.float32).dot(w1) + b1, 0)
+        hidden = numpy.maximum(hidden.dot(w2) + b2, 0)
+        return hidden.dot(w3)[:, 0] + b3[0]
+
     def __repr__(self):
         s = 'num_match:{0}, epsilon:{1}, {2}, train_loss_size:{3}, mean:{4}'.\
                    format(self.num_match, self.player.adapt_epsilon, self.memory,
@@ -789,27 +922,46 @@ class MonteCarloQValueDQNApprox(QValueFunctionApprox):
         #                   self.lag_model.get_weights()[2].flatten(), self.lag_model.get_weights()[3])
         return s
 
-    def update(self, last_state_act_features, new_game_world: 'GameWorld', r: float, match_end: bool, test: bool):
-        # only update in training phase
-        if test:
-            return
+    def get_params(self, full=True):
+        return self.num_match, self.model.get_weights()
+
+    def set_params(self, params):
+        self.num_match, weights = params
+        self.model.set_weights(weights)
+        self.numpy_weights = None
 
+    def transition(self, last_state_act_features, new_game_world: 'GameWorld', r: float, match_end: bool):
         # logger.info('action:' + str(last_act) + '--' + self.feature2str(features))
         # next_features_over_acts = self.to_feature_over_acts(new_game_world)
         # monte carlo q-learning does not need to use next_features_over_acts
         next_features_over_acts = None
-        self.memory.append(last_state_act_features, r, next_features_over_acts, match_end)
+        return last_state_act_features, r, next_features_over_acts, match_end
+
+    def learn(self, transition, test: bool):
+        # only update in training phase
+        if test:
+            return
+
+        self.memory.append(*transition)
 
         # if memory is not full, continue to collect data
         if not self.memory.start_train():
             return
 
         # train model
-        features, target = self.memory.sample()
+        if self.prioritized:
+            features, target, weights = self.memory.sample()
+            # monte carlo returns are the targets, so errors are against the current model
+            self.memory.update_priorities(target - self.predict(features))
+        else:
+            features, target = self.memory.sample()
+            weights = None
 
         # prev_weight = self.model.get_weights()[0]
         # prev_train_loss = self.model.evaluate(features, target, verbose=0)[0]
-        loss = self.model.fit(features, target, batch_size=len(target), epochs=1, verbose=0).history['loss']
+        loss = self.model.fit(features, target, sample_weight=weights, batch_size=len(target), epochs=1,
+                              verbose=0).history['loss']
+        self.numpy_weights = None
         # post_weight = self.model.get_weights()[0]
         # post_train_loss = self.model.evaluate(features, target, verbose=0)[0]
         self.train_hist.append(loss)
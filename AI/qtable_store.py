@@ -0,0 +1,169 @@
+"""
+Columnar on-disk format of q-value tables.
+
+A table is stored as one base segment and a number of append-only delta segments. Every segment is a .npy
+file of entry_dtype records (state key, action key, Q(s,a), # of visits) sorted by (state key, action key).
+A delta segment holds all the actions of the states updated since the previous save and overrides these
+states in earlier segments, so a save only writes the updated entries. Once there are too many delta
+segments, all segments are merged into a new base segment.
+
+The base segment can be memory-mapped (MemmapQTable), so that a read-only player starts without
+reading the whole table.
+"""
+import os
+import pickle
+import numpy
+
+entry_dtype = numpy.dtype([('state', numpy.uint64),
+                           ('action', numpy.uint64),
+                           ('qvalue', numpy.float32),
+                           ('count', numpy.uint32)])
+
+
+def meta_path(file_name):
+    return file_name + '.meta'
+
+
+def base_path(file_name):
+    return file_name + '.base.npy'
+
+
+def delta_path(file_name, delta_idx):
+    return file_name + '.delta{0}.npy'.format(delta_idx)
+
+
+def to_entries(state_act_qvalues) -> numpy.ndarray:
+    """ sorted entries of (state key, {action key: (Q(s,a), # of visits)}) pairs """
+    entries = numpy.array([(state_key, act_key, qvalue, count)
+                           for state_key, act_qvalue in state_act_qvalues
+                           for act_key, (qvalue, count) in act_qvalue.items()], dtype=entry_dtype)
+    return entries[numpy.lexsort((entries['action'], entries['state']))]
+
+
+def to_dict(entries: numpy.ndarray) -> dict:
+    """ the dict-of-dicts q-value table of entries """
+    qvalues_tab = dict()
+    for state_key, act_key, qvalue, count in entries.tolist():
+        qvalues_tab.setdefault(state_key, dict())[act_key] = (qvalue, count)
+    return qvalues_tab
+
+
+def _write(path, obj):
+    """ write atomically, so that readers never see a partial file and memory-mapped readers keep the old one """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        if isinstance(obj, numpy.ndarray):
+            numpy.save(f, obj)
+        else:
+            pickle.dump(obj, f, protocol=4)
+    os.replace(tmp_path, path)
+
+
+def save(file_name, meta, qvalues_tab, updated_states, max_delta_segments) -> int:
+    """ save qvalues_tab, in which updated_states are updated since the last save.
+    meta is any picklable object saved along. Return the number of entries written. """
+    if os.path.isfile(meta_path(file_name)):
+        with open(meta_path(file_name), 'rb') as f:
+            num_deltas = pickle.load(f)[1]
+    else:
+        num_deltas = None
+
+    if num_deltas is None or num_deltas >= max_delta_segments:
+        # merge everything into a new base segment
+        entries = to_entries(qvalues_tab.items())
+        _write(base_path(file_name), entries)
+        stale_deltas, num_deltas = (num_deltas or 0), 0
+    else:
+        entries = to_entries((state_key, qvalues_tab[state_key]) for state_key in updated_states)
+        _write(delta_path(file_name, num_deltas), entries)
+        stale_deltas, num_deltas = 0, num_deltas + 1
+
+    # segments become visible only when meta is written
+    _write(meta_path(file_name), (meta, num_deltas))
+    for delta_idx in range(stale_deltas):
+        os.remove(delta_path(file_name, delta_idx))
+    return len(entries)
+
+
+def load(file_name, mmap=False):
+    """ return (meta, q-value table) or None if there is no saved table.
+    The table is a dict, or a MemmapQTable if mmap """
+    if not os.path.isfile(meta_path(file_name)):
+        return None
+    with open(meta_path(file_name), 'rb') as f:
+        meta, num_deltas = pickle.load(f)
+
+    overlay = dict()
+    for delta_idx in range(num_deltas):
+        overlay.update(to_dict(numpy.load(delta_path(file_name, delta_idx))))
+    if mmap:
+        return meta, MemmapQTable(numpy.load(base_path(file_name), mmap_mode='r'), overlay)
+    qvalues_tab = to_dict(numpy.load(base_path(file_name)))
+    qvalues_tab.update(overlay)
+    return meta, qvalues_tab
+
+
+class MemmapQTable:
+    """
+    Q-value table on top of a memory-mapped base segment, which supports the dict operations used by
+    QValueTabular. States which are written, or read by [], are copied into an in-memory overlay which
+    shadows the base segment.
+    """
+
+    def __init__(self, base, overlay):
+        self.base = base
+        self.states = base['state']
+        self.overlay = overlay
+        self.num_states = None          # computed on demand, which reads the whole state column
+
+    def _base_act_qvalue(self, state_key):
+        """ {action key: (Q(s,a), # of visits)} of state_key in the base segment, or None """
+        state_key = numpy.uint64(state_key)
+        lo = numpy.searchsorted(self.states, state_key, side='left')
+        hi = numpy.searchsorted(self.states, state_key, side='right')
+        if lo == hi:
+            return None
+        return {act_key: (qvalue, count) for _, act_key, qvalue, count in self.base[lo:hi].tolist()}
+
+    def get(self, state_key, default=None):
+        if state_key in self.overlay:
+            return self.overlay[state_key]
+        act_qvalue = self._base_act_qvalue(state_key)
+        return default if act_qvalue is None else act_qvalue
+
+    def __getitem__(self, state_key):
+        if state_key not in self.overlay:
+            act_qvalue = self._base_act_qvalue(state_key)
+            if act_qvalue is None:
+                raise KeyError(state_key)
+            self.overlay[state_key] = act_qvalue
+        return self.overlay[state_key]
+
+    def __setitem__(self, state_key, act_qvalue):
+        if self.num_states is not None and self.get(state_key) is None:
+            self.num_states += 1
+        self.overlay[state_key] = act_qvalue
+
+    def __contains__(self, state_key):
+        return self.get(state_key) is not None
+
+    def __len__(self):
+        if self.num_states is None:
+            base_states = numpy.unique(self.states)
+            self.num_states = len(base_states) + sum(1 for state_key in self.overlay
+                                                     if self._base_act_qvalue(state_key) is None)
+        return self.num_states
+
+    def keys(self):
+        yield from self.overlay
+        for state_key in numpy.unique(self.states).tolist():
+            if state_key not in self.overlay:
+                yield state_key
+
+    def items(self):
+        for state_key in self.keys():
+            yield state_key, self.get(state_key)
+
+    def update(self, qvalues_tab):
+        for state_key, act_qvalue in qvalues_tab.items():
+            self[state_key] = act_qvalue
@@ -0,0 +1,184 @@
+import sys; sys.path.append("..")
+from collections import deque
+import numpy
+import constant
+from memory import RingBuffer, MonteCarloMemory, SumTree, PrioritizedRingBuffer, PrioritizedMonteCarloMemory
+
+
+class FakeQValues:
+    """ the parts of a q-values implementation a memory uses """
+    k = 2
+    gamma = 0.5
+
+    file_name = "memory"
+
+    def file_name_memory(self):
+        return self.file_name
+
+
+def small_memories(monkeypatch, pos_size=8, neg_size=8):
+    monkeypatch.setattr(constant, "ql_dqn_mem_pos_size", pos_size)
+    monkeypatch.setattr(constant, "ql_dqn_mem_neg_size", neg_size)
+    monkeypatch.setattr(constant, "ql_dqn_pos_batch_size", 3)
+    monkeypatch.setattr(constant, "ql_dqn_neg_batch_size", 2)
+
+
+def test_ring_buffer_wrap_around():
+    memory = RingBuffer(4, 2)
+    assert len(memory) == 0
+    memory.extend(numpy.array([[0., 0.], [1., 1.], [2., 2.]]), numpy.array([0., 1., 2.]))
+    assert len(memory) == 3
+    assert list(memory.reward[memory.ordered_idx()]) == [0., 1., 2.]
+
+    # the oldest transitions are overwritten
+    idx = memory.extend(numpy.array([[3., 3.], [4., 4.]]), numpy.array([3., 4.]))
+    assert list(idx) == [3, 0]
+    assert len(memory) == 4
+    assert list(memory.reward[memory.ordered_idx()]) == [1., 2., 3., 4.]
+    assert list(memory.features[memory.ordered_idx(), 0]) == [1., 2., 3., 4.]
+
+    # more transitions than the capacity at once: only the last ones are kept
+    memory.extend(numpy.arange(12.).reshape(6, 2), numpy.arange(6.))
+    assert list(memory.reward[memory.ordered_idx()]) == [2., 3., 4., 5.]
+
+    idx = memory.sample_idx(3)
+    assert len(set(idx)) == 3 and all(0 <= i < 4 for i in idx)
+
+
+def test_ring_buffer_save_load(tmpdir):
+    memory = RingBuffer(3, 1)
+    memory.extend(numpy.arange(5.).reshape(5, 1), numpy.arange(5.))
+    file_name = str(tmpdir.join("memory"))
+    memory.save(file_name)
+    loaded = RingBuffer(3, 1)
+    loaded.load(file_name)
+    assert len(loaded) == 3
+    assert list(loaded.reward[loaded.ordered_idx()]) == [2., 3., 4.]
+    assert list(loaded.features[loaded.ordered_idx(), 0]) == [2., 3., 4.]
+
+
+def test_monte_carlo_memory(monkeypatch, tmpdir):
+    small_memories(monkeypatch, pos_size=5, neg_size=4)
+    qvalues = FakeQValues()
+    memory = MonteCarloMemory(qvalues)
+    # the former list based memory: deques of (features, discounted reward)
+    pos_memory = deque(maxlen=5)
+    neg_memory = deque(maxlen=4)
+    rng = numpy.random.RandomState(0)
+    for match in range(6):
+        reward = 1 if match % 3 else -1
+        num_turns = 1 + match % 3
+        transitions = []
+        for turn in range(num_turns):
+            features = rng.uniform(size=2).astype(numpy.float32)
+            memory.append(features, reward, None, match_end=turn == num_turns - 1)
+            transitions.append(features)
+        for turn, features in enumerate(transitions):
+            discount = qvalues.gamma ** (num_turns - (turn + 1))
+            (neg_memory if reward < 0 else pos_memory).append((features, discount * reward))
+    assert not memory.buffer
+
+    for mem, expected in ((memory.pos_memory, pos_memory), (memory.neg_memory, neg_memory)):
+        assert len(mem) == len(expected)
+        idx = mem.ordered_idx()
+        assert numpy.array_equal(mem.features[idx], numpy.array([f for f, r in expected]))
+        assert numpy.allclose(mem.reward[idx], [r for f, r in expected])
+
+    features, target = memory.sample()
+    assert features.shape == (5, 2) and features.dtype == numpy.float32
+    assert target.shape == (5, )
+    # every sampled row is a stored transition with its own reward
+    stored = {tuple(f): r for f, r in list(pos_memory) + list(neg_memory)}
+    for f, r in zip(features, target):
+        assert numpy.isclose(stored[tuple(f)], r)
+
+    qvalues.file_name = str(tmpdir.join("memory"))
+    memory.save()
+    loaded = MonteCarloMemory(qvalues)
+    loaded.load()
+    for mem, loaded_mem in ((memory.pos_memory, loaded.pos_memory), (memory.neg_memory, loaded.neg_memory)):
+        assert numpy.array_equal(mem.reward[mem.ordered_idx()], loaded_mem.reward[loaded_mem.ordered_idx()])
+
+
+def test_sum_tree():
+    tree = SumTree(5)
+    assert tree.leaf_start == 8
+    tree.update([0, 1, 2, 3, 4], [1., 2., 3., 4., 5.])
+    assert tree.total() == 15.
+    assert list(tree.priorities(numpy.array([4, 0]))) == [5., 1.]
+
+    # updating priorities replaces them in every sum
+    tree.update([1, 4], [0., 10.])
+    assert tree.total() == 1. + 0. + 3. + 4. + 10.
+    assert list(tree.priorities(numpy.arange(5))) == [1., 0., 3., 4., 10.]
+    for node in range(1, tree.leaf_start):
+        assert tree.tree[node] == tree.tree[2 * node] + tree.tree[2 * node + 1]
+
+    # cumulative intervals: [0, 1) [1, 1) [1, 4) [4, 8) [8, 18)
+    assert list(tree.find([0., 0.5, 1.5, 3.9, 4.5, 8.5, 17.9])) == [0, 0, 2, 2, 3, 4, 4]
+
+
+def test_prioritized_sampling():
+    numpy.random.seed(0)
+    memory = PrioritizedRingBuffer(4, 1)
+    memory.extend(numpy.arange(4, dtype=numpy.float32).reshape(4, 1), numpy.zeros(4))
+    priorities = numpy.array([1., 2., 3., 4.])
+    memory.sum_tree.update(numpy.arange(4), priorities)
+
+    counts = numpy.zeros(4)
+    draws = 0
+    for i in range(2000):
+        idx, weights = memory.sample_idx_weights(8, beta=0.5)
+        counts += numpy.bincount(idx, minlength=4)
+        draws += len(idx)
+    probs = priorities / priorities.sum()
+    assert numpy.allclose(counts / draws, probs, atol=0.01)
+
+
+def test_prioritized_weights():
+    memory = PrioritizedRingBuffer(4, 1)
+    memory.extend(numpy.zeros((4, 1)), numpy.zeros(4))
+    priorities = numpy.array([1., 2., 3., 4.])
+    memory.sum_tree.update(numpy.arange(4), priorities)
+    idx, weights = memory.sample_idx_weights(4, beta=0.5)
+    # (N * P(i)) ^ -beta, normalized by the max weight of the batch
+    expected = (4 * priorities[idx] / priorities.sum()) ** -0.5
+    assert numpy.allclose(weights, expected / expected.max())
+    assert weights.max() == 1.
+
+
+def test_prioritized_wrap_around():
+    memory = PrioritizedRingBuffer(3, 1)
+    memory.extend(numpy.array([[0.], [1.]]), numpy.array([0., 1.]))
+    memory.update_priorities(numpy.array([0, 1]), numpy.array([5., 0.]))
+    max_priority = (5. + constant.ql_dqn_per_epsilon) ** constant.ql_dqn_per_alpha
+    assert numpy.isclose(memory.max_priority, max_priority)
+
+    # the oldest transition is overwritten, with the max priority
+    memory.extend(numpy.array([[2.], [3.]]), numpy.array([2., 3.]))
+    assert len(memory) == 3
+    assert list(memory.reward[memory.ordered_idx()]) == [1., 2., 3.]
+    assert numpy.allclose(memory.sum_tree.priorities(numpy.array([0, 2])), max_priority)
+    low_priority = constant.ql_dqn_per_epsilon ** constant.ql_dqn_per_alpha
+    assert numpy.isclose(memory.sum_tree.total(), 2 * max_priority + low_priority)
+
+
+def test_prioritized_monte_carlo_update(monkeypatch):
+    small_memories(monkeypatch)
+    memory = PrioritizedMonteCarloMemory(FakeQValues())
+    for reward in (1, -1, 1, -1):
+        for i in range(3):
+            memory.append(numpy.array([reward, i]), reward, None, match_end=i == 2)
+    assert len(memory.pos_memory) == len(memory.neg_memory) == 6
+
+    features, target, weights = memory.sample()
+    assert features.shape == (5, 2)
+    assert target.shape == weights.shape == (5, )
+    # errors are given in the sampled order, and land on the sampled transitions
+    errors = numpy.where(features[:, 0] > 0, 1., 2.)
+    memory.update_priorities(errors)
+    idx_pos, idx_neg, order = memory.last_sample
+    assert numpy.allclose(memory.pos_memory.sum_tree.priorities(idx_pos),
+                          (1. + constant.ql_dqn_per_epsilon) ** constant.ql_dqn_per_alpha)
+    assert numpy.allclose(memory.neg_memory.sum_tree.priorities(idx_neg),
+                          (2. + constant.ql_dqn_per_epsilon) ** constant.ql_dqn_per_alpha)
@@ -0,0 +1,77 @@
+import sys; sys.path.append("..")
+import os.path
+import qtable_store
+
+
+def file_name(tmpdir):
+    # as QValueTabular.file_name(): tables keyed by zobrist hashes have their own files
+    return str(tmpdir.join("qtable_gamma1.0_epsilon0.3_alpha0.1_test_zobrist"))
+
+
+def assert_same_lookups(loaded, qvalues_tab):
+    assert len(loaded) == len(qvalues_tab)
+    assert set(loaded.keys()) == set(qvalues_tab)
+    for state_key, act_qvalue in qvalues_tab.items():
+        assert state_key in loaded
+        for act_key, qvalue_count in act_qvalue.items():
+            assert loaded.get(state_key, dict()).get(act_key, (0, 0)) == qvalue_count
+            assert loaded[state_key][act_key] == qvalue_count
+    # missing states and actions get the default
+    assert 12345 not in loaded
+    assert loaded.get(12345, dict()).get(1, (0, 0)) == (0, 0)
+    assert loaded.get(next(iter(qvalues_tab)), dict()).get(12345, (0, 0)) == (0, 0)
+
+
+def test_round_trip(tmpdir):
+    name = file_name(tmpdir)
+    assert qtable_store.load(name) is None
+    big_key = 2 ** 63 + 5
+    qvalues_tab = {
+        big_key: {1: (0.5, 3), 2 ** 64 - 1: (-1., 1)},
+        7: {1: (2., 1)},
+    }
+    qtable_store.save(name, ("meta", 1), qvalues_tab, set(qvalues_tab), max_delta_segments=2)
+    assert os.path.isfile(name + ".meta") and os.path.isfile(name + ".base.npy")
+
+    # a delta segment with the updated states only
+    qvalues_tab[7][3] = (1.5, 2)
+    qvalues_tab[9] = {1: (0.25, 1)}
+    num_entries = qtable_store.save(name, ("meta", 2), qvalues_tab, {7, 9}, max_delta_segments=2)
+    assert num_entries == 3
+    assert os.path.isfile(name + ".delta0.npy")
+
+    for mmap in (False, True):
+        meta, loaded = qtable_store.load(name, mmap=mmap)
+        assert meta == ("meta", 2)
+        assert isinstance(loaded, qtable_store.MemmapQTable) == mmap
+        assert_same_lookups(loaded, qvalues_tab)
+
+    # without the zobrist suffix, it is another table
+    assert qtable_store.load(name[:-len("_zobrist")]) is None
+
+
+def test_merge_deltas(tmpdir):
+    name = file_name(tmpdir)
+    qvalues_tab = {1: {1: (1., 1)}}
+    qtable_store.save(name, None, qvalues_tab, {1}, max_delta_segments=1)
+    qvalues_tab[2] = {1: (2., 1)}
+    qtable_store.save(name, None, qvalues_tab, {2}, max_delta_segments=1)
+    qvalues_tab[1][1] = (3., 2)
+    # too many deltas: everything is merged into a new base segment
+    assert qtable_store.save(name, None, qvalues_tab, {1}, max_delta_segments=1) == 2
+    assert not os.path.isfile(name + ".delta0.npy")
+
+    for mmap in (False, True):
+        meta, loaded = qtable_store.load(name, mmap=mmap)
+        assert_same_lookups(loaded, qvalues_tab)
+
+
+def test_memmap_writes(tmpdir):
+    name = file_name(tmpdir)
+    qvalues_tab = {1: {1: (1., 1)}, 2: {1: (2., 1)}}
+    qtable_store.save(name, None, qvalues_tab, set(qvalues_tab), max_delta_segments=2)
+    meta, loaded = qtable_store.load(name, mmap=True)
+    loaded[2] = {1: (4., 2)}
+    loaded[3] = {1: (5., 1)}
+    qvalues_tab.update({2: {1: (4., 2)}, 3: {1: (5., 1)}})
+    assert_same_lookups(loaded, qvalues_tab)
@@ -0,0 +1,101 @@
+"""
+Zobrist-style 64-bit hashing of game states and actions, used as q-value table keys.
+
+Every component of a state (hero health, mana, remaining deck, hero power used, each intable minion and
+each inhands card) has a random 64-bit value. The hash of a player is the sum (modulo 2^64) of the
+values of his components, so that it can be updated incrementally when a component changes, and
+multisets (intable, inhands) are order-independent and support duplicates.
+A state key covers the same information as QValueTabular.state2str.
+"""
+import numpy
+
+MASK = (1 << 64) - 1
+BOARD = 0       # index of the hash of components visible to both players: health, rem_deck, intable
+PRIVATE = 1     # index of the hash of components only visible to the player: mana, hp_used, inhands
+
+# the tables must never change, otherwise saved q-value tables become invalid
+_rng = numpy.random.RandomState(1857)
+
+
+def _table(size):
+    return [int(x) for x in _rng.randint(0, 2 ** 64, size=size, dtype=numpy.uint64)]
+
+
+_health = _table(128)
+_rem_deck = _table(64)
+_mana = _table(32)
+_hp_used = _table(2)
+_next_turn_mana = _table(32)
+_hand_cidx = _table(128)
+_minion_cidx = _table(128)
+_minion_attack = _table(64)
+_minion_health = _table(64)
+_minion_divine = _table(2)
+_minion_taunt = _table(2)
+_action_kind = _table(8)
+_action_src_cidx = _table(128)
+_target_hero = _table(1)[0]
+_target_self = _table(1)[0]
+_ODD_OPPO = _table(1)[0] | 1        # odd multipliers are bijections modulo 2^64
+_ODD_TARGET = _table(1)[0] | 1
+
+
+def health_hash(health):
+    return _health[health % 128]
+
+
+def rem_deck_hash(rem_deck):
+    return _rem_deck[rem_deck % 64]
+
+
+def mana_hash(mana):
+    return _mana[mana % 32]
+
+
+def hp_used_hash(heropower):
+    return _hp_used[int(heropower.used_this_turn)]
+
+
+def hand_hash(card):
+    return _hand_cidx[card.cidx]
+
+
+def minion_hash(card):
+    """ hash of an intable minion, from the same (cidx, attack, health, divine, taunt) as state2str """
+    return _minion_cidx[card.cidx] ^ _minion_attack[card.attack % 64] ^ _minion_health[card.health % 64] ^ \
+        _minion_divine[int(card.divine)] ^ _minion_taunt[int(card.taunt)]
+
+
+def player_hash(pdata) -> list:
+    """ [BOARD hash, PRIVATE hash] of a player dict of GameWorld, computed from scratch """
+    board = health_hash(pdata['health']) + rem_deck_hash(pdata['rem_deck'])
+    for card in pdata['intable']:
+        board += minion_hash(card)
+    private = mana_hash(pdata['mana']) + hp_used_hash(pdata['heropower'])
+    for card in pdata['inhands']:
+        private += hand_hash(card)
+    return [board & MASK, private & MASK]
+
+
+def state_key(self_hash, oppo_hash, next_turn_mana) -> int:
+    """ state key from the perspective of the player whose hash is self_hash """
+    return (self_hash[BOARD] + self_hash[PRIVATE] + oppo_hash[BOARD] * _ODD_OPPO +
+            _next_turn_mana[next_turn_mana % 32]) & MASK
+
+
+def action_key(kind, src_card=None, target_unit=None, src_minion=False, target_self=False) -> int:
+    """ action key, which covers the same information as str(action) from the perspective of the acting player.
+    kind: index of the action type, src_minion: whether src_card is an intable minion (whose stats matter),
+    target_self: whether the target belongs to the acting player """
+    key = _action_kind[kind]
+    if target_self:
+        key ^= _target_self
+    if src_card is not None:
+        key ^= _action_src_cidx[src_card.cidx]
+        if src_minion:
+            key ^= minion_hash(src_card)
+    if target_unit == 'hero':
+        key ^= _target_hero
+    elif target_unit is not None:
+        key ^= (minion_hash(target_unit) * _ODD_TARGET) & MASK
+    return key
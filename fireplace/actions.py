@@ -1,6 +1,10 @@
+import threading
 from collections import OrderedDict
+from copy import copy
 from inspect import isclass
+from itertools import chain
 from hearthstone.enums import BlockType, CardType, CardClass, Mulligan, PlayState, Step, Zone
+from . import dirty, logging
 from .dsl import LazyNum, LazyValue, Selector
 from .entity import Entity
 from .logging import log
@@ -37,6 +41,19 @@ def _eval_card(source, card):
     return ret
 
 
+class _State(threading.local):
+    # The actions of the card scripts are shared by every game: what a
+    # trigger in progress keeps track of is kept per thread instead.
+    def __init__(self):
+        # {action: [(action, broadcast args)]} of the pending broadcasts
+        self.broadcasts = {}
+        # {targeted action: the index of the time it is triggering}
+        self.trigger_indexes = {}
+
+
+_state = _State()
+
+
 class EventListener:
     ON = 1
     AFTER = 2
@@ -51,6 +68,46 @@ class EventListener:
         return "<EventListener %r>" % (self.trigger)
 
 
+class ListenerIndex(dirty.Record):
+    """
+    The entities a broadcast goes through (the game entities, then the
+    hands), along with the (trigger class, timing) of their event listeners.
+    Outdated as soon as any entity attribute read to build it changes,
+    see BaseGame.listener_index.
+    """
+    def __init__(self, game, backoff=0, untracked=0):
+        super().__init__(backoff, untracked)
+        if self.reads is not None:
+            self.entities, self.split, self.listeners = self.run(game, self._build, game)
+            self._positions = {}
+
+    @staticmethod
+    def _build(game):
+        entities = list(game.entities)
+        split = len(entities)
+        entities += game.hands
+        listeners = []
+        for i, entity in enumerate(entities):
+            events = entity.events
+            if events:
+                listeners.append((i, {(type(event.trigger), event.at) for event in events}))
+        return entities, split, listeners
+
+    def positions(self, cls, at):
+        """
+        The positions in `entities` of the entities listening to \a cls
+        actions (or subclasses) at \a at
+        """
+        key = (cls, at)
+        ret = self._positions.get(key)
+        if ret is None:
+            ret = self._positions[key] = [
+                i for i, triggers in self.listeners
+                if any(t_at == at and issubclass(t, cls) for t, t_at in triggers)
+            ]
+        return ret
+
+
 class ActionMeta(type):
     def __new__(metacls, name, bases, namespace):
         cls = type.__new__(metacls, name, bases, dict(namespace))
@@ -98,12 +155,14 @@ class IntArg(ActionArg, LazyNum):
 
 
 class Action(metaclass=ActionMeta):
+    # The compiled arguments of the action as an event trigger, see matches()
+    _matchers = None
+
     def __init__(self, *args, **kwargs):
         self._args = args
         self._kwargs = kwargs
         self.callback = ()
         self.times = 1
-        self.event_queue = []
 
     def __repr__(self):
         args = ["%s=%r" % (k, v) for k, v in zip(self.ARGS, self._args)]
@@ -126,54 +185,95 @@ class Action(metaclass=ActionMeta):
         return ret
 
     def _broadcast(self, entity, source, at, *args):
+        """
+        Trigger the matching event listeners of \a entity.
+        Returns whether any did trigger.
+        """
+        ret = False
         for event in entity.events:
             if event.at != at:
                 continue
             if isinstance(event.trigger, self.__class__) and event.trigger.matches(entity, args):
-                log.info("%r triggers off %r from %r", entity, self, source)
+                if not logging.silent:
+                    log.info("%r triggers off %r from %r", entity, self, source)
                 entity.trigger_event(source, event, args)
+                ret = True
+        return ret
 
     def broadcast(self, source, at, *args):
-        for entity in source.game.entities:
-            self._broadcast(entity, source, at, *args)
+        index = source.game.listener_index
+        if index.reads is None:
+            for entity in source.game.entities:
+                self._broadcast(entity, source, at, *args)
+            for entity in source.game.hands:
+                self._broadcast(entity, source, at, *args)
+            return
 
-        for entity in source.game.hands:
-            self._broadcast(entity, source, at, *args)
+        entities = index.entities
+        for i in index.positions(self.__class__, at):
+            if self._broadcast(entities[i], source, at, *args) and index.stale:
+                # The triggered actions changed the listeners: go through
+                # the remaining entities without the index
+                if i < index.split:
+                    remaining = chain(entities[i + 1:index.split], source.game.hands)
+                else:
+                    remaining = entities[i + 1:]
+                for entity in remaining:
+                    self._broadcast(entity, source, at, *args)
+                return
 
     def queue_broadcast(self, obj, args):
-        self.event_queue.append((obj, args))
+        _state.broadcasts.setdefault(self, []).append((obj, args))
 
     def resolve_broadcasts(self):
-        for obj, args in self.event_queue:
-            obj.broadcast(*args)
-        self.event_queue = []
+        queue = _state.broadcasts.pop(self, None)
+        if queue:
+            for obj, args in queue:
+                obj.broadcast(*args)
 
     def get_args(self, source):
         return self._args
 
+    def compile_matchers(self):
+        """
+        Compile the arguments of the action, as an event trigger, into
+        func(arg, source) tests (see Selector.matcher()), None for the
+        arguments matching anything.
+        The card scripts are compiled when merged, see CardDB.merge_script().
+        """
+        matchers = []
+        for match in self._args:
+            if match is None:
+                matchers.append(None)
+            elif callable(match):
+                matchers.append(lambda arg, source, match=match: match(arg))
+            else:
+                matchers.append(match.matcher())
+        self._matchers = tuple(matchers)
+        return self._matchers
+
     def matches(self, source, args):
-        for arg, match in zip(args, self._args):
+        matchers = self._matchers
+        if matchers is None:
+            matchers = self.compile_matchers()
+        for arg, match in zip(args, matchers):
             if match is None:
                 # Allow matching Action(None, None, z) to Action(x, y, z)
                 continue
             if arg is None:
                 # We got an arg of None and a match not None. Bad.
                 return False
-            if callable(match):
-                res = match(arg)
-                if not res:
-                    return False
-            else:
-                # this stuff is stupidslow
-                res = match.eval([arg], source)
-                if not res or res[0] is not arg:
-                    return False
+            if not match(arg, source):
+                return False
         return True
 
 
 class GameAction(Action):
     def trigger(self, source):
         args = self.get_args(source)
+        trace = source.game.trace
+        if trace is not None:
+            trace.record(self, source, args[0] if args else None)
         self.do(source, *args)
 
 
@@ -189,7 +289,8 @@ class Attack(GameAction):
         return ret
 
     def do(self, source, attacker, defender):
-        log.info("%r attacks %r", attacker, defender)
+        if not logging.silent:
+            log.info("%r attacks %r", attacker, defender)
         attacker.attack_target = defender
         defender.defending = True
         source.game.proposed_attacker = attacker
@@ -232,7 +333,8 @@ class BeginTurn(GameAction):
     def do(self, source, player):
         source.manager.step(source.next_step, Step.MAIN_READY)
         source.turn += 1
-        source.log("%s begins turn %i", player, source.turn)
+        if not logging.silent:
+            source.log("%s begins turn %i", player, source.turn)
         source.current_player = player
         source.manager.step(source.next_step, Step.MAIN_START_TRIGGERS)
         source.manager.step(source.next_step, source.next_step)
@@ -277,7 +379,8 @@ class Death(GameAction):
     ENTITY = ActionArg()
 
     def do(self, source, target):
-        log.info("Processing Death for %r", target)
+        if not logging.silent:
+            log.info("Processing Death for %r", target)
         self.broadcast(source, EventListener.ON, target)
         if target.deathrattles:
             source.game.queue_actions(source, [Deathrattle(target)])
@@ -337,12 +440,13 @@ class GenericChoice(GameAction):
         return player, cards
 
     def do(self, source, player, cards):
-        player.choice = self
-        self.source = source
-        self.player = player
-        self.cards = cards
-        self.min_count = 1
-        self.max_count = 1
+        # The action may be shared by several games: the pending choice is a copy
+        choice = player.choice = copy(self)
+        choice.source = source
+        choice.player = player
+        choice.cards = cards
+        choice.min_count = 1
+        choice.max_count = 1
 
     def choose(self, card):
         if card not in self.cards:
@@ -414,7 +518,8 @@ class Play(GameAction):
 
     def do(self, source, card, target, index, choose):
         player = source
-        log.info("%s plays %r (target=%r, index=%r)", player, card, target, index)
+        if not logging.silent:
+            log.info("%s plays %r (target=%r, index=%r)", player, card, target, index)
 
         player.pay_cost(card, card.cost)
 
@@ -507,7 +612,10 @@ class TargetedAction(Action):
     def __init__(self, *args, **kwargs):
         self.source = kwargs.pop("source", None)
         super().__init__(*args, **kwargs)
-        self.trigger_index = 0
+
+    @property
+    def trigger_index(self):
+        return _state.trigger_indexes.get(self, 0)
 
     def __repr__(self):
         args = ["%s=%r" % (k, v) for k, v in zip(self.ARGS[1:], self._args[1:])]
@@ -564,20 +672,31 @@ class TargetedAction(Action):
         elif isinstance(times, Action):
             times = times.trigger(source)[0]
 
+        indexes = _state.trigger_indexes
+        previous = indexes.get(self)
+        trace = source.game.trace
         for i in range(times):
-            self.trigger_index = i
+            indexes[self] = i
             args = self.get_args(source)
             targets = self.get_targets(source, args[0])
             args = args[1:]
-            log.info("%r triggering %r targeting %r", source, self, targets)
+            if not logging.silent:
+                log.info("%r triggering %r targeting %r", source, self, targets)
             for target in targets:
                 target_args = self.get_target_args(source, target)
+                if trace is not None:
+                    trace.record(self, source, target, target_args[0] if target_args else 0)
                 ret.append(self.do(source, target, *target_args))
 
                 for action in self.callback:
-                    log.info("%r queues up callback %r", self, action)
+                    if not logging.silent:
+                        log.info("%r queues up callback %r", self, action)
                     ret += source.game.queue_actions(source, [action], event_args=[target] + target_args)
 
+        if previous is None:
+            indexes.pop(self, None)
+        else:
+            indexes[self] = previous
         self.resolve_broadcasts()
 
         return ret
@@ -632,6 +751,7 @@ class CopyDeathrattles(TargetedAction):
         for entity in entities:
             for deathrattle in entity.deathrattles:
                 target.additional_deathrattles.append(deathrattle)
+        dirty.touch(target, "additional_deathrattles")
 
 
 class Counter(TargetedAction):
@@ -718,10 +838,12 @@ class Battlecry(TargetedAction):
         player = card.controller
 
         if card.has_combo and player.combo:
-            log.info("Activating %r combo targeting %r", card, target)
+            if not logging.silent:
+                log.info("Activating %r combo targeting %r", card, target)
             actions = card.get_actions("combo")
         else:
-            log.info("Activating %r action targeting %r", card, target)
+            if not logging.silent:
+                log.info("Activating %r action targeting %r", card, target)
             actions = card.get_actions("play")
 
         source.target = target
@@ -779,7 +901,7 @@ class Discover(TargetedAction):
             discover_class = source.data.card_class
         else:
             # use random class for neutral hero classes with neutral cards
-            discover_class = random_class()
+            discover_class = random_class(source.game.random)
 
         picker = self._args[1] * 3
         picker = picker.copy_with_weighting(1, card_class=CardClass.NEUTRAL)
@@ -1118,7 +1240,8 @@ class Summon(TargetedAction):
         return super()._broadcast(entity, source, at, *args)
 
     def do(self, source, target, cards):
-        log.info("%s summons %r", target, cards)
+        if not logging.silent:
+            log.info("%s summons %r", target, cards)
         if not isinstance(cards, list):
             cards = [cards]
 
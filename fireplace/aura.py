@@ -1,3 +1,6 @@
+from itertools import chain
+from hearthstone.enums import CardType
+from . import dirty, logging
 from .logging import log
 from .managers import CardManager
 
@@ -12,13 +15,18 @@ class AuraBuff:
 		return "<AuraBuff %r -> %r>" % (self.source, self.entity)
 
 	def update_tags(self, tags):
+		old = self.__dict__.copy()
 		self.tags.update(tags)
+		if self.__dict__ != old:
+			dirty.touch(self.entity, "slots")
 		self.tick = self.source.game.tick
 
 	def remove(self):
-		log.info("Destroying %r", self)
+		if not logging.silent:
+			log.info("Destroying %r", self)
 		self.entity.slots.remove(self)
 		self.source.game.active_aura_buffs.remove(self)
+		dirty.touch(self.entity, "slots")
 
 	def _getattr(self, attr, i):
 		value = getattr(self, attr, 0)
@@ -60,21 +68,76 @@ class TargetableByAuras:
 		for buff in self.buffs:
 			if buff.source is source and buff.id == id:
 				buff.tick = source.game.tick
+				dirty.refreshed(buff)
 				break
 		else:
-			log.info("Aura from %r buffs %r with %r", source, self, id)
+			if not logging.silent:
+				log.info("Aura from %r buffs %r with %r", source, self, id)
 			buff = source.buff(self, id)
 			buff.tick = source.game.tick
 			source.game.active_aura_buffs.append(buff)
+			dirty.refreshed(buff)
 
 	def refresh_tags(self, source, tags):
 		for slot in self.slots:
 			if slot.source is source:
 				slot.update_tags(tags)
+				dirty.refreshed(slot)
 				break
 		else:
 			buff = AuraBuff(source, self)
-			log.info("Creating %r", buff)
+			if not logging.silent:
+				log.info("Creating %r", buff)
 			buff.update_tags(tags)
 			self.slots.append(buff)
 			source.game.active_aura_buffs.append(buff)
+			dirty.touch(self, "slots")
+			dirty.refreshed(buff)
+
+
+class AuraRecord(dirty.Record):
+	"""
+	The entity attributes an aura read and the buffs it refreshed,
+	the last time it was evaluated
+	"""
+	def __init__(self, backoff=0, untracked=0):
+		super().__init__(backoff, untracked)
+		self.buffs = []
+
+
+def refresh_aura(entity, action):
+	"""
+	Trigger the aura script \a action of \a entity, unless none of the
+	attributes it read last time has been written since. In that case, the
+	buffs it refreshed last time are kept alive instead.
+	"""
+	record = entity._auras.get(action)
+	if record is None:
+		record = AuraRecord()
+	elif not record.stale:
+		record.hits += 1
+		tick = entity.game.tick
+		for buff in record.buffs:
+			buff.tick = tick
+		return
+	else:
+		record = AuraRecord(*record.next_backoff())
+	entity._auras[action] = record
+	record.run(entity.game, action.trigger, entity)
+
+
+def aura_state(game):
+	"""
+	The buffs and aura slots of every entity in \a game, by entity uuid
+	(the buffs themselves are new entities in each game).
+	Used to compare the outcome of two aura refreshes.
+	"""
+	ret = {}
+	for entity in chain(game.players, game):
+		if entity.type == CardType.ENCHANTMENT:
+			continue
+		ret[entity.uuid] = (
+			[(buff.id, getattr(getattr(buff, "source", None), "uuid", None)) for buff in getattr(entity, "buffs", ())],
+			[(slot.source.uuid, dict(slot.tags.items())) for slot in entity.slots],
+		)
+	return ret
@@ -1,6 +1,6 @@
 from itertools import chain
 from hearthstone.enums import CardType, PlayReq, PlayState, Race, Rarity, Step, Zone
-from . import actions, cards, rules
+from . import actions, cards, dirty, logging, rules
 from .aura import TargetableByAuras
 from .entity import BaseEntity, Entity, boolean_property, int_property, slot_property
 from .managers import CardManager
@@ -82,16 +82,20 @@ class BaseCard(BaseEntity):
             self.logger.debug("%r moves from %r to %r", self, old, value)
 
         caches = {
-            Zone.HAND: self.controller.hand,
-            Zone.DECK: self.controller.deck,
-            Zone.DISCARD: self.controller.discarded,
-            Zone.GRAVEYARD: self.controller.graveyard,
-            Zone.SETASIDE: self.game.setaside,
+            Zone.HAND: (self.controller, "hand"),
+            Zone.DECK: (self.controller, "deck"),
+            Zone.DISCARD: (self.controller, "discarded"),
+            Zone.GRAVEYARD: (self.controller, "graveyard"),
+            Zone.SETASIDE: (self.game, "setaside"),
         }
         if caches.get(old) is not None:
-            caches[old].remove(self)
+            owner, attr = caches[old]
+            getattr(owner, attr).remove(self)
+            dirty.touch(owner, attr)
         if caches.get(value) is not None:
-            caches[value].append(self)
+            owner, attr = caches[value]
+            getattr(owner, attr).append(self)
+            dirty.touch(owner, attr)
         self._zone = value
 
         if value == Zone.PLAY:
@@ -208,6 +212,7 @@ class PlayableCard(BaseCard, Entity, TargetableByAuras):
             for id in self.data.choose_cards:
                 card = self.controller.card(id, source=self, parent=self)
                 self.choose_cards.append(card)
+            dirty.touch(self, "choose_cards")
 
     def destroy(self):
         return self.game.cheat_action(self, [actions.Destroy(self), actions.Deaths()])
@@ -221,7 +226,8 @@ class PlayableCard(BaseCard, Entity, TargetableByAuras):
             self.log("%s overdraws and loses %r!", self.controller, self)
             self.discard()
         else:
-            self.log("%s draws %r", self.controller, self)
+            if not logging.silent:
+                self.log("%s draws %r", self.controller, self)
             self.zone = Zone.HAND
             self.controller.cards_drawn_this_turn += 1
 
@@ -420,7 +426,9 @@ class LiveEntity(PlayableCard, Entity):
 
     @property
     def killed_this_turn(self):
-        return self.turn_killed == self.game.turn
+        # The turn is not read for the characters never killed: it is not
+        # an input of their tags (see managers.TagChanges)
+        return self.turn_killed != -1 and self.turn_killed == self.game.turn
 
     def _hit(self, amount):
         self.damage += amount
@@ -660,12 +668,15 @@ class Minion(Character):
                 self.controller.field.insert(self._summon_index, self)
             else:
                 self.controller.field.append(self)
+            dirty.touch(self.controller, "field")
         elif value == Zone.GRAVEYARD:
             self.controller.minions_killed_this_turn += 1
 
         if self.zone == Zone.PLAY:
-            self.log("%r is removed from the field", self)
+            if not logging.silent:
+                self.log("%r is removed from the field", self)
             self.controller.field.remove(self)
+            dirty.touch(self.controller, "field")
             if self.damage:
                 self.damage = 0
 
@@ -737,8 +748,10 @@ class Secret(Spell):
             value = Zone.SECRET
         if self.zone == Zone.SECRET:
             self.controller.secrets.remove(self)
+            dirty.touch(self.controller, "secrets")
         if value == Zone.SECRET:
             self.controller.secrets.append(self)
+            dirty.touch(self.controller, "secrets")
         super()._set_zone(value)
 
     def is_summonable(self):
@@ -776,6 +789,19 @@ class Enchantment(BaseCard):
             raise NotImplementedError("Missing deathrattle script for %r" % (self))
         return ret
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # The derived stats of the owner fold the attributes of its buffs
+        if name not in dirty.IGNORED and getattr(self, "_zone", None) == Zone.PLAY:
+            dirty.touch(self.owner, "buffs")
+
+    def _cached_stat(self, attr):
+        # Enchantment stats are only read through the stats of their owner
+        return None
+
+    def _scripted_stat(self, attr, own_scripts=True):
+        return True
+
     def _getattr(self, attr, i):
         i += getattr(self, "_" + attr, 0)
         return getattr(self.data.scripts, attr, lambda s, x: x)(self, i)
@@ -783,18 +809,21 @@ class Enchantment(BaseCard):
     def _set_zone(self, zone):
         if zone == Zone.PLAY:
             self.owner.buffs.append(self)
+            dirty.touch(self.owner, "buffs")
         elif zone == Zone.REMOVEDFROMGAME:
             if self.zone == zone:
                 # Can happen if a Destroy is queued after a bounce, for example
                 self.logger.warning("Trying to remove %r which is already gone", self)
                 return
             self.owner.buffs.remove(self)
+            dirty.touch(self.owner, "buffs")
             if self in self.game.active_aura_buffs:
                 self.game.active_aura_buffs.remove(self)
         super()._set_zone(zone)
 
     def apply(self, target):
-        self.log("Applying %r to %r", self, target)
+        if not logging.silent:
+            self.log("Applying %r to %r", self, target)
         self.owner = target
         if hasattr(self.data.scripts, "apply"):
             self.data.scripts.apply(self, target)
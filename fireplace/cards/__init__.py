@@ -1,15 +1,72 @@
 import os
-from pkg_resources import resource_filename
+import pickle
+import threading
 from hearthstone import cardxml
 from hearthstone.enums import CardType
 from ..logging import log
 from ..rules import POISONOUS
-from ..utils import get_script_definition
+from ..utils import CARD_SETS, get_script_definition, get_script_definitions
+
+
+# The prebuilt card index, see CardDB.build_index()
+INDEX_PATH = os.path.join(os.path.dirname(__file__), "cardindex.pickle")
+INDEX_VERSION = 2
+
+# The card attributes filter() looks up in an inverted index
+INDEXED_ATTRS = ("type", "cost", "race", "rarity", "card_class", "collectible")
+
+# Serializes the lazy script merges of LazyCardXML, so that a card is merged once
+_merge_lock = threading.Lock()
+
+
+def _index_sources():
+    """
+    The {path: (size, mtime)} of the files the card index is built from:
+    the card XML and the card scripts
+    """
+    # cardxml.get_default_carddefs_path(), without importing pkg_resources
+    paths = [os.path.join(os.path.dirname(cardxml.__file__), "CardDefs.xml")]
+    for root, dirs, files in os.walk(os.path.dirname(__file__)):
+        paths += [os.path.join(root, f) for f in files if f.endswith(".py")]
+    ret = {}
+    for path in paths:
+        stat = os.stat(path)
+        ret[os.path.abspath(path)] = (stat.st_size, stat.st_mtime_ns)
+    return ret
+
+
+class LazyCardXML(cardxml.CardXML):
+    """
+    A card of the card index, whose script is only looked up and merged
+    (see CardDB.merge()) the first time it is needed, when a card is
+    instantiated from it. Only the card set modules in \a cardsets are
+    looked into, and imported.
+    """
+    def __getattr__(self, name):
+        # Only called for missing attributes: the ones the merge sets
+        if name not in ("scripts", "choose_cards"):
+            raise AttributeError(name)
+        with _merge_lock:
+            # Merged by another thread while waiting for the lock
+            if "scripts" not in self.__dict__:
+                CardDB.merge_script(self, get_script_definition(self.id, self.cardsets))
+        return getattr(self, name)
 
 
 class CardDB(dict):
     def __init__(self):
         self.initialized = False
+        # The cards in order, {attr: {value: [position]}} for the
+        # INDEXED_ATTRS, and the {filters: (id, ...)} results of pool()
+        self._cards = None
+        self._indexes = {}
+        self._pools = {}
+
+    def __setitem__(self, id, card):
+        super().__setitem__(id, card)
+        self._cards = None
+        self._indexes.clear()
+        self._pools.clear()
 
     @staticmethod
     def merge(id, card, cardscript=None):
@@ -23,10 +80,22 @@ class CardDB(dict):
         if cardscript is None:
             cardscript = get_script_definition(id)
 
+        return CardDB.merge_script(card, cardscript)
+
+    @staticmethod
+    def merge_script(card, cardscript):
+        """
+        Merge the card definition \a cardscript (None if the card has no
+        script) into the xmlcard \a card, and return it
+        """
+        # The script class is only made visible, along with the choose one
+        # cards, once complete: another thread may instantiate the card
+        # while a lazy merge (see LazyCardXML) is in progress
+        id = card.id
         if cardscript:
-            card.scripts = type(id, (cardscript,), {})
+            scripts = type(id, (cardscript,), {})
         else:
-            card.scripts = type(id, (), {})
+            scripts = type(id, (), {})
 
         scriptnames = (
             "activate", "combo", "deathrattle", "draw", "inspire", "play",
@@ -34,45 +103,49 @@ class CardDB(dict):
         )
 
         for script in scriptnames:
-            actions = getattr(card.scripts, script, None)
+            actions = getattr(scripts, script, None)
             if actions is None:
                 # Set the action by default to avoid runtime hasattr() calls
-                setattr(card.scripts, script, [])
+                setattr(scripts, script, [])
             elif not callable(actions):
                 if not hasattr(actions, "__iter__"):
                     # Ensure the actions are always iterable
-                    setattr(card.scripts, script, (actions,))
+                    setattr(scripts, script, (actions,))
 
         for script in ("events", "secret"):
-            events = getattr(card.scripts, script, None)
+            events = getattr(scripts, script, None)
             if events is None:
-                setattr(card.scripts, script, [])
+                setattr(scripts, script, [])
             elif not hasattr(events, "__iter__"):
-                setattr(card.scripts, script, [events])
+                setattr(scripts, script, [events])
+
+        if not hasattr(scripts, "cost_mod"):
+            scripts.cost_mod = None
 
-        if not hasattr(card.scripts, "cost_mod"):
-            card.scripts.cost_mod = None
+        if not hasattr(scripts, "Hand"):
+            scripts.Hand = type("Hand", (), {})
 
-        if not hasattr(card.scripts, "Hand"):
-            card.scripts.Hand = type("Hand", (), {})
+        if not hasattr(scripts.Hand, "events"):
+            scripts.Hand.events = []
 
-        if not hasattr(card.scripts.Hand, "events"):
-            card.scripts.Hand.events = []
+        if not hasattr(scripts.Hand.events, "__iter__"):
+            scripts.Hand.events = [scripts.Hand.events]
 
-        if not hasattr(card.scripts.Hand.events, "__iter__"):
-            card.scripts.Hand.events = [card.scripts.Hand.events]
+        if not hasattr(scripts.Hand, "update"):
+            scripts.Hand.update = ()
 
-        if not hasattr(card.scripts.Hand, "update"):
-            card.scripts.Hand.update = ()
+        if not hasattr(scripts.Hand.update, "__iter__"):
+            scripts.Hand.update = (scripts.Hand.update,)
 
-        if not hasattr(card.scripts.Hand.update, "__iter__"):
-            card.scripts.Hand.update = (card.scripts.Hand.update,)
+        for events in (scripts.events, scripts.secret, scripts.Hand.events):
+            for event in events:
+                event.trigger.compile_matchers()
 
         # Set choose one cards
         if hasattr(cardscript, "choose"):
-            card.choose_cards = cardscript.choose[:]
+            choose_cards = cardscript.choose[:]
         else:
-            card.choose_cards = []
+            choose_cards = []
 
         if hasattr(cardscript, "tags"):
             for tag, value in cardscript.tags.items():
@@ -80,18 +153,92 @@ class CardDB(dict):
 
         # Set some additional events based on the base tags...
         if card.poisonous:
-            card.scripts.events.append(POISONOUS)
+            scripts.events.append(POISONOUS)
 
+        card.choose_cards = choose_cards
+        card.scripts = scripts
         return card
 
-    def initialize(self):
+    @staticmethod
+    def build_index(path=INDEX_PATH):
+        """
+        Parse the card XML and save it to the card index at \a path, along
+        with the card set module of each card script.
+        initialize() loads the index instead of the XML as long as the XML
+        and the card scripts are unchanged.
+        """
+        cards, xml = cardxml.load()
+        for card in cards.values():
+            # Only the locale in use is kept
+            card.strings = {
+                tag: {card.locale: value[card.locale]} if isinstance(value, dict) and card.locale in value else value
+                for tag, value in card.strings.items()
+            }
+        sets = {}
+        custom_sets = []
+        for cardset in CARD_SETS:
+            definitions = get_script_definitions(cardset)
+            for id, card in cards.items():
+                if id in definitions and id not in sets:
+                    sets[id] = cardset
+                    # The merged tags, for filter() before the scripts are merged
+                    card.tags.update(getattr(definitions[id], "tags", {}))
+            # Importing the set registers its custom cards (see custom_card())
+            if any(id in db and id not in cards for id in definitions):
+                custom_sets.append(cardset)
+
+        index = {
+            "version": INDEX_VERSION,
+            "sources": _index_sources(),
+            "cards": cards,
+            "sets": sets,
+            "custom_sets": custom_sets,
+        }
+        with open(path, "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        log.info("Saved %i cards to %r", len(cards), path)
+
+    @staticmethod
+    def load_index(path=INDEX_PATH):
+        """
+        Load the card index at \a path, or return None if it is missing
+        or outdated
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            log.warning("Ignoring the card index %r: %s", path, e)
+            return None
+        if index.get("version") != INDEX_VERSION or index.get("sources") != _index_sources():
+            log.info("Ignoring the outdated card index %r", path)
+            return None
+        return index
+
+    def initialize(self, index_path=INDEX_PATH):
         log.info("Initializing card database")
         self.initialized = True
-        db, xml = cardxml.load()
-        for id, card in db.items():
-            self[id] = self.merge(id, card)
+        index = self.load_index(index_path)
+        if index is None:
+            db, xml = cardxml.load()
+            for id, card in db.items():
+                self[id] = self.merge(id, card)
+            log.info("Merged %i cards", len(self))
+            return
 
-        log.info("Merged %i cards", len(self))
+        # With the index, the card scripts are merged lazily, only
+        # importing the card set modules of the cards in use
+        sets = index["sets"]
+        for cardset in index["custom_sets"]:
+            get_script_definitions(cardset)
+        for id, card in index["cards"].items():
+            card.__class__ = LazyCardXML
+            card.cardsets = (sets[id], ) if id in sets else ()
+            self[id] = card
+
+        log.info("Loaded %i cards", len(self))
 
     def filter(self, **kwargs):
         """
@@ -105,24 +252,78 @@ class CardDB(dict):
         \a rarity: The rarity of the card (hearthstone.enums.Rarity)
         \a cost: The mana cost of the card
         """
+        return list(self.pool(**kwargs))
+
+    def pool(self, **kwargs):
+        """
+        Returns the tuple of the card IDs matching the given filters (see
+        filter()). The result is cached, and shared by the callers.
+        """
         if not self.initialized:
             self.initialize()
 
-        cards = self.values()
-
         if "type" not in kwargs:
             kwargs["type"] = [CardType.SPELL, CardType.WEAPON, CardType.MINION]
 
-        for attr, value in kwargs.items():
-            if value is not None:
-                # What? this doesn't work?
-                # cards = __builtins__["filter"](lambda c: getattr(c, attr) == value, cards)
-                cards = [
-                    card for card in cards if (isinstance(value, list) and getattr(card, attr) in value) or
-                    getattr(card, attr) == value
-                    ]
+        filters = {attr: value for attr, value in kwargs.items() if value is not None}
+        key = tuple(sorted(
+            (attr, isinstance(value, list), tuple(value) if isinstance(value, list) else value)
+            for attr, value in filters.items()
+        ))
+        try:
+            ids = self._pools.get(key)
+        except TypeError:
+            # unhashable filter values are not memoized
+            key = None
+            ids = None
+        if ids is None:
+            ids = self._filter(filters)
+            if key is not None:
+                self._pools[key] = ids
+        return ids
+
+    def _index(self, attr):
+        """
+        The {value: [position]} inverted index of the card attribute \a attr
+        """
+        index = self._indexes.get(attr)
+        if index is None:
+            if self._cards is None:
+                self._cards = list(self.values())
+            index = self._indexes[attr] = {}
+            for i, card in enumerate(self._cards):
+                index.setdefault(getattr(card, attr), []).append(i)
+        return index
+
+    def _filter(self, filters):
+        positions = None
+        for attr in INDEXED_ATTRS:
+            if attr not in filters:
+                continue
+            value = filters.pop(attr)
+            index = self._index(attr)
+            if isinstance(value, list):
+                matched = set()
+                for v in value:
+                    matched.update(index.get(v, ()))
+            else:
+                matched = index.get(value, ())
+            positions = set(matched) if positions is None else positions.intersection(matched)
+
+        if positions is None:
+            cards = self.values()
+        else:
+            cards = [self._cards[i] for i in sorted(positions)]
+
+        for attr, value in filters.items():
+            # What? this doesn't work?
+            # cards = __builtins__["filter"](lambda c: getattr(c, attr) == value, cards)
+            cards = [
+                card for card in cards if (isinstance(value, list) and getattr(card, attr) in value) or
+                getattr(card, attr) == value
+                ]
 
-        return [card.id for card in cards]
+        return tuple(card.id for card in cards)
 
 
 # Here we import every card from every set and load the cardxml database.
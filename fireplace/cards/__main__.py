@@ -0,0 +1,19 @@
+"""
+Build the prebuilt card index, which CardDB.initialize() loads instead of
+parsing the card XML:
+
+    python -m fireplace.cards [path]
+
+The index is ignored once the card XML or a card script changes: run
+this again after updating them.
+"""
+import sys
+from . import INDEX_PATH, CardDB
+
+
+def main(argv):
+	CardDB.build_index(argv[1] if len(argv) > 1 else INDEX_PATH)
+
+
+if __name__ == "__main__":
+	main(sys.argv)
@@ -8,7 +8,7 @@ class CS2_049:
 	"Totemic Call"
 	def activate(self):
 		totems = [t for t in self.entourage if not self.controller.field.contains(t)]
-		yield Summon(CONTROLLER, random.choice(totems))
+		yield Summon(CONTROLLER, self.game.random.choice(totems))
 
 class CS2_049_H1:
 	"Totemic Call (Morgl the Oracle)"
@@ -39,7 +39,7 @@ class GVG_107:
 	"Enhance-o Mechano"
 	def play(self):
 		for target in self.controller.field.exclude(self):
-			tag = random.choice((GameTag.WINDFURY, GameTag.TAUNT, GameTag.DIVINE_SHIELD))
+			tag = self.game.random.choice((GameTag.WINDFURY, GameTag.TAUNT, GameTag.DIVINE_SHIELD))
 			yield SetTag(target, (tag, ))
 
 
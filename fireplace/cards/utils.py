@@ -75,6 +75,12 @@ def SET(amt):
 
 
 # Buff helper
+# {name: (position, tag)} of the GameTags, for the keyword arguments of buff()
+_BUFF_TAG_NAMES = {}
+for _position, _tag in enumerate(GameTag):
+	_BUFF_TAG_NAMES.setdefault(_tag.name.lower(), (_position, _tag))
+
+
 def buff(atk=0, health=0, **kwargs):
 	buff_tags = {}
 	if atk:
@@ -82,9 +88,9 @@ def buff(atk=0, health=0, **kwargs):
 	if health:
 		buff_tags[GameTag.HEALTH] = health
 
-	for tag in GameTag:
-		if tag.name.lower() in kwargs.copy():
-			buff_tags[tag] = kwargs.pop(tag.name.lower())
+	# in GameTag order
+	for position, tag in sorted(_BUFF_TAG_NAMES[name] for name in kwargs if name in _BUFF_TAG_NAMES):
+		buff_tags[tag] = kwargs.pop(tag.name.lower())
 
 	if "immune" in kwargs:
 		value = kwargs.pop("immune")
@@ -0,0 +1,158 @@
+"""
+Fast copies of live games, see BaseGame.clone().
+
+copy.deepcopy() walks everything reachable from a game, including the card
+definitions and the card scripts (selectors, lazy values, event listeners...),
+and goes through the generic reduce protocol for every object.
+The cloner only copies the mutable game state and shares everything a game
+never mutates, dispatching on the exact type of every value.
+"""
+import random
+import types
+import uuid
+from copy import deepcopy
+from enum import Enum
+from hearthstone.cardxml import CardXML
+from .actions import EventListener
+from .aura import Refresh
+from .dsl.evaluator import Evaluator
+from .dsl.lazynum import LazyValue
+from .dsl.selector import Selector, SelectorEntityValue
+from .dsl.switch import Switch
+from .logging import log
+from .utils import IndexedCardList
+
+
+# Values of these types are shared between a game and its clones:
+# immutable values, card definitions and card scripts
+SHARED_TYPES = (
+    type(None), bool, int, float, complex, str, bytes, range, Enum, uuid.UUID,
+    type, types.FunctionType, types.BuiltinFunctionType, type(log),
+    CardXML, EventListener, Refresh, Evaluator, LazyValue, Selector, SelectorEntityValue, Switch,
+)
+
+
+class Cloner:
+    """
+    Memoized copier of game state: every object reachable from the cloned
+    game is copied exactly once, so references between entities, buffs,
+    auras and actions are remapped to the copies.
+    """
+    def __init__(self, memo=None):
+        self.memo = {} if memo is None else memo
+
+    def clone(self, value):
+        cls = type(value)
+        handler = _handlers.get(cls)
+        if handler is None:
+            handler = _handlers[cls] = _find_handler(cls)
+        return handler(self, value)
+
+
+def _share(cloner, value):
+    return value
+
+
+def _clone_tuple(cloner, value):
+    clone = cloner.clone
+    return tuple([clone(item) for item in value])
+
+
+def _clone_list(cloner, value):
+    ret = cloner.memo.get(id(value))
+    if ret is None:
+        ret = cloner.memo[id(value)] = value.__class__.__new__(value.__class__)
+        if value:
+            handlers = _handlers
+            list.extend(ret, [item if handlers.get(type(item)) is _share else cloner.clone(item) for item in value])
+        # attributes of list subclasses, such as Deck.hero
+        attrs = getattr(value, "__dict__", None)
+        if attrs:
+            ret.__dict__.update(_clone_dict(cloner, attrs))
+    return ret
+
+
+def _clone_indexed_list(cloner, value):
+    ret = _clone_list(cloner, value)
+    # the position map is keyed by the identity of the original cards
+    ret._positions = None
+    return ret
+
+
+def _clone_dict(cloner, value):
+    ret = cloner.memo.get(id(value))
+    if ret is None:
+        ret = cloner.memo[id(value)] = value.__class__()
+        clone = cloner.clone
+        for k, v in value.items():
+            ret[clone(k)] = clone(v)
+    return ret
+
+
+def _clone_set(cloner, value):
+    ret = cloner.memo.get(id(value))
+    if ret is None:
+        clone = cloner.clone
+        ret = cloner.memo[id(value)] = value.__class__([clone(item) for item in value])
+    return ret
+
+
+def _clone_method(cloner, value):
+    return types.MethodType(value.__func__, cloner.clone(value.__self__))
+
+
+def _clone_object(cloner, value):
+    ret = cloner.memo.get(id(value))
+    if ret is None:
+        ret = cloner.memo[id(value)] = value.__class__.__new__(value.__class__)
+        # most attributes are ints, enums, strings... which are shared: copy the
+        # dict as a whole and only replace the other values.
+        # The dict is filled in place: assigning __dict__ would go through
+        # the __setattr__ of the class, which entities override
+        d = ret.__dict__
+        d.update(value.__dict__)
+        handlers = _handlers
+        for k, v in d.items():
+            if handlers.get(type(v)) is not _share:
+                d[k] = cloner.clone(v)
+    return ret
+
+
+def _clone_random(cloner, value):
+    # the state of the generator is not in its __dict__
+    ret = cloner.memo.get(id(value))
+    if ret is None:
+        ret = cloner.memo[id(value)] = value.__class__.__new__(value.__class__)
+        ret.setstate(value.getstate())
+    return ret
+
+
+def _deepcopy(cloner, value):
+    return deepcopy(value, cloner.memo)
+
+
+def _find_handler(cls):
+    if issubclass(cls, SHARED_TYPES):
+        return _share
+    if issubclass(cls, tuple) and not hasattr(cls, "_fields"):
+        return _clone_tuple
+    if issubclass(cls, IndexedCardList):
+        return _clone_indexed_list
+    if issubclass(cls, list):
+        return _clone_list
+    if issubclass(cls, dict):
+        return _clone_dict
+    if issubclass(cls, (set, frozenset)):
+        return _clone_set
+    if cls is types.MethodType:
+        return _clone_method
+    if issubclass(cls, random.Random):
+        return _clone_random
+    if cls.__dictoffset__ and not hasattr(cls, "__slots__") and cls.__reduce_ex__ is object.__reduce_ex__ and \
+            cls.__reduce__ is object.__reduce__ and not hasattr(cls, "__deepcopy__"):
+        return _clone_object
+    # anything else (namedtuples, slotted or custom-pickled objects...) is deep copied
+    return _deepcopy
+
+
+_handlers = {}
@@ -1,7 +1,7 @@
-from .utils import CardList
+from .utils import IndexedCardList
 
 
-class Deck(CardList):
+class Deck(IndexedCardList):
     MAX_CARDS = 30
     MAX_UNIQUE_CARDS = 2
     MAX_UNIQUE_LEGENDARIES = 1
@@ -0,0 +1,209 @@
+"""
+Dirty tracking of entity attributes, for the incremental aura refresh (see
+BaseGame.refresh_auras()), the event listener index (see ListenerIndex), the
+views of the zones of both players (see BaseGame.board) and the tag changes
+sent to observers (see managers.TagChanges).
+
+Every attribute write on an entity stamps the attribute with a new version,
+in the `_versions` dict of the entity, as well as the entity itself. While a
+Record runs a computation on a game, the attributes it reads on the entities
+of that game are recorded: as long as none of them has been written since,
+the computation would give the same result. For an aura, it means its
+evaluation can be skipped.
+
+The reads are recorded per entity, by switching the class of the entities of
+the game to a subclass recording them while the Record runs: a
+__getattribute__ checking a flag instead would slow down every attribute
+read of every entity, recorded or not (by about 50% on simulated games).
+The Record being run is kept per thread: games run in separate threads do
+not see each other's Records. The versions all come from one clock, whose
+next() is atomic.
+
+The lists held by entities (zones, buffs, aura slots, events...) change
+without any attribute write: the code mutating them touches them explicitly.
+"""
+import threading
+from itertools import chain, count
+
+
+# Never an input of an aura, even if read while it is evaluated
+IGNORED = frozenset(("tick", "_auras", "_versions", "_changes", "_tracked"))
+
+# Key of the version of the last write in the `_versions` of an entity
+LAST = None
+
+clock = count(1)
+
+
+class _State(threading.local):
+	# The Record being run by the thread, if any
+	record = None
+	# {(id(entity), name): entity} of the reads of the Record being run
+	reads = None
+
+
+_state = _State()
+
+# {entity class: its subclass recording the attribute reads}
+_tracking_classes = {}
+
+
+def touch(entity, name):
+	"""
+	Mark the attribute \a name of \a entity as changed
+	"""
+	versions = entity._versions
+	versions[name] = versions[LAST] = next(clock)
+	changes = entity._changes
+	if changes is not None:
+		changes[entity.entity_id] = entity
+
+
+def written_since(version, entity, names):
+	"""
+	True if any of the attributes \a names of \a entity was written after \a version
+	"""
+	versions = entity._versions
+	if versions[LAST] > version:
+		for name in names:
+			if versions.get(name, 0) > version:
+				return True
+	return False
+
+
+def refreshed(buff):
+	"""
+	Register \a buff as refreshed by the aura being evaluated
+	"""
+	record = _state.record
+	if record is not None:
+		record.buffs.append(buff)
+
+
+# Longest run of unrecorded computations, for a result which keeps being outdated
+MAX_BACKOFF = 16
+# A recorded computation costs several plain ones: recording only pays off
+# once its result was reused this many times
+MIN_HITS = 4
+
+
+class Record:
+	"""
+	The entity attributes read by a computation, to tell when its result
+	is outdated.
+	Recording the reads slows the computation down: when the result of a
+	recorded computation is outdated before it was reused `MIN_HITS` times,
+	the next `backoff` computations are not recorded (`untracked` is the
+	count left), doubling each time this happens.
+	"""
+	def __init__(self, backoff=0, untracked=0):
+		self.version = next(clock)
+		# [(entity, names)], or None if the reads are not recorded
+		self.reads = None if untracked else []
+		self.hits = 0
+		self.backoff = backoff
+		self.untracked = untracked
+
+	def next_backoff(self):
+		"""
+		The (backoff, untracked) arguments of the Record replacing this
+		outdated one
+		"""
+		if self.reads is None:
+			return self.backoff, self.untracked - 1
+		if self.hits >= MIN_HITS:
+			return 0, 0
+		backoff = min(self.backoff * 2 or 1, MAX_BACKOFF)
+		return backoff, backoff
+
+	@property
+	def stale(self):
+		if self.reads is None:
+			return True
+		version = self.version
+		for entity, names in self.reads:
+			versions = entity._versions
+			if versions[LAST] > version:
+				for name in names:
+					if versions.get(name, 0) > version:
+						return True
+		return False
+
+	def run(self, game, func, *args):
+		"""
+		Return func(*args), recording the attributes it reads on the entities
+		of \a game
+		"""
+		state = _state
+		outer = state.record
+		if self.reads is None:
+			if outer is None:
+				return func(*args)
+			# nested in another recorded computation, whose reads include ours
+			self.reads = []
+
+		outer_reads = state.reads
+		state.record = self
+		state.reads = reads = {}
+		# the players are only registered as entities once the game starts.
+		# The registry also gets the entities created while running.
+		players, registry = game.players, game.manager.entities
+		try:
+			if outer is None:
+				for entity in chain(players, registry):
+					track(entity)
+			return func(*args)
+		finally:
+			try:
+				if outer is None:
+					# every entity gets its class back, whatever interrupted the
+					# run (untrack() skips the entities which were not tracked)
+					for entity in chain(players, registry):
+						untrack(entity)
+				else:
+					outer_reads.update(reads)
+			finally:
+				state.record = outer
+				state.reads = outer_reads
+			entities = {}
+			for (key, name), entity in reads.items():
+				if name not in IGNORED:
+					if key not in entities:
+						entities[key] = (entity, set())
+					entities[key][1].add(name)
+			self.reads = list(entities.values())
+
+
+def tracking_getattribute(self, name, getattribute=object.__getattribute__):
+	# The __getattribute__ of the classes entities are switched to while a
+	# Record runs on their game (see track()).
+	# The read is recorded before the lookup: a missing attribute read with
+	# getattr(entity, name, default) is an input as well.
+	# Entities compare equal by card id, so reads are keyed by identity.
+	_state.reads[id(self), name] = self
+	return getattribute(self, name)
+
+
+def track(entity):
+	"""
+	Record the attribute reads of \a entity in the Record run by the current
+	thread, until untrack()
+	"""
+	cls = type(entity)
+	if not cls._tracked:
+		tracking = _tracking_classes.get(cls)
+		if tracking is None:
+			tracking = _tracking_classes[cls] = type(cls.__name__, (cls, ), {
+				"__getattribute__": tracking_getattribute,
+				"__module__": cls.__module__,
+				"__qualname__": cls.__qualname__,
+				"_tracked": True,
+			})
+		# entities override __setattr__, which would stamp the class switch
+		object.__setattr__(entity, "__class__", tracking)
+
+
+def untrack(entity):
+	cls = type(entity)
+	if cls._tracked:
+		object.__setattr__(entity, "__class__", cls.__base__)
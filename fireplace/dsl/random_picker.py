@@ -51,6 +51,12 @@ class RandomCardPicker(LazyValue):
 		"""
 		Generate a card pool with all cards matching specified filters
 		"""
+		return list(self.find_pool(source, **filters))
+
+	def find_pool(self, source=None, **filters):
+		"""
+		The cached, read-only card pool matching the specified filters
+		"""
 		if not filters:
 			new_filters = self.filters.copy()
 		else:
@@ -61,7 +67,7 @@ class RandomCardPicker(LazyValue):
 				new_filters[k] = v.evaluate(source)
 
 		from .. import cards
-		return cards.filter(**new_filters)
+		return cards.db.pool(**new_filters)
 
 	def evaluate(self, source, cards=None) -> str:
 		"""
@@ -72,20 +78,21 @@ class RandomCardPicker(LazyValue):
 
 		if cards:
 			# Use specific card list if given
-			self.weights = [1]
-			card_sets = [list(cards)]
+			weights = [1]
+			card_sets = [cards]
 		elif not self.weightedfilters:
 			# Use global filters if no weighted filter sets given
-			self.weights = [1]
-			card_sets = [self.find_cards(source)]
+			weights = [1]
+			card_sets = [self.find_pool(source)]
 		else:
 			# Otherwise find cards for each set of filters
 			# add the global filters to each set of filters
+			weights = self.weights
 			wf = [{ **x, **self.filters } for x in self.weightedfilters]
-			card_sets = [self.find_cards(source, **x) for x in wf]
+			card_sets = [self.find_pool(source, **x) for x in wf]
 
 		# get weighted sample of card pools
-		return weighted_card_choice(source, self.weights, card_sets, self.count)
+		return weighted_card_choice(source, weights, card_sets, self.count)
 
 
 RandomCard = lambda **kw: RandomCardPicker(**kw)
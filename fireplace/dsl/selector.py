@@ -1,7 +1,7 @@
 import operator
-import random
 from abc import ABCMeta, abstractmethod
 from enum import IntEnum
+from itertools import chain
 from hearthstone.enums import CardType, GameTag, Race, Rarity, Zone, CardClass
 from typing import Any, Union, List, Callable, Iterable, Optional, Set
 from .. import enums
@@ -28,6 +28,40 @@ class Selector:
 	def eval(self, entities: List[BaseEntity], source: BaseEntity) -> List[BaseEntity]:
 		return entities
 
+	def predicate(self, source: BaseEntity) -> Optional[Callable[[BaseEntity], bool]]:
+		"""
+		Return func(entity), true iff the selector selects the entity, for
+		selectors which test the entities one at a time.
+		Other selectors return None.
+		"""
+		return None
+
+	def compile(self) -> "CompiledSelector":
+		"""The CompiledSelector of the selector, cached on the selector"""
+		compiled = self.__dict__.get("_compiled")
+		if compiled is None:
+			compiled = self._compiled = CompiledSelector(self)
+		return compiled
+
+	def matcher(self) -> Callable[[BaseEntity, BaseEntity], bool]:
+		"""
+		Return func(entity, source), true iff the selector selects \a entity
+		out of [entity]: the test of the arguments of the event triggers,
+		see Action.matches(). Cached on the selector, like compile().
+		"""
+		matcher = self.__dict__.get("_matcher")
+		if matcher is None:
+			matcher = self._matcher = self._compile_matcher()
+		return matcher
+
+	def _compile_matcher(self):
+		eval = self.eval
+
+		def match(entity, source):
+			ret = eval([entity], source)
+			return bool(ret) and ret[0] is entity
+		return match
+
 	def __add__(self, other: SelectorLike) -> "Selector":
 		return SetOpSelector(operator.and_, self, other)
 
@@ -65,9 +99,18 @@ class EnumSelector(Selector):
 		self.tag_enum = tag_enum
 
 	def eval(self, entities, source):
+		return self.compile().eval(entities, source)
+
+	def predicate(self, source):
 		if not self.tag_enum or not hasattr(self.tag_enum, "test"):
 			raise RuntimeError("Unsupported enum type {}".format(str(self.tag_enum)))
-		return [e for e in entities if self.tag_enum.test(e, source)]
+		test = self.tag_enum.test
+		return lambda e: test(e, source)
+
+	def _compile_matcher(self):
+		if not self.tag_enum or not hasattr(self.tag_enum, "test"):
+			return super()._compile_matcher()
+		return self.tag_enum.test
 
 	def __repr__(self):
 		return "<%s>" % (self.tag_enum.name)
@@ -139,11 +182,25 @@ class ComparisonSelector(Selector):
 		self.right = right
 
 	def eval(self, entities, source):
-		right_value = (self.right.evaluate(source)
-					   if isinstance(self.right, LazyValue)
-					   else self.right)
-		return [e for e in entities if
-				self.op(self.left.value(e, source), right_value)]
+		return self.compile().eval(entities, source)
+
+	def right_value(self, source):
+		if isinstance(self.right, LazyValue):
+			return self.right.evaluate(source)
+		return self.right
+
+	def predicate(self, source):
+		return self.compare(source, self.right_value(source))
+
+	def compare(self, source, right_value):
+		op, value = self.op, self.left.value
+		return lambda e: op(value(e, source), right_value)
+
+	def _compile_matcher(self):
+		op, value, right = self.op, self.left.value, self.right
+		if isinstance(right, LazyValue):
+			return lambda e, source: op(value(e, source), right.evaluate(source))
+		return lambda e, source: op(value(e, source), right)
 
 	def __repr__(self):
 		if self.op.__name__ == "eq":
@@ -174,15 +231,34 @@ class FilterSelector(Selector):
 	def eval(self, entities, source):
 		return [e for e in entities if self.func(e, source)]
 
+	def predicate(self, source):
+		func = self.func
+		return lambda e: func(e, source)
+
+	def _compile_matcher(self):
+		return self.func
+
 
 class FuncSelector(Selector):
-	def __init__(self, func: Callable[[List[BaseEntity], BaseEntity], List[BaseEntity]]):
-		"""func(entities, source) returns the results"""
+	def __init__(
+		self, func: Callable[[List[BaseEntity], BaseEntity], List[BaseEntity]],
+		test: Optional[Callable[[BaseEntity, BaseEntity], bool]]=None
+	):
+		"""
+		func(entities, source) returns the results
+		test(entity, source), if given, is the matcher() of the selector
+		"""
 		self.func = func
+		self.test = test
 
 	def eval(self, entities, source):
 		return self.func(entities, source)
 
+	def _compile_matcher(self):
+		if self.test is None:
+			return super()._compile_matcher()
+		return self.test
+
 
 class SliceSelector(Selector):
 	"""Applies a slice to child selector at evaluation time."""
@@ -212,6 +288,8 @@ class SetOpSelector(Selector):
 		return set(e.entity_id for e in entities if e)
 
 	def eval(self, entities, source):
+		if self.op in _SET_OPS:
+			return self.compile().eval(entities, source)
 		left_children = self.left.eval(entities, source)
 		right_children = self.right.eval(entities, source)
 		result_entity_ids = self.op(self._entity_id_set(left_children),
@@ -219,6 +297,11 @@ class SetOpSelector(Selector):
 		# Preserve input ordering and multiplicity
 		return [e for e in entities if e.entity_id in result_entity_ids]
 
+	def _compile_matcher(self):
+		if self.op not in _MATCH_OPS:
+			return super()._compile_matcher()
+		return _MATCH_OPS[self.op](self.left.matcher(), self.right.matcher())
+
 	def __repr__(self):
 		name = self.op.__name__
 		if name == "and_":
@@ -233,8 +316,142 @@ class SetOpSelector(Selector):
 		return "<%r %s %r>" % (self.left, infix, self.right)
 
 
-SELF = FuncSelector(lambda _, source: [source])
-OWNER = FuncSelector(lambda entities, source: [source.owner] if hasattr(source, "owner") else [])
+def _conjunction(predicates):
+	if len(predicates) == 1:
+		return predicates[0]
+
+	def test(entity):
+		for predicate in predicates:
+			if not predicate(entity):
+				return False
+		return True
+	return test
+
+
+_SET_OPS = {
+	operator.and_: lambda left, right: lambda e: left(e) and right(e),
+	operator.or_: lambda left, right: lambda e: left(e) or right(e),
+	operator.sub: lambda left, right: lambda e: left(e) and not right(e),
+}
+
+# The same, on the matchers of the operands (see Selector.matcher())
+_MATCH_OPS = {
+	operator.and_: lambda left, right: lambda e, source: left(e, source) and right(e, source),
+	operator.or_: lambda left, right: lambda e, source: left(e, source) or right(e, source),
+	operator.sub: lambda left, right: lambda e, source: left(e, source) and not right(e, source),
+}
+
+# The zone lists of the players, in the order the game iterates them
+_PLAYER_ZONES = (
+	(Zone.HAND, "hand"),
+	(Zone.DECK, "deck"),
+	(Zone.GRAVEYARD, "graveyard"),
+	(Zone.DISCARD, "discarded"),
+)
+
+
+class CompiledSelector:
+	"""
+	A selector flattened into a single filtering pass over the entities.
+	The set operations of the selector tree are turned into boolean
+	operations on the predicates of its operands; the operands which are
+	not predicates (SELF, RANDOM(...), ...) are evaluated beforehand, as
+	SetOpSelector does, and tested by entity id.
+	As with SetOpSelector, the result keeps the order and multiplicity of
+	the entities.
+
+	When the entities are the whole game, the zone, controller and minion
+	tests of the top level intersection restrict the scan to the zone
+	lists of the players which can hold the selected entities (an entity
+	is in the zone list of its controller, see BaseCard._set_zone()),
+	instead of iterating the whole game.
+	"""
+	def __init__(self, selector: Selector):
+		# [(selector, negated)]: the operands of the top level intersection
+		self.terms = []
+		self._flatten(selector, False)
+
+	def _flatten(self, selector, negated):
+		if not negated and type(selector) is SetOpSelector:
+			if selector.op is operator.and_:
+				self._flatten(selector.left, False)
+				self._flatten(selector.right, False)
+				return
+			if selector.op is operator.sub:
+				self._flatten(selector.left, False)
+				self._flatten(selector.right, True)
+				return
+		self.terms.append((selector, negated))
+
+	@staticmethod
+	def _bind(selector, entities, source):
+		if isinstance(selector, SetOpSelector) and selector.op in _SET_OPS:
+			left = CompiledSelector._bind(selector.left, entities, source)
+			right = CompiledSelector._bind(selector.right, entities, source)
+			return _SET_OPS[selector.op](left, right)
+		predicate = selector.predicate(source)
+		if predicate is None:
+			ids = SetOpSelector._entity_id_set(selector.eval(entities, source))
+			predicate = lambda e: e.entity_id in ids
+		return predicate
+
+	def eval(self, entities, source):
+		game = getattr(source, "game", None)
+		predicates = []
+		zone, player, minion = None, None, False
+		for selector, negated in self.terms:
+			if negated:
+				predicate = self._bind(selector, entities, source)
+				predicates.append(lambda e, predicate=predicate: not predicate(e))
+				continue
+			if type(selector) is ComparisonSelector and selector.op is operator.eq and \
+				isinstance(selector.left, AttrValue) and selector.left.tag == GameTag.CONTROLLER:
+				value = selector.right_value(source)
+				predicates.append(selector.compare(source, value))
+				if game is not None and any(value is p for p in game.players):
+					player = value
+				continue
+			if type(selector) is EnumSelector:
+				if isinstance(selector.tag_enum, Zone):
+					zone = selector.tag_enum
+				elif selector.tag_enum == CardType.MINION:
+					minion = True
+			predicates.append(self._bind(selector, entities, source))
+
+		predicate = _conjunction(predicates)
+		if entities is game and game is not None:
+			entities = self.candidates(game, zone, player, minion)
+		return [e for e in entities if predicate(e)]
+
+	@staticmethod
+	def candidates(game, zone, player, minion):
+		"""
+		The entities of \a game which can be in \a zone, controlled by
+		\a player, and minions if \a minion, in the order of the game.
+		"""
+		players = game.players if player is None else [player]
+		if zone == Zone.PLAY and minion:
+			return chain.from_iterable(p.field for p in players)
+		if zone == Zone.SECRET:
+			return chain.from_iterable(p.secrets for p in players)
+		if zone is None and player is None:
+			return game
+		# In play entities (and the buffs controlled by the opponent) are
+		# not in the zone lists
+		zones = [game.entities]
+		for list_zone, attr in _PLAYER_ZONES:
+			if zone is None or zone == list_zone:
+				zones += [getattr(p, attr) for p in players]
+		if zone is None or zone == Zone.SETASIDE:
+			zones.append(game.setaside)
+		return chain.from_iterable(zones)
+
+
+SELF = FuncSelector(lambda _, source: [source], lambda entity, source: entity is source)
+OWNER = FuncSelector(
+	lambda entities, source: [source.owner] if hasattr(source, "owner") else [],
+	lambda entity, source: entity is getattr(source, "owner", None)
+)
 
 
 def LazyValueSelector(value):
@@ -244,7 +461,10 @@ def LazyValueSelector(value):
 def ID(id):
 	return FilterSelector(lambda entity, source: getattr(entity, "id", None) == id)
 
-TARGET = FuncSelector(lambda entities, source: [source.target])
+TARGET = FuncSelector(
+	lambda entities, source: [source.target],
+	lambda entity, source: entity is source.target
+)
 
 
 class BoardPositionSelector(Selector):
@@ -296,7 +516,7 @@ class RandomSelector(Selector):
 
 	def eval(self, entities, source):
 		child_entities = self.child.eval(entities, source)
-		return random.sample(child_entities, min(len(child_entities), self.times))
+		return source.game.random.sample(child_entities, min(len(child_entities), self.times))
 
 	def __mul__(self, other):
 		return RandomSelector(self.child, self.times * other)
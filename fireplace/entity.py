@@ -1,6 +1,6 @@
 import uuid
 from hearthstone.enums import CardType
-from . import logging
+from . import dirty, logging
 
 
 class BaseEntity(object):
@@ -8,18 +8,36 @@ class BaseEntity(object):
 	logger = logging.log
 	ignore_scripts = False
 	type = CardType.INVALID
+	# The {entity_id: entity} the entity is marked as written in, if its
+	# tag changes are tracked (see managers.TagChanges)
+	_changes = None
+	# True while a dirty.Record records the attribute reads of the entity
+	_tracked = False
 
 	def __init__(self):
 		self.manager = self.Manager(self)
 		self.play_counter = 0
 		self.tags = self.manager
 		self.uuid = uuid.uuid4()
+		self._auras = {}
 
 		if self.data:
 			self._events = self.data.scripts.events[:]
 		else:
 			self._events = []
 
+	def __setattr__(self, name, value):
+		try:
+			versions = self._versions
+		except AttributeError:
+			versions = {}
+			super().__setattr__("_versions", versions)
+		versions[name] = versions[dirty.LAST] = next(dirty.clock)
+		super().__setattr__(name, value)
+		changes = self._changes
+		if changes is not None:
+			changes[self.entity_id] = self
+
 	def __int__(self):
 		return self.entity_id
 
@@ -71,6 +89,7 @@ class BaseEntity(object):
 		ret = source.game.trigger(self, actions, args)
 		if event.once:
 			self._events.remove(event)
+			dirty.touch(self, "_events")
 
 		return ret
 
@@ -89,8 +108,56 @@ class BuffableEntity(BaseEntity):
 		super().__init__()
 		self.buffs = []
 		self.slots = []
+		# {attr: (version, value)}: the derived stats, see _cached_stat()
+		self._stats = {}
+
+	def _cached_stat(self, attr):
+		"""
+		Return the (version, value) cache entry of the derived stat \a attr,
+		or None if it is outdated: the entity attribute "_" + attr, its buffs
+		or its aura slots were written since.
+		The cache is bypassed while a dirty.Record records the reads of the
+		entity, as it has to see the attributes the stat is derived from.
+		"""
+		entry = self._stats.get(attr)
+		if entry is None or self._tracked:
+			return None
+		version = entry[0]
+		versions = self._versions
+		if versions[dirty.LAST] > version:
+			for name in ("_" + attr, "buffs", "slots", "ignore_scripts", "data"):
+				if versions.get(name, 0) > version:
+					return None
+		return entry
+
+	def _scripted_stat(self, attr, own_scripts=True):
+		"""
+		True if the stat \a attr goes through scripts, which can read anything:
+		it can't be cached.
+		"""
+		if own_scripts and hasattr(self.data.scripts, attr):
+			return True
+		for buff in self.buffs:
+			if hasattr(buff.data.scripts, attr):
+				return True
+		for slot in self.slots:
+			if callable(getattr(slot, attr, None)):
+				return True
+		return False
 
 	def _getattr(self, attr, i):
+		entry = self._cached_stat(attr)
+		if entry is not None:
+			return i + entry[1]
+		if self._scripted_stat(attr, not self.ignore_scripts):
+			return self._fold(attr, i)
+		# Without scripts, the buffs and slots add up to a constant
+		version = next(dirty.clock)
+		delta = self._fold(attr, 0)
+		self._stats[attr] = (version, delta)
+		return i + delta
+
+	def _fold(self, attr, i):
 		i += getattr(self, "_" + attr, 0)
 		for buff in self.buffs:
 			i = buff._getattr(attr, i)
@@ -121,12 +188,19 @@ def slot_property(attr, f=any):
 def boolean_property(attr):
 	@property
 	def func(self):
-		return (
+		entry = self._cached_stat(attr)
+		if entry is not None:
+			return entry[1]
+		version = next(dirty.clock)
+		ret = (
 			getattr(self, "_" + attr, False) or
 			any(getattr(buff, attr, False) for buff in self.buffs) or
 			any(getattr(slot, attr, False) for slot in self.slots) or
 			getattr(self.data.scripts, attr, lambda s, x: x)(self, False)
 		)
+		if not self._scripted_stat(attr):
+			self._stats[attr] = (version, ret)
+		return ret
 
 	@func.setter
 	def func(self, value):
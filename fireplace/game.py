@@ -3,11 +3,14 @@ import time
 from calendar import timegm
 from itertools import chain
 from hearthstone.enums import CardType, PlayState, BlockType, State, Step, Zone
-from .actions import Attack, BeginTurn, Death, EndTurn, EventListener, Play
+from . import dirty, logging
+from .actions import Attack, BeginTurn, Death, EndTurn, EventListener, ListenerIndex, Play
+from .aura import aura_state, refresh_aura
 from .card import THE_COIN
+from .clone import Cloner
 from .entity import Entity
 from .managers import GameManager
-from .utils import CardList
+from .utils import CardList, IndexedCardList
 from .exceptions import GameOver
 
 
@@ -15,11 +18,25 @@ class BaseGame(Entity):
     type = CardType.GAME
     MAX_MINIONS_ON_FIELD = 7
     Manager = GameManager
+    # Skip the auras whose inputs did not change, see refresh_auras()
+    incremental_auras = True
+    # Cross-check every incremental refresh against a full one (slow, for tests)
+    verify_auras = False
 
-    def __init__(self, players):
+    def __init__(self, players, seed=None):
         self.data = None
         self.players = players
         super().__init__()
+        # The random number generator of the game: every random effect draws
+        # from it, so that a game only depends on its seed (drawn from the
+        # random module by default) and the moves of the players. Its state
+        # is saved and restored with getstate() and setstate(); clones copy it.
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.random = random.Random(seed)
+        # The logging.EventTrace the actions performed in the game are recorded in, if any
+        self.trace = None
         for player in players:
             player.game = self
         self.state = State.INVALID
@@ -28,9 +45,12 @@ class BaseGame(Entity):
         self.turn = 0
         self.current_player = None
         self.tick = 0
-        self.active_aura_buffs = CardList()
-        self.setaside = CardList()
+        self.active_aura_buffs = IndexedCardList()
+        self.setaside = IndexedCardList()
         self._action_stack = 0
+        self._listener_index = None
+        # {name: (version, CardList)}: the views of the zones, see _view()
+        self._views = {}
 
     def __repr__(self):
         return "%s(players=%r)" % (self.__class__.__name__, self.players)
@@ -38,41 +58,99 @@ class BaseGame(Entity):
     def __iter__(self):
         return chain(self.entities, self.hands, self.decks, self.graveyard, self.discarded, self.setaside)
 
+    def clone(self):
+        """
+        Return an independent copy of the game, in the same state, for lookahead search.
+        Card definitions and scripts are shared with the original game.
+        Observers (such as a Kettle connection) and the event trace are not copied.
+        """
+        cloner = Cloner()
+        cloner.memo[id(self.manager.observers)] = []
+        trace, self.trace = self.trace, None
+        try:
+            return cloner.clone(self)
+        finally:
+            self.trace = trace
+
     @property
     def game(self):
         return self
 
+    def _view(self, name, attr, inputs):
+        """
+        The CardList chaining the \a attr of both players, kept in `_views`
+        until one of the player attributes \a inputs is written, and shared
+        between calls: it must not be mutated.
+        Like the derived stats (see BuffableEntity._cached_stat()), the cache
+        is bypassed while a dirty.Record records the reads of the game.
+        """
+        p0, p1 = self.players
+        entry = self._views.get(name)
+        if entry is not None and not self._tracked:
+            version, view = entry
+            if not dirty.written_since(version, p0, inputs) and not dirty.written_since(version, p1, inputs):
+                return view
+        version = next(dirty.clock)
+        view = CardList(chain(getattr(p0, attr), getattr(p1, attr)))
+        self._views[name] = (version, view)
+        return view
+
     @property
     def board(self):
-        return CardList(chain(self.players[0].field, self.players[1].field))
+        return self._view("board", "field", ("field",))
 
     @property
     def decks(self):
-        return CardList(chain(self.players[0].deck, self.players[1].deck))
+        return self._view("decks", "deck", ("deck",))
 
     @property
     def discarded(self):
-        return CardList(chain(self.players[0].discarded, self.players[1].discarded))
+        return self._view("discarded", "discarded", ("discarded",))
 
     @property
     def hands(self):
-        return CardList(chain(self.players[0].hand, self.players[1].hand))
+        return self._view("hands", "hand", ("hand",))
 
     @property
     def characters(self):
-        return CardList(chain(self.players[0].characters, self.players[1].characters))
+        return self._view("characters", "characters", ("hero", "field"))
 
     @property
     def graveyard(self):
-        return CardList(chain(self.players[0].graveyard, self.players[1].graveyard))
+        return self._view("graveyard", "graveyard", ("graveyard",))
 
     @property
     def entities(self):
-        return CardList(chain([self], self.players[0].entities, self.players[1].entities))
+        entry = self._views.get("entities")
+        if entry is not None and not self._tracked:
+            version, view = entry
+            p0, p1 = self.players
+            if not p0.entities_written_since(version) and not p1.entities_written_since(version):
+                return view
+        version = next(dirty.clock)
+        view = CardList(chain([self], self.players[0].entities, self.players[1].entities))
+        self._views["entities"] = (version, view)
+        return view
+
+    @property
+    def listener_index(self):
+        """
+        The ListenerIndex broadcasts go through, rebuilt when outdated
+        """
+        index = self._listener_index
+        if index is None:
+            index = ListenerIndex(self)
+        elif not index.stale:
+            index.hits += 1
+            return index
+        else:
+            index = ListenerIndex(self, *index.next_backoff())
+        self._listener_index = index
+        return index
 
     @property
     def live_entities(self):
-        return CardList(chain(self.players[0].live_entities, self.players[1].live_entities))
+        return self._view("live_entities", "live_entities", ("field", "hero", "weapon"))
 
     @property
     def minions_killed_this_turn(self):
@@ -96,7 +174,8 @@ class BaseGame(Entity):
         if type != BlockType.PLAY:
             self._action_stack -= 1
         if not self._action_stack:
-            self.log("Empty stack, refreshing auras and processing deaths")
+            if not logging.silent:
+                self.log("Empty stack, refreshing auras and processing deaths")
             self.refresh_auras()
             self.process_deaths()
 
@@ -216,6 +295,7 @@ class BaseGame(Entity):
                 else:
                     listener = source
                 listener._events.append(action)
+                dirty.touch(listener, "_events")
             else:
                 ret.append(action.trigger(source))
         return ret
@@ -229,6 +309,19 @@ class BaseGame(Entity):
         return self.players[0], self.players[1]
 
     def refresh_auras(self):
+        """
+        Refresh the auras of all the entities in play and in hand.
+        With `incremental_auras`, an aura is only evaluated again if one of the
+        entity attributes it read has been written since its last evaluation.
+        With `verify_auras`, the result is checked against a full refresh of a
+        clone of the game.
+        """
+        if self.verify_auras:
+            expected = self.clone()
+            expected.incremental_auras = False
+            expected.verify_auras = False
+            expected.refresh_auras()
+
         refresh_queue = []
         for entity in self.entities:
             for script in entity.update_scripts:
@@ -240,8 +333,12 @@ class BaseGame(Entity):
 
         # Sort the refresh queue by refresh priority (used by eg. Lightspawn)
         refresh_queue.sort(key=lambda e: getattr(e[1], "priority", 50))
-        for entity, action in refresh_queue:
-            action.trigger(entity)
+        if self.incremental_auras:
+            for entity, action in refresh_queue:
+                refresh_aura(entity, action)
+        else:
+            for entity, action in refresh_queue:
+                action.trigger(entity)
 
         buffs_to_destroy = []
         for buff in self.active_aura_buffs:
@@ -252,6 +349,9 @@ class BaseGame(Entity):
 
         self.tick += 1
 
+        if self.verify_auras and aura_state(self) != aura_state(expected):
+            raise AssertionError("Incremental aura refresh of %r diverged from a full refresh" % (self))
+
     def setup(self):
         self.log("Setting up game %r", self)
         self.state = State.RUNNING
@@ -281,7 +381,8 @@ class BaseGame(Entity):
         return self.queue_actions(self, [EndTurn(self.current_player)])
 
     def _end_turn(self):
-        self.log("%s ends turn %i", self.current_player, self.turn)
+        if not logging.silent:
+            self.log("%s ends turn %i", self.current_player, self.turn)
         self.manager.step(self.next_step, Step.MAIN_CLEANUP)
         self.current_player.temp_mana = 0
         self.end_turn_cleanup()
@@ -339,7 +440,7 @@ class CoinRules:
     """
 
     def pick_first_player(self):
-        winner = random.choice(self.players)
+        winner = self.random.choice(self.players)
         self.log("Tossing the coin... %s wins!", winner)
         return winner, winner.opponent
 
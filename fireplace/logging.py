@@ -1,4 +1,11 @@
 import logging
+from array import array
+from contextlib import contextmanager
+
+
+# When set, the engine skips the log calls of its hot path altogether,
+# instead of building their arguments for a logger which drops them
+silent = False
 
 
 def get_logger(name, level=logging.DEBUG):
@@ -21,3 +28,73 @@ def get_logger(name, level=logging.DEBUG):
 
 
 log = get_logger("fireplace")
+
+
+@contextmanager
+def silenced():
+	"""
+	Run the engine silently: the hot path does not log at all, and
+	the fireplace logger drops anything else below WARNING
+	"""
+	global silent
+	previous, level = silent, log.level
+	silent = True
+	log.setLevel(logging.WARNING + 1)
+	try:
+		yield
+	finally:
+		silent = previous
+		log.setLevel(level)
+
+
+@contextmanager
+def tracing(game, event_trace=None):
+	"""
+	Record the actions performed in \a game in \a event_trace
+	(a new EventTrace by default), which is returned
+	"""
+	previous = game.trace
+	game.trace = event_trace if event_trace is not None else EventTrace()
+	try:
+		yield game.trace
+	finally:
+		game.trace = previous
+
+
+class EventTrace:
+	"""
+	A binary trace of the actions performed in a game (see BaseGame.trace).
+	Each action is recorded as RECORD_SIZE ints: the index of the action
+	class in `names`, the entity ids of its source and target (0 for none)
+	and its amount (damage, heal, ...; 0 for none).
+	"""
+	RECORD_SIZE = 4
+
+	def __init__(self):
+		self.data = array("i")
+		self.names = []
+		self._codes = {}
+
+	def __len__(self):
+		return len(self.data) // self.RECORD_SIZE
+
+	def __iter__(self):
+		"""
+		Iterate over the records as (action name, source id, target id, amount)
+		"""
+		data, names = self.data, self.names
+		for i in range(0, len(data), self.RECORD_SIZE):
+			yield names[data[i]], data[i + 1], data[i + 2], data[i + 3]
+
+	def record(self, action, source, target, amount=0):
+		cls = action.__class__
+		code = self._codes.get(cls)
+		if code is None:
+			code = self._codes[cls] = len(self.names)
+			self.names.append(cls.__name__)
+		self.data.extend((
+			code,
+			getattr(source, "entity_id", None) or 0,
+			getattr(target, "entity_id", None) or 0,
+			amount if type(amount) is int else 0,
+		))
@@ -1,5 +1,5 @@
 from hearthstone.enums import GameTag
-from . import enums
+from . import dirty, enums
 
 
 class Manager(object):
@@ -54,6 +54,10 @@ class GameManager(Manager):
         super().__init__(obj)
         self.counter = 1
         obj.entity_id = self.counter
+        # Every entity of the game, whose reads a dirty.Record records
+        self.entities = [obj]
+        # See track_changes()
+        self.changes = None
 
     def action_start(self, type, source, index, target):
         for observer in self.observers:
@@ -66,6 +70,11 @@ class GameManager(Manager):
     def new_entity(self, entity):
         self.counter += 1
         entity.entity_id = self.counter
+        self.entities.append(entity)
+        if self.obj._tracked:
+            dirty.track(entity)
+        if self.changes is not None:
+            self.changes.add(entity)
         for observer in self.observers:
             observer.new_entity(entity)
 
@@ -84,6 +93,89 @@ class GameManager(Manager):
         for observer in self.observers:
             observer.turn(player)
 
+    def track_changes(self):
+        """
+        Start tracking the tag changes of the entities of the game, and
+        return the TagChanges to drain them from
+        """
+        if self.changes is None:
+            self.changes = TagChanges()
+            for entity in self.obj:
+                if getattr(entity, "entity_id", None) is not None:
+                    self.changes.add(entity)
+        return self.changes
+
+
+def _tag_values(entity):
+    ret = {}
+    for tag, value in entity.tags.items():
+        if not isinstance(value, str):
+            ret[tag] = int(value) if value else 0
+    return ret
+
+
+class TagChanges:
+    """
+    The tag changes of the entities of a game, for the observers sending
+    them as deltas (such as Kettle) instead of comparing every tag of every
+    entity.
+    Writing an attribute of a tracked entity (or touching one of its lists,
+    see dirty.touch()) marks it as written. The tags of an entity are
+    computed in a dirty.Record, whose reads are the entities they depend
+    on: the tags derived from buffs, auras, the controller... are computed
+    again when one of these is written and the Record is stale.
+    """
+    def __init__(self):
+        # {entity_id: entity} written since the last drain()
+        self.written = {}
+        # {entity_id: (Record, {tag: value})} of the last computation
+        self.tags = {}
+        # {entity_id: {entity_id: entity}} of the entities whose tags read an entity
+        self.dependents = {}
+
+    def add(self, entity):
+        entity._changes = self.written
+        self.written[entity.entity_id] = entity
+
+    def drain(self):
+        """
+        Return the [(entity, tag, value)] of the tags changed since the last
+        call, or of all the tags of a new entity. String tags are left out,
+        the other values are converted to int.
+        """
+        written = dict(self.written)
+        # cleared in place: the entities hold it
+        self.written.clear()
+        candidates = written.copy()
+        for entity_id in written:
+            dependents = self.dependents.get(entity_id)
+            if dependents:
+                candidates.update(dependents)
+
+        ret = []
+        for entity_id, entity in candidates.items():
+            if entity_id in self.tags:
+                record, old_tags = self.tags[entity_id]
+                if not record.stale:
+                    continue
+                for read, names in record.reads:
+                    dependents = self.dependents.get(getattr(read, "entity_id", None))
+                    if dependents:
+                        dependents.pop(entity_id, None)
+            else:
+                old_tags = {}
+            record = dirty.Record()
+            tags = record.run(entity.game, _tag_values, entity)
+            for read, names in record.reads:
+                read_id = getattr(read, "entity_id", None)
+                if read_id is not None:
+                    self.dependents.setdefault(read_id, {})[entity_id] = entity
+            self.tags[entity_id] = (record, tags)
+            for tag, value in tags.items():
+                if old_tags.get(tag) != value:
+                    ret.append((entity, tag, value))
+        return ret
+
 
 class BaseObserver:
     def action_start(self, type, source, index, target):
@@ -0,0 +1,75 @@
+"""
+The legal moves of a player, see Player.legal_options().
+"""
+
+
+class Option:
+	"""
+	A legal move of a player: playing \a entity from the hand (as its choice
+	\a choose, for Choose One cards), using the hero power \a entity, or
+	attacking with the character \a entity.
+	\a targets are the valid targets of the move, empty if it takes none.
+	"""
+	PLAY = 1
+	POWER = 2
+	ATTACK = 3
+
+	def __init__(self, type, entity, targets=(), choose=None):
+		self.type = type
+		self.entity = entity
+		self.targets = targets
+		self.choose = choose
+
+	def __repr__(self):
+		entity = self.entity if self.choose is None else self.choose
+		return "<Option %r (%i targets)>" % (entity, len(self.targets))
+
+	def perform(self, target=None, index=None):
+		"""
+		Perform the move on \a target, which must be one of `targets` if the
+		move takes a target. A played minion is put at \a index of the field.
+		"""
+		if self.type == Option.PLAY:
+			choose = self.choose.id if self.choose is not None else None
+			return self.entity.play(target=target, index=index, choose=choose)
+		if self.type == Option.POWER:
+			return self.entity.use(target=target)
+		return self.entity.attack(target)
+
+
+def find_options(player):
+	"""
+	The legal moves of \a player, in the order of its actionable entities:
+	the attacks of its characters, the cards of its hand, its hero power.
+	"""
+	if player.choice or not player.current_player:
+		return ()
+	options = []
+	for character in player.characters:
+		if character.can_attack():
+			options.append(Option(Option.ATTACK, character, tuple(character.attack_targets)))
+
+	for card in player.hand:
+		if not card.is_playable():
+			continue
+		if not card.must_choose_one:
+			targets = tuple(card.play_targets) if card.requires_target() else ()
+			options.append(Option(Option.PLAY, card, targets))
+			continue
+		# Card.play() checks the target of a choice against the targets of the card
+		card_targets = None
+		for choose in card.choose_cards:
+			targets = ()
+			if choose.requires_target():
+				if card_targets is None:
+					card_targets = {id(t) for t in card.play_targets}
+				targets = tuple(t for t in choose.play_targets if id(t) in card_targets)
+				if not targets:
+					continue
+			options.append(Option(Option.PLAY, card, targets, choose))
+
+	power = player.hero.power
+	if power is not None and power.is_usable():
+		targets = tuple(power.play_targets) if power.requires_target() else ()
+		options.append(Option(Option.POWER, power, targets))
+	return tuple(options)
@@ -1,6 +1,6 @@
-import random
 from itertools import chain
 from hearthstone.enums import CardType, PlayState, Zone
+from . import dirty, logging
 from .actions import Concede, Draw, Fatigue, Give, Hit, Steal, Summon
 from .aura import TargetableByAuras
 from .card import Card
@@ -8,7 +8,8 @@ from .deck import Deck
 from .entity import Entity
 from .entity import slot_property
 from .managers import PlayerManager
-from .utils import CardList
+from .options import find_options
+from .utils import CardList, IndexedCardList
 
 
 class Player(Entity, TargetableByAuras):
@@ -33,11 +34,15 @@ class Player(Entity, TargetableByAuras):
         self.hero = None
         super().__init__()
         self.deck = Deck()
-        self.hand = CardList()
-        self.discarded = CardList()
-        self.field = CardList()
-        self.graveyard = CardList()
-        self.secrets = CardList()
+        self.hand = IndexedCardList()
+        self.discarded = IndexedCardList()
+        self.field = IndexedCardList()
+        self.graveyard = IndexedCardList()
+        self.secrets = IndexedCardList()
+        # {name: (version, CardList)}, see `characters`
+        self._views = {}
+        # The dirty.Record of the legal moves, see legal_options()
+        self._options = None
         self.choice = None
         self.max_hand_size = 10
         self.max_resources = 10
@@ -85,7 +90,8 @@ class Player(Entity, TargetableByAuras):
     @max_mana.setter
     def max_mana(self, amount):
         self._max_mana = min(self.max_resources, max(0, amount))
-        self.log("%s is now at %i mana crystals", self, self._max_mana)
+        if not logging.silent:
+            self.log("%s is now at %i mana crystals", self, self._max_mana)
 
     @property
     def heropower_damage(self):
@@ -106,7 +112,16 @@ class Player(Entity, TargetableByAuras):
 
     @property
     def characters(self):
-        return CardList(chain([self.hero] if self.hero else [], self.field))
+        # cached like the views of the game, see BaseGame._view()
+        entry = self._views.get("characters")
+        if entry is not None and not self._tracked:
+            version, view = entry
+            if not dirty.written_since(version, self, ("hero", "field")):
+                return view
+        version = next(dirty.clock)
+        view = CardList(chain([self.hero] if self.hero else [], self.field))
+        self._views["characters"] = (version, view)
+        return view
 
     @property
     def entities(self):
@@ -118,6 +133,18 @@ class Player(Entity, TargetableByAuras):
             yield from self.hero.entities
         yield self
 
+    def entities_written_since(self, version):
+        """
+        True if `entities` may have changed after \a version
+        """
+        if dirty.written_since(version, self, ("field", "secrets", "buffs", "hero", "weapon")):
+            return True
+        for minion in self.field:
+            if dirty.written_since(version, minion, ("buffs",)):
+                return True
+        hero = self.hero
+        return hero is not None and dirty.written_since(version, hero, ("buffs", "power"))
+
     @property
     def live_entities(self):
         yield from self.field
@@ -126,6 +153,25 @@ class Player(Entity, TargetableByAuras):
         if self.weapon:
             yield self.weapon
 
+    def legal_options(self):
+        """
+        The legal moves of the player, as a tuple of options.Option (empty
+        if it is not its turn, or if it has a choice to make).
+        The moves are kept until one of the entity attributes read to find
+        them is written, like the listener index (see BaseGame.listener_index).
+        """
+        record = self._options
+        if record is None:
+            record = dirty.Record()
+        elif not record.stale:
+            record.hits += 1
+            return record.options
+        else:
+            record = dirty.Record(*record.next_backoff())
+        record.options = record.run(self.game, find_options, self)
+        self._options = record
+        return record.options
+
     @property
     def actionable_entities(self):
         yield from self.characters
@@ -159,7 +205,7 @@ class Player(Entity, TargetableByAuras):
 
         # Draw initial hand (but not any more than what we have in the deck)
         hand_size = min(len(self.deck), self.start_hand_size)
-        starting_hand = random.sample(self.deck, hand_size)
+        starting_hand = self.game.random.sample(self.deck, hand_size)
         # It's faster to move cards directly to the hand instead of drawing
         for card in starting_hand:
             card.zone = Zone.HAND
@@ -202,13 +248,15 @@ class Player(Entity, TargetableByAuras):
             used_temp = min(self.temp_mana, amount)
             amount -= used_temp
             self.temp_mana -= used_temp
-        self.log("%s pays %i mana", self, amount)
+        if not logging.silent:
+            self.log("%s pays %i mana", self, amount)
         self.used_mana += amount
         return amount
 
     def shuffle_deck(self):
         self.log("%r shuffles their deck", self)
-        random.shuffle(self.deck)
+        self.game.random.shuffle(self.deck)
+        dirty.touch(self, "deck")
 
     def draw(self, count=1):
         if self.cant_draw:
@@ -0,0 +1,138 @@
+"""
+Headless simulation of complete games.
+
+    from fireplace import cards, simulate
+    cards.db.initialize()
+    results = simulate.run_games(1000, seed=1857, processes=4)
+    print(simulate.win_rate(results))
+
+A game is built by a game factory (a callable returning a started Game, see utils.setup_game)
+and played by two agents. An agent is a callable agent(game, player) which performs any actions of
+player during its turn; the turn is ended by the simulator. Game factories and agents must be
+module-level callables to run games in a process pool.
+
+Nothing is printed, and the engine runs silently while games are played (see logging.silenced()).
+"""
+import random
+import time
+from collections import namedtuple
+from hearthstone.enums import PlayState
+from .exceptions import GameOver
+from .logging import silenced
+from .options import Option
+from .utils import setup_game
+
+
+# winner is the index of the winning player in game.players, or None for a tie or an unfinished game
+GameResult = namedtuple("GameResult", ["seed", "winner", "turns", "duration"])
+
+MAX_TURNS = 200
+
+
+def random_mulligan(player):
+    mull_count = random.randint(0, len(player.choice.cards))
+    player.choice.choose(*random.sample(player.choice.cards, mull_count))
+
+
+def random_agent(game, player):
+    """
+    Play random playable cards, use the hero power from time to time
+    and attack random targets with every character which can attack,
+    picking among the legal moves of the player (see Player.legal_options()).
+    """
+    while True:
+        options = player.legal_options()
+        powers = [option for option in options if option.type == Option.POWER]
+        if powers and random.random() < 0.1:
+            perform_random(player, powers[0])
+            continue
+        break
+
+    # go through our hand and play whatever is playable
+    for card in player.hand[:]:
+        options = [option for option in player.legal_options() if option.entity is card]
+        if options and random.random() < 0.5:
+            perform_random(player, random.choice(options))
+
+    # Randomly attack with whatever can attack
+    for character in player.characters:
+        for option in player.legal_options():
+            if option.type == Option.ATTACK and option.entity is character:
+                perform_random(player, option)
+                break
+
+
+def perform_random(player, option):
+    """
+    Perform \a option on a random target, then make a random choice if the move
+    gives the player one
+    """
+    option.perform(random.choice(option.targets) if option.targets else None)
+    if player.choice:
+        player.choice.choose(random.choice(player.choice.cards))
+
+
+def play_game(seed, game_factory=setup_game, agents=(random_agent, random_agent),
+              mulligan=random_mulligan, max_turns=MAX_TURNS) -> GameResult:
+    """
+    Play one complete game. The game only depends on \a seed
+    (as long as the agents only use the random module for randomness)
+    """
+    start = time.perf_counter()
+    random.seed(seed)
+    game = None
+    try:
+        with silenced():
+            game = game_factory()
+            for player in game.players:
+                if player.choice:
+                    mulligan(player)
+            while game.turn <= max_turns:
+                player = game.current_player
+                agents[game.players.index(player)](game, player)
+                game.end_turn()
+    except GameOver:
+        pass
+
+    winner = None
+    if game is not None:
+        for i, player in enumerate(game.players):
+            if player.playstate == PlayState.WON:
+                winner = i
+    return GameResult(seed, winner, game.turn if game else 0, time.perf_counter() - start)
+
+
+def _play_game_star(args):
+    return play_game(*args)
+
+
+def _init_worker():
+    from . import cards
+    with silenced():
+        cards.db.initialize()
+
+
+def run_games(num_games, game_factory=setup_game, agents=(random_agent, random_agent), seed=0,
+              mulligan=random_mulligan, max_turns=MAX_TURNS, processes=None) -> list:
+    """
+    Play \a num_games games with the per-game seeds seed, seed + 1, ...
+    and return their GameResults in that order.
+    With \a processes > 1, games are spread over a process pool. The results are the same.
+    """
+    tasks = [(seed + i, game_factory, agents, mulligan, max_turns) for i in range(num_games)]
+    if processes is None or processes <= 1:
+        return [_play_game_star(task) for task in tasks]
+
+    from multiprocessing import Pool
+    with Pool(processes, initializer=_init_worker) as pool:
+        return pool.map(_play_game_star, tasks, chunksize=max(1, num_games // (processes * 4)))
+
+
+def win_rate(results, player_index=0) -> float:
+    """
+    Fraction of finished games won by game.players[\a player_index]
+    """
+    finished = [result for result in results if result.winner is not None]
+    if not finished:
+        return 0.0
+    return sum(1 for result in finished if result.winner == player_index) / len(finished)
@@ -6,6 +6,7 @@ from pkgutil import iter_modules
 from typing import List
 from xml.etree import ElementTree
 from hearthstone.enums import CardClass, CardType
+from .options import Option
 
 # Autogenerate the list of cardset modules
 _cards_module = os.path.join(os.path.dirname(__file__), "cards")
@@ -59,9 +60,101 @@ class CardList(list):
         return self.__class__(e for k, v in kwargs.items() for e in self if getattr(e, k, 0) == v)
 
 
-def random_draft(card_class: CardClass, exclude=[]):
+class IndexedCardList(CardList):
     """
-    Return a deck of 30 random cards for the \a card_class
+    A CardList holding the cards of a zone, each at most once.
+    Membership, index() and remove() look the cards up by identity in a map
+    of their positions instead of scanning the list. Appending and removing
+    the last card keep the map up to date, any other change drops it and
+    the next lookup builds it again.
+    """
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._positions = None
+
+    def _get_positions(self):
+        positions = self._positions
+        if positions is None:
+            positions = self._positions = {id(item): i for i, item in enumerate(self)}
+        return positions
+
+    def __contains__(self, x):
+        positions = self._positions
+        if positions is None:
+            positions = self._get_positions()
+        return id(x) in positions
+
+    def index(self, x):
+        positions = self._positions
+        if positions is None:
+            positions = self._get_positions()
+        i = positions.get(id(x))
+        if i is None:
+            raise ValueError
+        return i
+
+    def remove(self, x):
+        i = self.index(x)
+        super().__delitem__(i)
+        if i == len(self):
+            del self._positions[id(x)]
+        else:
+            self._positions = None
+
+    def append(self, x):
+        if self._positions is not None:
+            self._positions[id(x)] = len(self)
+        super().append(x)
+
+    def insert(self, i, x):
+        if i >= len(self):
+            self.append(x)
+        else:
+            self._positions = None
+            super().insert(i, x)
+
+    def pop(self, i=-1):
+        x = super().pop(i)
+        if self._positions is not None:
+            if i == -1 or i == len(self):
+                del self._positions[id(x)]
+            else:
+                self._positions = None
+        return x
+
+    def __setitem__(self, key, value):
+        self._positions = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._positions = None
+        super().__delitem__(key)
+
+    def __iadd__(self, other):
+        self._positions = None
+        return super().__iadd__(other)
+
+    def clear(self):
+        self._positions = None
+        super().clear()
+
+    def extend(self, other):
+        self._positions = None
+        super().extend(other)
+
+    def reverse(self):
+        self._positions = None
+        super().reverse()
+
+    def sort(self, *args, **kwargs):
+        self._positions = None
+        super().sort(*args, **kwargs)
+
+
+def random_draft(card_class: CardClass, exclude=[], rng=random):
+    """
+    Return a deck of 30 random cards for the \a card_class,
+    drawn from \a rng (a random.Random, the random module by default)
     """
     from . import cards
     from .deck import Deck
@@ -84,7 +177,7 @@ def random_draft(card_class: CardClass, exclude=[]):
         collection.append(cls)
 
     while len(deck) < Deck.MAX_CARDS:
-        card = random.choice(collection)
+        card = rng.choice(collection)
         if deck.count(card.id) < card.max_count_in_deck:
             deck.append(card.id)
 
@@ -121,18 +214,34 @@ def fix_draft(card_class: CardClass, card_ids):
     return deck
 
 
-def random_class():
-    return CardClass(random.randint(2, 10))
+def random_class(rng=random):
+    return CardClass(rng.randint(2, 10))
+
 
+_script_definitions = {}
 
-def get_script_definition(id):
+
+def get_script_definitions(cardset):
     """
-    Find and return the script definition for card \a id
+    Return the {id: definition} map of the card set module \a cardset,
+    built once per module
     """
-    for cardset in CARD_SETS:
+    ret = _script_definitions.get(cardset)
+    if ret is None:
         module = import_module("fireplace.cards.%s" % (cardset))
-        if hasattr(module, id):
-            return getattr(module, id)
+        ret = _script_definitions[cardset] = vars(module)
+    return ret
+
+
+def get_script_definition(id, cardsets=CARD_SETS):
+    """
+    Find and return the script definition for card \a id,
+    looking in the card set modules \a cardsets in order
+    """
+    for cardset in cardsets:
+        definitions = get_script_definitions(cardset)
+        if id in definitions:
+            return definitions[id]
 
 
 def entity_to_xml(entity):
@@ -165,8 +274,13 @@ def game_state_to_xml(game):
 def weighted_card_choice(source, weights: List[int], card_sets: List[str], count: int):
     """
     Take a list of weights and a list of card pools and produce
-    a random weighted sample without replacement.
+    a random weighted sample without replacement, drawn from the
+    random number generator of the game of \a source.
     len(weights) == len(card_sets) (one weight per card set)
+    The card pools are not modified: they may be the cached ones of the
+    card database. A card drawn from a pool is replaced with the last
+    remaining card of the pool instead (a partial Fisher-Yates shuffle),
+    which keeps each draw O(1) in the size of the pool.
     """
 
     chosen_cards = []
@@ -178,15 +292,24 @@ def weighted_card_choice(source, weights: List[int], card_sets: List[str], count
         totalweight += w * len(card_sets[i])
         cum_weights.append(totalweight)
 
+    # for each set, the count of remaining cards and the {index: card}
+    # of the cards swapped in place of the drawn ones
+    remaining = [len(cards) for cards in card_sets]
+    swapped = [{} for cards in card_sets]
+
+    rng = source.game.random
     # for each card
     for i in range(count):
         # choose a set according to weighting
-        chosen_set = bisect(cum_weights, random.random() * totalweight)
+        chosen_set = bisect(cum_weights, rng.random() * totalweight)
 
         # choose a random card from that set
-        chosen_card_index = random.randint(0, len(card_sets[chosen_set]) - 1)
+        cards, moved = card_sets[chosen_set], swapped[chosen_set]
+        chosen_card_index = rng.randint(0, remaining[chosen_set] - 1)
+        last = remaining[chosen_set] = remaining[chosen_set] - 1
 
-        chosen_cards.append(card_sets[chosen_set].pop(chosen_card_index))
+        chosen_cards.append(moved.get(chosen_card_index, cards[chosen_card_index]))
+        moved[chosen_card_index] = moved.get(last, cards[last])
         totalweight -= weights[chosen_set]
         cum_weights[chosen_set:] = [x - weights[chosen_set] for x in cum_weights[chosen_set:]]
 
@@ -266,43 +389,33 @@ def setup_game_fix_player_fix_deck() -> ".game.Game":
 def play_turn(game: ".game.Game") -> ".game.Game":
     player = game.current_player
 
-    while True:
-        heropower = player.hero.power
-        if heropower.is_usable() and random.random() < 0.1:
-            if heropower.requires_target():
-                heropower.use(target=random.choice(heropower.targets))
-            else:
-                heropower.use()
-            continue
+    def perform(option):
+        target = random.choice(option.targets) if option.targets else None
+        print("Playing %r on %r" % (option.choose or option.entity, target))
+        option.perform(target)
+        if player.choice:
+            choice = random.choice(player.choice.cards)
+            print("Choosing card %r" % (choice))
+            player.choice.choose(choice)
 
-        # iterate over our hand and play whatever is playable
-        for card in player.hand:
-            if card.id == 'EX1_277':
-                print('a')
-                card.play(target=None)
-
-            if card.is_playable() and random.random() < 0.5:
-                target = None
-                if card.must_choose_one:
-                    card = random.choice(card.choose_cards)
-                if card.requires_target():
-                    target = random.choice(card.targets)
-                print("Playing %r on %r" % (card, target))
-                card.play(target=target)
-
-                if player.choice:
-                    choice = random.choice(player.choice.cards)
-                    print("Choosing card %r" % (choice))
-                    player.choice.choose(choice)
-
-                continue
-
-        # Randomly attack with whatever can attack
-        for character in player.characters:
-            if character.can_attack():
-                character.attack(random.choice(character.targets))
-
-        break
+    while True:
+        powers = [option for option in player.legal_options() if option.type == Option.POWER]
+        if not powers or random.random() >= 0.1:
+            break
+        perform(powers[0])
+
+    # iterate over our hand and play whatever is playable
+    for card in player.hand[:]:
+        options = [option for option in player.legal_options() if option.entity is card]
+        if options and random.random() < 0.5:
+            perform(random.choice(options))
+
+    # Randomly attack with whatever can attack
+    for character in player.characters:
+        for option in player.legal_options():
+            if option.type == Option.ATTACK and option.entity is character:
+                option.perform(random.choice(option.targets))
+                break
 
     game.end_turn()
     return game
@@ -1,7 +1,10 @@
 #!/usr/bin/env python
+import asyncio
 import json
 import logging
+import multiprocessing
 import random
+import signal
 import socketserver
 import struct
 import sys
@@ -10,8 +13,10 @@ from hearthstone.enums import (
 	CardType, ChoiceType, GameTag, OptionType, Step, Zone
 )
 from fireplace import actions, cards
-from fireplace.exceptions import GameOver
+from fireplace.exceptions import GameOver, InvalidAction
 from fireplace.game import BaseGame as Game
+from fireplace.logging import log as GameLogger
+from fireplace.managers import BaseObserver
 from fireplace.player import Player
 from fireplace.utils import CardList
 
@@ -31,11 +36,16 @@ class KettleSerializer(json.JSONEncoder):
 		return int(o)
 
 
-class KettleManager:
+# Packets are a JSON body prefixed with its size
+HEADER = struct.Struct("<i")
+
+
+class KettleManager(BaseObserver):
 	def __init__(self, game):
 		self.game = game
 		self.game_state = {}
 		self.queued_data = []
+		self.changes = game.manager.track_changes()
 
 	def action_start(self, type, source, index, target):
 		DEBUG("Beginning new action %r (%r, %r, %r)", type, source, index, target)
@@ -74,24 +84,28 @@ class KettleManager:
 		state[GameTag.ENTITY_ID] = entity
 
 	def refresh_tag(self, entity, tag):
-		state = self.game_state[entity.entity_id]
 		value = entity.tags.get(tag, 0)
 		if isinstance(value, str):
 			return
+		self.update_tag(entity, tag, int(value) if value else 0)
+
+	def update_tag(self, entity, tag, value):
+		state = self.game_state[entity.entity_id]
 		if not value:
 			if state.get(tag, 0):
 				self.tag_change(entity, tag, 0)
 				del state[tag]
-		elif int(value) != state.get(tag, 0):
-			self.tag_change(entity, tag, int(value))
-			state[tag] = int(value)
+		elif value != state.get(tag, 0):
+			self.tag_change(entity, tag, value)
+			state[tag] = value
 
 	def refresh_full_state(self):
 		if self.game.step < Step.BEGIN_MULLIGAN:
 			return
-		for entity in self.game:
+		# Only the tags which may have changed, see TagChanges
+		for entity, tag, value in self.changes.drain():
 			if entity.entity_id in self.game_state:
-				self.refresh_state(entity.entity_id)
+				self.update_tag(entity, tag, value)
 
 	def refresh_state(self, entity_id):
 		assert entity_id in self.game_state
@@ -101,41 +115,6 @@ class KettleManager:
 		for tag in entity.tags:
 			self.refresh_tag(entity, tag)
 
-	def get_options(self, entity):
-		ret = []
-		if entity.zone == Zone.HAND:
-			if entity.type in (CardType.SPELL, CardType.MINION, CardType.WEAPON):
-				if entity.is_playable():
-					ret.append({
-						"Type": OptionType.POWER,
-						"MainOption": {
-							"ID": entity,
-							"Targets": entity.targets,
-						},
-					})
-
-		elif entity.zone == Zone.PLAY:
-			if entity.type == CardType.HERO_POWER:
-				if entity.is_usable():
-					ret.append({
-						"Type": OptionType.POWER,
-						"MainOption": {
-							"ID": entity,
-							"Targets": entity.targets,
-						}
-					})
-			elif entity.type in (CardType.HERO, CardType.MINION):
-				if entity.can_attack():
-					ret.append({
-						"Type": OptionType.POWER,
-						"MainOption": {
-							"ID": entity,
-							"Targets": entity.attack_targets,
-						}
-					})
-
-		return ret
-
 	def refresh_choices(self):
 		choice = self.game.current_player.choice
 		DEBUG("Queuing choice %r (cards: %r)", choice, choice.cards)
@@ -158,10 +137,34 @@ class KettleManager:
 		if self.game.current_player.choice:
 			return self.refresh_choices()
 		self.options = [{"Type": OptionType.END_TURN}]
-
-		for entity in self.game.current_player.actionable_entities:
-			for option in self.get_options(entity):
-				self.options.append(option)
+		# {entity_id: sub options}: the choices of the Choose One cards are
+		# the sub options of their option
+		choose_one = {}
+		for option in self.game.current_player.legal_options():
+			if option.choose is None:
+				self.options.append({
+					"Type": OptionType.POWER,
+					"MainOption": {
+						"ID": option.entity,
+						"Targets": list(option.targets),
+					},
+				})
+				continue
+			sub_options = choose_one.get(option.entity.entity_id)
+			if sub_options is None:
+				sub_options = choose_one[option.entity.entity_id] = []
+				self.options.append({
+					"Type": OptionType.POWER,
+					"MainOption": {
+						"ID": option.entity,
+						"Targets": [],
+					},
+					"SubOptions": sub_options,
+				})
+			sub_options.append({
+				"ID": option.choose,
+				"Targets": list(option.targets),
+			})
 
 		payload = {
 			"Type": "Options",
@@ -201,6 +204,9 @@ class KettleManager:
 			if entity.zone == Zone.HAND:
 				func = entity.play
 				kwargs["index"] = data["Position"]
+				if "SubOptions" in option:
+					sub_option = option["SubOptions"][data["SubOption"]]
+					kwargs["choose"] = sub_option["ID"].id
 			elif entity.zone == Zone.PLAY:
 				if entity.type == CardType.HERO_POWER:
 					func = entity.use
@@ -272,7 +278,65 @@ class KettleManager:
 		}
 
 
+def create_game(payload):
+	# self.game_id = payload["GameID"]
+	player_data = payload["Players"]
+	players = []
+	for player in player_data:
+		# Shuffle the cards to prevent information leaking
+		cards = player["Cards"]
+		random.shuffle(cards)
+		p = Player(player["Name"], cards, player["Hero"])
+		players.append(p)
+
+	INFO("Initializing a Kettle game with players=%r", players)
+	game = Game(players=players)
+	manager = KettleManager(game)
+	game.manager.register(manager)
+	game.current_player = game.players[0]  # Dumb.
+	game.start()
+
+	# Skip mulligan
+	for player in game.players:
+		player.choice = None
+
+	return manager
+
+
+def process_packet(packet, manager):
+	if packet["Type"] == "SendOption":
+		# throws GameOver when game ends
+		manager.process_send_option(packet["SendOption"])
+	elif packet["Type"] == "ChooseEntities":
+		manager.process_choose_entities(packet["ChooseEntities"])
+	elif packet["Type"] == "Concede":
+		player = manager.game.players[packet["Concede"] - 1]
+		player.concede()
+		manager.refresh_full_state()
+	else:
+		raise NotImplementedError
+
+
+def encode_payload(manager, serializer):
+	"""
+	Return the packet of the data queued by \a manager, and clear it
+	"""
+	serialized = serializer.encode(manager.queued_data).encode("utf-8")
+	manager.queued_data = []
+	DEBUG("Sending %r" % (serialized))
+	return HEADER.pack(len(serialized)) + serialized
+
+
+def decode_packet(body):
+	DEBUG("Got data %r", body)
+	return json.loads(body.decode("utf-8"))
+
+
 class Kettle(socketserver.BaseRequestHandler):
+	"""
+	Blocking Kettle connection, on a thread of a KettleServer.
+	See AsyncKettle for the asyncio one.
+	"""
 	def handle(self):
 		data = self.read_packet()
 		data = data[0]
@@ -301,59 +365,37 @@ class Kettle(socketserver.BaseRequestHandler):
 		self.send_payload(manager)
 		self.request.close()
 
+	def recv_exactly(self, size):
+		"""
+		Read \a size bytes, or return None if the connection is closed first
+		"""
+		data = b""
+		while len(data) < size:
+			chunk = self.request.recv(size - len(data))
+			if not chunk:
+				return None
+			data += chunk
+		return data
+
 	def read_packet(self):
-		header = self.request.recv(4)
-		if not header:
+		header = self.recv_exactly(HEADER.size)
+		if header is None:
 			return None
-		body_size, = struct.unpack("<i", header)
-		data = self.request.recv(body_size)
-		DEBUG("Got data %r", data)
-		return json.loads(data.decode("utf-8"))
+		body_size, = HEADER.unpack(header)
+		data = self.recv_exactly(body_size)
+		if data is None:
+			return None
+		return decode_packet(data)
 
 	def send_payload(self, manager):
-		serialized = self.serializer.encode(manager.queued_data).encode("utf-8")
-		manager.queued_data = []
-		response_payload = struct.pack("<i", len(serialized)) + serialized
-		DEBUG("Sending %r" % (response_payload))
-		self.request.sendall(response_payload)
+		self.request.sendall(encode_payload(manager, self.serializer))
 
 	def process_packet(self, packet, manager):
-		if packet["Type"] == "SendOption":
-			# throws GameOver when game ends
-			manager.process_send_option(packet["SendOption"])
-		elif packet["Type"] == "ChooseEntities":
-			manager.process_choose_entities(packet["ChooseEntities"])
-		elif packet["Type"] == "Concede":
-			player = manager.game.players[packet["Concede"] - 1]
-			player.concede()
-			manager.refresh_full_state()
-		else:
-			raise NotImplementedError
+		process_packet(packet, manager)
 		self.send_payload(manager)
 
 	def create_game(self, payload):
-		# self.game_id = payload["GameID"]
-		player_data = payload["Players"]
-		players = []
-		for player in player_data:
-			# Shuffle the cards to prevent information leaking
-			cards = player["Cards"]
-			random.shuffle(cards)
-			p = Player(player["Name"], cards, player["Hero"])
-			players.append(p)
-
-		INFO("Initializing a Kettle game with players=%r", players)
-		game = Game(players=players)
-		manager = KettleManager(game)
-		game.manager.register(manager)
-		game.current_player = game.players[0]  # Dumb.
-		game.start()
-
-		# Skip mulligan
-		for player in game.players:
-			player.choice = None
-
-		return manager
+		return create_game(payload)
 
 
 class KettleServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
@@ -361,20 +403,157 @@ class KettleServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
 	allow_reuse_address = True
 
 
+class AsyncKettle:
+	"""
+	Kettle server hosting the games of all its connections on an asyncio
+	event loop, with the same protocol as Kettle.
+	Each game runs in the task of its connection: an error in a game only
+	closes its connection. At most \a max_games games run at once, the
+	next connections wait for one of them to end.
+	"""
+	def __init__(self, max_games=256):
+		self.max_games = max_games
+		self.games = asyncio.Semaphore(max_games)
+		self.serializer = KettleSerializer()
+
+	async def start(self, hostname, port, reuse_port=False):
+		return await asyncio.start_server(
+			self.handle, hostname, port, reuse_address=True, reuse_port=reuse_port or None
+		)
+
+	async def read_packet(self, reader):
+		try:
+			header = await reader.readexactly(HEADER.size)
+			body_size, = HEADER.unpack(header)
+			body = await reader.readexactly(body_size)
+		except asyncio.IncompleteReadError:
+			return None
+		return decode_packet(body)
+
+	async def send_payload(self, writer, manager):
+		writer.write(encode_payload(manager, self.serializer))
+		# Do not queue more than the client reads
+		await writer.drain()
+
+	async def handle(self, reader, writer):
+		async with self.games:
+			try:
+				await self.play(reader, writer)
+			except ConnectionError:
+				pass
+			except Exception:
+				KettleLogger.exception("Closing the game of %r", writer.get_extra_info("peername"))
+			finally:
+				writer.close()
+
+	async def play(self, reader, writer):
+		data = await self.read_packet(reader)
+		if data is None:
+			return
+		data = data[0]
+		query_type = data["Type"]
+		payload = data[query_type]
+		DEBUG("Got payload %r", payload)
+		assert query_type == "CreateGame"
+
+		manager = create_game(payload)
+
+		while True:
+			manager.refresh_full_state()
+			manager.refresh_options()
+			await self.send_payload(writer, manager)
+			packet = await self.read_packet(reader)
+			if packet is None:
+				break
+			try:
+				process_packet(packet, manager)
+			except GameOver:
+				break
+			except InvalidAction as e:
+				# The game is left as it was: send the options again
+				WARN("Invalid action %r: %s", packet, e)
+			await self.send_payload(writer, manager)
+
+		# send final power history delta
+		manager.refresh_full_state()
+		await self.send_payload(writer, manager)
+
+	def serve_forever(self, hostname, port, reuse_port=False):
+		async def serve():
+			server = await self.start(hostname, port, reuse_port)
+			async with server:
+				await server.serve_forever()
+
+		asyncio.run(serve())
+
+
+def set_log_level(level):
+	for logger in (logging.getLogger(), KettleLogger, GameLogger):
+		logger.setLevel(level)
+
+
+def _serve_worker(hostname, port, max_games, log_level):
+	set_log_level(log_level)
+	cards.db.initialize()
+	try:
+		AsyncKettle(max_games).serve_forever(hostname, port, reuse_port=True)
+	except KeyboardInterrupt:
+		pass
+
+
 def main():
 	arguments = ArgumentParser(prog="kettle")
 	arguments.add_argument("hostname", default="127.0.0.1", nargs="?")
 	arguments.add_argument("port", type=int, default=9111, nargs="?")
+	arguments.add_argument(
+		"--workers", type=int, default=1,
+		help="Worker processes sharing the port (and the games)"
+	)
+	arguments.add_argument(
+		"--max-games", type=int, default=256,
+		help="Games hosted at once by each worker"
+	)
+	arguments.add_argument(
+		"--threaded", action="store_true",
+		help="Serve each connection on a thread (KettleServer)"
+	)
+	arguments.add_argument("--log-level", default="DEBUG")
 	args = arguments.parse_args(sys.argv[1:])
 
-	cards.db.initialize()
+	set_log_level(args.log_level)
 
 	INFO("Listening on %s:%i..." % (args.hostname, args.port))
-	kettle = KettleServer((args.hostname, args.port), Kettle)
-	try:
-		kettle.serve_forever()
-	except KeyboardInterrupt:
-		sys.exit(0)
+	if args.threaded:
+		cards.db.initialize()
+		kettle = KettleServer((args.hostname, args.port), Kettle)
+		try:
+			kettle.serve_forever()
+		except KeyboardInterrupt:
+			sys.exit(0)
+	elif args.workers > 1:
+		workers = [
+			multiprocessing.Process(
+				target=_serve_worker,
+				args=(args.hostname, args.port, args.max_games, args.log_level),
+				daemon=True
+			)
+			for i in range(args.workers)
+		]
+		for worker in workers:
+			worker.start()
+		# Exit cleanly, stopping the daemon workers
+		signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+		try:
+			for worker in workers:
+				worker.join()
+		except KeyboardInterrupt:
+			sys.exit(0)
+	else:
+		cards.db.initialize()
+		try:
+			AsyncKettle(args.max_games).serve_forever(args.hostname, args.port)
+		except KeyboardInterrupt:
+			sys.exit(0)
 
 	return 0
 
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Load generator for a Kettle server: plays random games on concurrent
+connections, and reports the games per second and the response latencies
+(from a packet sent to the options or choices it is answered with).
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from hearthstone.enums import OptionType
+from fireplace import cards
+from fireplace.utils import random_class, random_draft
+from kettle import HEADER, KettleLogger, KettleSerializer
+
+
+# Concede the games still running after this many packets
+MAX_PACKETS = 400
+
+
+async def read_packet(reader):
+	try:
+		header = await reader.readexactly(HEADER.size)
+		body_size, = HEADER.unpack(header)
+		body = await reader.readexactly(body_size)
+	except asyncio.IncompleteReadError:
+		return None
+	return json.loads(body.decode("utf-8"))
+
+
+async def send_packet(writer, data):
+	body = json.dumps(data, cls=KettleSerializer).encode("utf-8")
+	writer.write(HEADER.pack(len(body)) + body)
+	await writer.drain()
+
+
+def create_game_packet():
+	players = []
+	for i in range(2):
+		card_class = random_class()
+		players.append({
+			"Name": "Player%i" % (i + 1),
+			"Cards": random_draft(card_class),
+			"Hero": card_class.default_hero,
+		})
+	return [{"Type": "CreateGame", "CreateGame": {"Players": players}}]
+
+
+def answer(payload):
+	"""
+	A random answer to the Options or EntityChoices \\a payload
+	"""
+	if payload["Type"] == "EntityChoices":
+		choices = payload["EntityChoices"]
+		count = max(choices["CountMin"], 1)
+		return {"Type": "ChooseEntities", "ChooseEntities": choices["Entities"][:count]}
+
+	options = payload["Options"]
+	index = random.randrange(len(options))
+	option = options[index]
+	target, sub_option = 0, -1
+	if option["Type"] == OptionType.POWER:
+		main = option["MainOption"]
+		if option.get("SubOptions"):
+			sub_option = random.randrange(len(option["SubOptions"]))
+			main = option["SubOptions"][sub_option]
+		if main["Targets"]:
+			target = random.choice(main["Targets"])
+	return {"Type": "SendOption", "SendOption": {
+		"Index": index, "Target": target, "SubOption": sub_option, "Position": 0,
+	}}
+
+
+async def play_game(hostname, port, latencies):
+	reader, writer = await asyncio.open_connection(hostname, port)
+	try:
+		await send_packet(writer, create_game_packet())
+		sent = time.perf_counter()
+		for i in range(MAX_PACKETS):
+			# The answer to a packet is the changes, then the options
+			while True:
+				packet = await read_packet(reader)
+				if packet is None:
+					# Game over
+					return
+				requests = [p for p in packet if p["Type"] in ("Options", "EntityChoices")]
+				if requests:
+					break
+			latencies.append(time.perf_counter() - sent)
+			await send_packet(writer, answer(requests[-1]))
+			sent = time.perf_counter()
+		await send_packet(writer, {"Type": "Concede", "Concede": 1})
+		while await read_packet(reader) is not None:
+			pass
+	finally:
+		writer.close()
+
+
+async def run(hostname, port, games, concurrency):
+	latencies = []
+	remaining = [games]
+	failed = [0]
+
+	async def client():
+		while remaining[0] > 0:
+			remaining[0] -= 1
+			try:
+				await play_game(hostname, port, latencies)
+			except ConnectionError as e:
+				KettleLogger.warning("Game failed: %s", e)
+				failed[0] += 1
+
+	start = time.perf_counter()
+	await asyncio.gather(*[client() for i in range(concurrency)])
+	return time.perf_counter() - start, latencies, failed[0]
+
+
+def percentile(values, p):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+	arguments = ArgumentParser(prog="kettle-loadgen")
+	arguments.add_argument("hostname", default="127.0.0.1", nargs="?")
+	arguments.add_argument("port", type=int, default=9111, nargs="?")
+	arguments.add_argument("--games", type=int, default=100)
+	arguments.add_argument("--concurrency", type=int, default=20)
+	arguments.add_argument("--log-level", default="WARNING")
+	args = arguments.parse_args(sys.argv[1:])
+
+	KettleLogger.setLevel(args.log_level)
+	cards.db.initialize()
+
+	elapsed, latencies, failed = asyncio.run(run(args.hostname, args.port, args.games, args.concurrency))
+	print("%i games (%i failed) in %.2fs: %.2f games/s" % (
+		args.games, failed, elapsed, (args.games - failed) / elapsed
+	))
+	if latencies:
+		print("%i responses, latency p50 %.1fms, p99 %.1fms" % (
+			len(latencies), percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000
+		))
+	return 0
+
+
+if __name__ == "__main__":
+	exit(main())
@@ -57,3 +57,24 @@ def test_fullgame(benchmark):
 def test_singleturn(benchmark):
 	benchmark.weave(fireplace.utils.play_turn, lazy=True)
 	seeded_fullgame()
+
+
+STARTUP_SCRIPT = """
+from fireplace import cards
+from fireplace.utils import setup_game
+cards.db.initialize()
+setup_game()
+"""
+
+
+@pytest.mark.benchmark(
+	group="startup",
+	min_rounds=5
+)
+def test_startup(benchmark):
+	"""
+	Time to first game of a new process. Run `python -m fireplace.cards`
+	beforehand to benchmark it with the prebuilt card index.
+	"""
+	import subprocess
+	benchmark(subprocess.check_call, [sys.executable, "-c", STARTUP_SCRIPT], cwd="..")
@@ -0,0 +1,169 @@
+import pytest
+from utils import *
+from fireplace.actions import Hit
+
+
+class VerifiedGame(BaseTestGame):
+	verify_auras = True
+
+
+def test_aura_refresh_verified():
+	game = prepare_game(game_class=VerifiedGame)
+	wisp = game.player1.give(WISP)
+	wisp.play()
+	champion = game.player1.give("CS2_222")
+	champion.play()
+	wolf = game.player1.give("EX1_162")
+	wolf.play(index=1)
+	assert wisp.atk == 1 + 1 + 1
+	assert champion.atk == 6 + 1
+
+	game.player1.give(SILENCE).play(target=champion)
+	assert wisp.atk == 1 + 1
+	assert wolf.atk == 2
+	wolf.destroy()
+	assert wisp.atk == 1
+
+
+def test_aura_refresh_hand_verified():
+	game = prepare_game(game_class=VerifiedGame)
+	fireball = game.player1.give("CS2_029")
+	assert fireball.cost == 4
+	apprentice = game.player1.give("EX1_608")
+	apprentice.play()
+	assert fireball.cost == 4 - 1
+	game.player1.give(MOONFIRE).play(target=apprentice)
+	game.player1.give(MOONFIRE).play(target=apprentice)
+	assert apprentice.dead
+	assert fireball.cost == 4
+
+
+def test_aura_refresh_skips_unchanged():
+	game = prepare_game()
+	wisp = game.player1.give(WISP)
+	wisp.play()
+	champion = game.player1.give("CS2_222")
+	champion.play()
+	game.cheat_action(game.player1.hero, [Hit(game.player2.hero, 1)])
+	record, = champion._auras.values()
+	game.cheat_action(game.player1.hero, [Hit(game.player2.hero, 1)])
+	game.cheat_action(game.player1.hero, [Hit(game.player2.hero, 1)])
+	assert champion._auras[champion.data.scripts.update[0]] is record
+	assert record.hits >= 2
+	assert wisp.atk == 2
+
+	game.player1.give(WISP).play()
+	assert champion._auras[champion.data.scripts.update[0]] is not record
+
+
+def test_aura_refresh_verification():
+	game = prepare_game(game_class=VerifiedGame)
+	wisp = game.player1.give(WISP)
+	wisp.play()
+	game.player1.give("CS2_222").play()
+	game.cheat_action(game.player1.hero, [Hit(game.player2.hero, 1)])
+	assert wisp.atk == 2
+
+	# drop the aura buff behind the back of the dirty tracking
+	buff, = wisp.buffs
+	wisp.buffs.remove(buff)
+	game.active_aura_buffs.remove(buff)
+	with pytest.raises(AssertionError):
+		game.refresh_auras()
+
+
+def test_aura_refresh_exception(monkeypatch):
+	from fireplace import dirty
+	from fireplace.card import Minion
+
+	game = prepare_game()
+	# the failing aura is only run by the incremental, recorded refresh
+	game.verify_auras = False
+	wisp = game.player1.give(WISP)
+	wisp.play()
+	champion = game.player1.give("CS2_222")
+	champion.play()
+	created = []
+
+	def trigger(self, source):
+		# the entities created while recording are tracked as well
+		created.append(source.controller.give(WISP))
+		raise RuntimeError("aura failed")
+
+	monkeypatch.setattr(type(champion.data.scripts.update[0]), "trigger", trigger)
+	champion._auras.clear()
+	with pytest.raises(RuntimeError):
+		game.refresh_auras()
+	monkeypatch.undo()
+
+	# no entity is left with its recording class
+	assert created
+	assert not [entity for entity in chain(game.players, game.manager.entities) if type(entity)._tracked]
+	assert type(wisp) is type(created[0]) is Minion
+	assert dirty._state.record is None and dirty._state.reads is None
+
+	# interrupted while switching the classes of the entities
+	track = dirty.track
+
+	def interrupted_track(entity):
+		if entity is wisp:
+			raise KeyboardInterrupt
+		track(entity)
+
+	monkeypatch.setattr(dirty, "track", interrupted_track)
+	champion._auras.clear()
+	with pytest.raises(KeyboardInterrupt):
+		game.refresh_auras()
+	monkeypatch.undo()
+	assert not [entity for entity in chain(game.players, game.manager.entities) if type(entity)._tracked]
+	assert dirty._state.record is None and dirty._state.reads is None
+
+	champion._auras.clear()
+	game.refresh_auras()
+	assert wisp.atk == 2
+	assert game.clone().player1.field[0].atk == 2
+
+
+def test_threaded_games():
+	import sys
+	from concurrent.futures import ThreadPoolExecutor
+	from random import Random
+	from fireplace.exceptions import GameOver
+	from fireplace.logging import silenced
+	from fireplace.options import Option
+
+	def play(seed):
+		rng = Random(seed)
+		players = (
+			Player("Player1", random_draft(CardClass.MAGE, rng=rng), CardClass.MAGE.default_hero),
+			Player("Player2", random_draft(CardClass.WARRIOR, rng=rng), CardClass.WARRIOR.default_hero),
+		)
+		game = BaseTestGame(players=players, seed=seed)
+		game.start()
+		try:
+			while game.turn < 16:
+				player = game.current_player
+				for i in range(6):
+					options = [o for o in player.legal_options() if o.targets or o.type != Option.ATTACK]
+					if not options:
+						break
+					option = game.random.choice(options)
+					option.perform(game.random.choice(option.targets) if option.targets else None)
+					if player.choice:
+						player.choice.choose(game.random.choice(player.choice.cards))
+				game.end_turn()
+		except GameOver:
+			pass
+		return [(card.id, card.zone, getattr(card, "health", None)) for card in game if card.is_card]
+
+	seeds = range(4)
+	with silenced():
+		expected = [play(seed) for seed in seeds]
+		# switch threads as often as possible, in the middle of recorded computations
+		interval = sys.getswitchinterval()
+		sys.setswitchinterval(1e-6)
+		try:
+			with ThreadPoolExecutor(len(seeds)) as pool:
+				assert list(pool.map(play, seeds)) == expected
+		finally:
+			sys.setswitchinterval(interval)
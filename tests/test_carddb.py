@@ -1,4 +1,4 @@
-from hearthstone.enums import CardType, GameTag, Rarity
+from hearthstone.enums import CardClass, CardType, GameTag, Race, Rarity
 
 import utils
 
@@ -46,3 +46,100 @@ def test_card_docstrings():
 			if name.endswith(")"):
 				continue
 			assert name == card.name
+
+
+def test_card_index(tmpdir):
+	path = str(tmpdir.join("cardindex.pickle"))
+	assert CARDS.load_index(path) is None
+	CARDS.build_index(path)
+	index = CARDS.load_index(path)
+	assert index["sets"]["CS2_222"] == "classic"
+	assert "CS2_231" not in index["sets"]
+
+	db = utils.fireplace.cards.CardDB()
+	db.initialize(path)
+	for id in ("CS2_222", "EX1_561", "GVG_110", "CS2_231"):
+		assert db[id].tags == CARDS[id].tags
+		assert db[id].name == CARDS[id].name
+		assert db[id].requirements == CARDS[id].requirements
+		assert db[id].entourage == CARDS[id].entourage
+		assert db[id].scripts.update == CARDS[id].scripts.update
+
+
+def test_card_index_lazy(tmpdir):
+	path = str(tmpdir.join("cardindex.pickle"))
+	CARDS.build_index(path)
+	db = utils.fireplace.cards.CardDB()
+	db.initialize(path)
+	card = db["CS2_222"]
+	assert "scripts" not in vars(card)
+	assert card.cardsets == ("classic", )
+	assert card.scripts.update == CARDS["CS2_222"].scripts.update
+	assert "scripts" in vars(card)
+	assert db["CS2_231"].scripts.play == []
+	assert db["CS2_231"].choose_cards == []
+
+	# The script tags are known before the scripts are merged
+	# (the custom cards are only registered in the global database)
+	for kwargs in ({"type": CardType.ENCHANTMENT}, {"taunt": True}, {"collectible": True}):
+		assert db.filter(**kwargs) == [id for id in CARDS.filter(**kwargs) if id in db]
+
+
+def test_card_index_lazy_threads(tmpdir):
+	import sys
+	from concurrent.futures import ThreadPoolExecutor
+	from threading import Barrier
+	from fireplace.rules import POISONOUS
+
+	path = str(tmpdir.join("cardindex.pickle"))
+	CARDS.build_index(path)
+	db = utils.fireplace.cards.CardDB()
+	db.initialize(path)
+	ids = [id for id in db.filter(collectible=True) if db[id].cardsets][:200]
+	num_threads = 8
+	barrier = Barrier(num_threads)
+
+	def merge_all():
+		barrier.wait()
+		ret = []
+		for id in ids:
+			scripts = db[id].scripts
+			ret.append((scripts, scripts.events, scripts.Hand.events, db[id].choose_cards))
+		return ret
+
+	interval = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)
+	try:
+		with ThreadPoolExecutor(num_threads) as executor:
+			results = list(executor.map(lambda i: merge_all(), range(num_threads)))
+	finally:
+		sys.setswitchinterval(interval)
+
+	for id, merged in zip(ids, zip(*results)):
+		scripts = db[id].scripts
+		for seen_scripts, events, hand_events, choose_cards in merged:
+			# Every thread sees the one complete merge of the card
+			assert seen_scripts is scripts
+			assert isinstance(events, list) and isinstance(hand_events, list)
+			assert choose_cards == CARDS[id].choose_cards
+		assert scripts.events.count(POISONOUS) == (1 if db[id].poisonous else 0)
+
+
+def test_filter_pools():
+	db = utils.fireplace.cards.CardDB()
+	db.initialize()
+	totems = db.filter(race=Race.TOTEM)
+	assert totems
+	assert all(db[id].race == Race.TOTEM for id in totems)
+	# Memoized, but each caller gets its own list
+	totems.pop()
+	assert len(db.filter(race=Race.TOTEM)) == len(totems) + 1
+	mages = db.filter(collectible=True, card_class=[CardClass.MAGE], cost=[1, 2])
+	assert mages == [
+		id for id, card in db.items() if card.collectible and card.card_class == CardClass.MAGE and
+		card.cost in (1, 2) and card.type in (CardType.SPELL, CardType.WEAPON, CardType.MINION)
+	]
+
+	db["CS2_222"].tags[GameTag.CARDRACE] = Race.TOTEM
+	db["CS2_222"] = db["CS2_222"]
+	assert "CS2_222" in db.filter(race=Race.TOTEM)
@@ -3195,6 +3195,18 @@ def test_tracking():
 	assert game.player1.hand == [pick]
 
 
+def test_tracking_two_games():
+	games = [prepare_game(), prepare_game()]
+	for game in games:
+		game.player1.discard_hand()
+		game.player1.give("DS1_184").play()
+	assert games[0].player1.choice is not games[1].player1.choice
+	for game in games:
+		pick = game.player1.choice.cards[0]
+		game.player1.choice.choose(pick)
+		assert game.player1.hand == [pick]
+
+
 def test_truesilver_champion():
 	game = prepare_game()
 	truesilver = game.current_player.give("CS2_097")
@@ -0,0 +1,91 @@
+from utils import *
+
+
+def test_clone_independent():
+	game = prepare_game()
+	wisp = game.player1.give(WISP)
+	wisp.play()
+	clone = game.clone()
+
+	assert clone is not game
+	assert clone.turn == game.turn
+	assert clone.tick == game.tick
+	assert len(clone.player1.field) == 1
+	cloned_wisp = clone.player1.field[0]
+	assert cloned_wisp is not wisp
+	assert cloned_wisp.entity_id == wisp.entity_id
+	assert cloned_wisp.controller is clone.player1
+	assert cloned_wisp.game is clone
+	assert cloned_wisp.data is wisp.data
+
+	clone.player1.give(MOONFIRE).play(target=cloned_wisp)
+	assert cloned_wisp.dead
+	assert not wisp.dead
+	assert len(game.player1.field) == 1
+
+
+def test_clone_auras():
+	game = prepare_game()
+	game.player1.give(WISP).play()
+	game.player1.give("CS2_222").play()
+	clone = game.clone()
+	assert clone.player1.field[0].atk == 2
+
+	clone.player1.give(SILENCE).play(target=clone.player1.field[1])
+	assert clone.player1.field[0].atk == 1
+	assert game.player1.field[0].atk == 2
+
+
+def test_clone_events():
+	game = prepare_game()
+	pyromancer = game.player1.give("NEW1_020")
+	pyromancer.play()
+	clone = game.clone()
+	clone.player1.give(MOONFIRE).play(target=clone.player2.hero)
+	assert clone.player1.field[0].health == 1
+	assert pyromancer.health == 2
+
+
+def test_clone_play_out():
+	game = prepare_game()
+	clone = game.clone()
+	for i in range(5):
+		clone.end_turn()
+	assert clone.turn == game.turn + 5
+	assert game.current_player is game.player1
+
+
+def test_clone_buffs():
+	game = prepare_game()
+	wisp = game.player1.give(WISP)
+	wisp.play()
+	game.player1.give("CS2_092").play(target=wisp)
+	versions = dict(wisp._versions)
+	clone = game.clone()
+	# copying the enchantment must not touch its owner in the original game
+	assert wisp._versions == versions
+	assert clone.player1.field[0].atk == wisp.atk == 5
+
+
+def test_clone_random():
+	game = prepare_game()
+	clone = game.clone()
+	assert clone.random is not game.random
+	assert [clone.random.random() for i in range(5)] == [game.random.random() for i in range(5)]
+
+
+def test_clone_reduce():
+	from collections import deque
+	from fireplace.clone import Cloner
+
+	class History(deque):
+		# the items are not in the __dict__ of the deque
+		pass
+
+	history = History([1, 2, 3])
+	history.name = "history"
+	ret = Cloner().clone([history, history])
+	assert ret[0] is ret[1]
+	assert ret[0] is not history
+	assert list(ret[0]) == [1, 2, 3]
+	assert ret[0].name == "history"
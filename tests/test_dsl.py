@@ -155,6 +155,59 @@ def test_controlled_by_selector():
 	assert targets[0] == wisp
 
 
+def test_compiled_selector():
+	game = prepare_game()
+	wisp1 = game.player1.summon(WISP)
+	wisp2 = game.player2.summon(WISP)
+	wisp3 = game.player1.summon(WISP)
+	ids = lambda entities: [e.entity_id for e in entities]
+	selectors = [
+		FRIENDLY_MINIONS, ENEMY_MINIONS, ALL_MINIONS, ALL_CHARACTERS, FRIENDLY_HAND, ENEMY_DECK,
+		FRIENDLY_MINIONS - SELF, IN_HAND + (MINION | SPELL) - FRIENDLY, KILLED + FRIENDLY,
+	]
+	for selector in selectors:
+		# Same entities, in the same order, as a scan of the whole game
+		assert ids(selector.eval(game, wisp1)) == ids(selector.eval(list(game), wisp1))
+	assert FRIENDLY_MINIONS.compile() is FRIENDLY_MINIONS.compile()
+	assert ids(FRIENDLY_MINIONS.eval(game, wisp1)) == ids([wisp1, wisp3])
+	assert ids((FRIENDLY_MINIONS - SELF).eval(game, wisp1)) == ids([wisp3])
+	assert ids(ENEMY_MINIONS.eval(game, wisp1)) == ids([wisp2])
+
+
+def test_selector_matcher():
+	game = prepare_game()
+	wisp1 = game.player1.summon(WISP)
+	wisp2 = game.player2.summon(WISP)
+	moonfire = game.player1.give(MOONFIRE)
+	moonfire.target = wisp2
+	selectors = [
+		SELF, OWNER, TARGET, CONTROLLER, OPPONENT, MINION, FRIENDLY_MINIONS - SELF,
+		ENEMY_CHARACTERS, FRIENDLY + (MINION | SPELL), CURRENT_HEALTH <= 1, ID(WISP),
+	]
+	entities = [game.player1, game.player2, wisp1, wisp2, moonfire, game.player1.hero]
+	for selector in selectors:
+		match = selector.matcher()
+		for source in (wisp1, moonfire):
+			for entity in entities:
+				# Same as selecting the entity out of [entity]
+				selected = selector.eval([entity], source)
+				assert match(entity, source) == (bool(selected) and selected[0] is entity)
+	assert SELF.matcher() is SELF.matcher()
+
+
+def test_trigger_matchers():
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	trigger = Play(CONTROLLER, MINION - SELF)
+	assert trigger.matches(wisp, (game.player1, game.player1.summon(WISP)))
+	assert not trigger.matches(wisp, (game.player1, wisp))
+	assert not trigger.matches(wisp, (game.player2, game.player2.summon(WISP)))
+	assert not trigger.matches(wisp, (game.player1, None))
+	assert Play(CONTROLLER, None).matches(wisp, (game.player1, None))
+	assert Predamage(SELF, lambda i: i > 1).matches(wisp, (wisp, 2))
+	assert not Predamage(SELF, lambda i: i > 1).matches(wisp, (wisp, 1))
+
+
 def test_random_selector():
 	game = prepare_game()
 	selector = RANDOM(EnumSelector(CardType.MINION))
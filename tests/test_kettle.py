@@ -0,0 +1,42 @@
+import asyncio
+import logging
+import sys
+import utils
+
+sys.path.insert(0, "../kettle")
+import kettle
+import loadgen
+
+
+def test_async_kettle(monkeypatch):
+	monkeypatch.setattr(loadgen, "MAX_PACKETS", 20)
+	kettle.KettleLogger.setLevel(logging.WARNING)
+
+	async def run():
+		server = await kettle.AsyncKettle(max_games=2).start("127.0.0.1", 0)
+		port = server.sockets[0].getsockname()[1]
+		async with server:
+			return await loadgen.run("127.0.0.1", port, 3, 3)
+
+	elapsed, latencies, failed = asyncio.run(run())
+	assert not failed
+	assert len(latencies) >= 3
+
+
+def test_kettle_framing():
+	class Reader:
+		def __init__(self, data):
+			self.data = data
+
+		async def readexactly(self, size):
+			if len(self.data) < size:
+				raise asyncio.IncompleteReadError(self.data, size)
+			ret, self.data = self.data[:size], self.data[size:]
+			return ret
+
+	body = b'{"Type": "Concede", "Concede": 1}'
+	reader = Reader(kettle.HEADER.pack(len(body)) + body + kettle.HEADER.pack(10) + b"{}")
+	app = kettle.AsyncKettle()
+	assert asyncio.run(app.read_packet(reader)) == {"Type": "Concede", "Concede": 1}
+	# A truncated packet is the end of the connection
+	assert asyncio.run(app.read_packet(reader)) is None
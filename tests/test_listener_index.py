@@ -0,0 +1,47 @@
+from utils import *
+from fireplace.actions import BeginTurn, EventListener, Hit, ListenerIndex, Summon
+
+
+def test_listener_index():
+	game = prepare_game()
+	juggler = game.player1.summon("NEW1_019")
+	wisp = game.player1.summon(WISP)
+	index = ListenerIndex(game)
+	positions = index.positions(Summon, EventListener.AFTER)
+	assert juggler in [index.entities[i] for i in positions]
+	assert wisp not in [index.entities[i] for i in positions]
+	assert not index.positions(Summon, EventListener.ON)
+
+	game.cheat_action(game.player1.hero, [Hit(game.player2.hero, 1)])
+	assert not index.stale
+	game.player1.summon(WISP)
+	assert index.stale
+
+
+def test_listener_index_silence():
+	game = prepare_game()
+	juggler = game.player1.summon("NEW1_019")
+	index = ListenerIndex(game)
+	game.player1.give(SILENCE).play(target=juggler)
+	assert index.stale
+	index = ListenerIndex(game)
+	assert juggler not in [index.entities[i] for i in index.positions(Summon, EventListener.AFTER)]
+
+
+def test_listener_index_hand():
+	game = prepare_empty_game()
+	affliction = game.player1.give("BRMA12_3")
+	index = ListenerIndex(game)
+	assert affliction in index.entities[index.split:]
+	assert index.positions(BeginTurn, EventListener.ON)
+
+
+def test_broadcast_listeners_change():
+	game = prepare_game()
+	acolyte = game.player1.summon("EX1_007")
+	berserker = game.player1.summon("EX1_399")
+	hand = len(game.player1.hand)
+	# Acolyte of Pain draws a card: the listeners change during the broadcasts
+	game.player1.give("EX1_400").play()
+	assert len(game.player1.hand) == hand + 1
+	assert berserker.atk == 2 + 3
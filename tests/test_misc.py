@@ -56,3 +56,170 @@ def test_event_queue_summon():
 	assert reaver in game.player2.hand
 	assert buzzard.health == 1
 	assert len(game.player2.field) == 1
+
+
+def test_cached_stats():
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	assert wisp.atk == 1
+	assert not wisp.taunt
+	assert "atk" in wisp._stats
+
+	# buffs, aura slots and the attributes of buffs all invalidate the cache
+	blessing = wisp.buff(wisp, "CS2_087e")
+	assert wisp.atk == 1 + 3
+	blessing.atk = 5
+	assert wisp.atk == 1 + 5
+	champion = game.player1.summon("CS2_222")
+	assert wisp.atk == 1 + 5 + 1
+	wisp.buff(wisp, "CS2_009e")
+	assert wisp.taunt
+	assert wisp.atk == 1 + 5 + 1 + 2
+	champion.destroy()
+	assert wisp.atk == 1 + 5 + 2
+	game.player1.give(SILENCE).play(target=wisp)
+	assert wisp.atk == 1
+	assert not wisp.taunt
+
+
+def test_weighted_card_choice():
+	from collections import Counter
+	from random import Random
+	from fireplace.utils import weighted_card_choice
+
+	weights = [1, 3]
+	card_sets = [("a", "b", "c"), ("d", "e")]
+
+	def expected(weights, card_sets, count):
+		# Exact distribution of the ordered draws, popping the drawn cards
+		if not count:
+			return {(): 1.0}
+		ret = {}
+		total = sum(w * len(cards) for w, cards in zip(weights, card_sets))
+		for i, (w, cards) in enumerate(zip(weights, card_sets)):
+			for j, card in enumerate(cards):
+				rest = list(card_sets)
+				rest[i] = cards[:j] + cards[j + 1:]
+				for draws, p in expected(weights, rest, count - 1).items():
+					ret[(card, ) + draws] = ret.get((card, ) + draws, 0) + p * w / total
+		return ret
+
+	class Source:
+		class controller:
+			def card(id, source):
+				return id
+
+		class game:
+			random = Random(1857)
+
+	draws = 30000
+	for count in (1, 2, 3):
+		counts = Counter(
+			tuple(weighted_card_choice(Source, weights, card_sets, count)) for i in range(draws)
+		)
+		assert card_sets == [("a", "b", "c"), ("d", "e")]
+		distribution = expected(weights, card_sets, count)
+		assert set(counts) <= set(distribution)
+		for outcome, p in distribution.items():
+			# within 5 standard deviations
+			assert abs(counts[outcome] / draws - p) < 5 * (p * (1 - p) / draws) ** 0.5
+
+
+def test_event_trace():
+	from fireplace.logging import EventTrace, tracing
+
+	game = prepare_game()
+	wisp = game.player2.summon(WISP)
+	moonfire = game.player1.give(MOONFIRE)
+	other = prepare_game()
+	with tracing(game) as trace:
+		assert game.trace is trace
+		assert not game.clone().trace
+		other.player1.give(WISP).play()
+		assert not len(trace)
+		moonfire.play(target=wisp)
+	assert game.trace is None
+	assert isinstance(trace, EventTrace)
+	records = list(trace)
+	assert len(records) == len(trace)
+	assert ("Play", game.player1.entity_id, moonfire.entity_id, 0) in records
+	assert ("Hit", moonfire.entity_id, wisp.entity_id, 1) in records
+	assert len(trace.data.tobytes()) == len(trace) * trace.RECORD_SIZE * trace.data.itemsize
+
+	with tracing(game, trace):
+		game.end_turn()
+	assert len(trace) > len(records)
+	game.end_turn()
+	assert len(trace) == len(list(trace))
+
+
+def test_silenced(caplog):
+	from fireplace import logging
+	from fireplace.logging import silenced
+
+	game = prepare_game()
+	caplog.clear()
+	with silenced():
+		assert logging.silent
+		game.player1.give(WISP).play()
+	assert not logging.silent
+	assert not caplog.records
+	game.player1.give(WISP).play()
+	assert caplog.records
+
+
+def test_game_seed():
+	from fireplace.utils import random_draft
+
+	deck = random_draft(CardClass.MAGE)
+
+	def new_game(seed):
+		hero = CardClass.MAGE.default_hero
+		game = BaseTestGame(players=(Player("Player1", deck, hero), Player("Player2", deck, hero)), seed=seed)
+		game.start()
+		return game
+
+	def play(game):
+		player = game.current_player
+		# the global random module does not affect the game
+		random.random()
+		for i in range(3):
+			player.opponent.summon(WISP)
+		player.give("EX1_277").play()
+		player.give("GVG_003").play()
+		return (
+			[card.id for card in game.player1.deck], [card.id for card in game.player2.hand],
+			[minion.id for minion in game.board], player.opponent.hero.health,
+		)
+
+	assert new_game(1857).current_player.name == new_game(1857).current_player.name
+	assert play(new_game(1857)) == play(new_game(1857))
+	assert play(new_game(1857)) != play(new_game(1858))
+
+	game = new_game(1857)
+	state = game.random.getstate()
+	clone = game.clone()
+	result = play(game)
+	assert play(clone) == result
+	game = new_game(1857)
+	game.random.seed(0)
+	game.random.setstate(state)
+	assert play(game) == result
+
+
+def test_brawl_seed():
+	from fireplace.brawls import BlackrockShowdownBrawl, GrandTournamentBrawl
+
+	def new_game(cls, seed):
+		game = cls.new_game(Player("Player1", [], None), Player("Player2", [], None), seed=seed)
+		assert game.seed == seed
+		game.start()
+		return [player.hero.id for player in game.players], [card.id for card in game.player1.hand]
+
+	for cls in (BlackrockShowdownBrawl, GrandTournamentBrawl):
+		heroes = set()
+		for seed in range(8):
+			assert new_game(cls, seed) == new_game(cls, seed)
+			heroes.add(tuple(new_game(cls, seed)[0]))
+		# both players get either deck
+		assert len(heroes) == 2
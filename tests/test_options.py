@@ -0,0 +1,54 @@
+from utils import *
+from fireplace.options import Option
+
+
+def test_legal_options():
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	game.end_turn()
+	game.end_turn()
+	game.player1.discard_hand()
+	moonfire = game.player1.give(MOONFIRE)
+	game.player1.give(WISP)
+	options = game.player1.legal_options()
+	assert [option.type for option in options] == [Option.ATTACK, Option.PLAY, Option.PLAY, Option.POWER]
+	attack = options[0]
+	assert attack.entity is wisp
+	assert list(attack.targets) == [game.player2.hero]
+	assert options[1].entity is moonfire
+	assert len(options[1].targets) == 3
+	assert not options[2].targets
+	assert not game.player2.legal_options()
+
+	options[1].perform(game.player2.hero)
+	assert game.player2.hero.health == 30 - 1
+	assert moonfire not in [option.entity for option in game.player1.legal_options()]
+
+
+def test_legal_options_choose_one():
+	game = prepare_game(CardClass.DRUID, CardClass.DRUID)
+	game.player1.discard_hand()
+	wisp = game.player2.summon(WISP)
+	wrath = game.player1.give("EX1_154")
+	options = [option for option in game.player1.legal_options() if option.entity is wrath]
+	assert [option.choose.id for option in options] == ["EX1_154a", "EX1_154b"]
+	assert [list(option.targets) for option in options] == [[wisp], [wisp]]
+	options[0].perform(wisp)
+	assert wisp.dead
+
+
+def test_legal_options_cache():
+	game = prepare_game()
+	options = game.player1.legal_options()
+	assert game.player1.legal_options() is options
+	game.player1.give(WISP)
+	assert game.player1.legal_options() is not options
+	game.player1.give(MOONFIRE)
+	power = [option for option in game.player1.legal_options() if option.type == Option.POWER][0]
+	power.perform(power.targets[0] if power.targets else None)
+	assert Option.POWER not in [option.type for option in game.player1.legal_options()]
+
+	clone = game.clone()
+	assert len(clone.player1.legal_options()) == len(game.player1.legal_options())
+	for option in clone.player1.legal_options():
+		assert option.entity.game is clone
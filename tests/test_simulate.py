@@ -0,0 +1,50 @@
+from utils import *
+from fireplace import simulate
+
+
+def test_run_games():
+	results = simulate.run_games(5, seed=1857)
+	assert len(results) == 5
+	assert [result.seed for result in results] == list(range(1857, 1862))
+	for result in results:
+		assert result.winner in (0, 1, None)
+		assert result.turns > 0
+		assert result.duration > 0
+
+
+def test_run_games_deterministic():
+	results1 = simulate.run_games(3, seed=42)
+	results2 = simulate.run_games(3, seed=42)
+	assert [result[:3] for result in results1] == [result[:3] for result in results2]
+
+
+def test_run_games_silent(capsys):
+	simulate.run_games(2, seed=7)
+	out, err = capsys.readouterr()
+	assert not out
+	assert not err
+
+
+def test_custom_agents():
+	def idle_agent(game, player):
+		pass
+
+	for seed in range(3):
+		result = simulate.play_game(seed, agents=(simulate.random_agent, idle_agent))
+		assert result.winner == 0
+
+	result = simulate.play_game(3, agents=(idle_agent, idle_agent), max_turns=10)
+	assert result.winner is None
+	assert result.turns == 11
+
+
+def test_win_rate():
+	results = [
+		simulate.GameResult(0, 0, 10, 0.1),
+		simulate.GameResult(1, 1, 10, 0.1),
+		simulate.GameResult(2, 0, 10, 0.1),
+		simulate.GameResult(3, None, 10, 0.1),
+	]
+	assert simulate.win_rate(results) == 2 / 3
+	assert simulate.win_rate(results, player_index=1) == 1 / 3
+	assert simulate.win_rate([]) == 0
@@ -0,0 +1,63 @@
+from utils import *
+from fireplace.actions import Hit
+
+
+def changed(changes):
+	return {(entity, tag): value for entity, tag, value in changes.drain()}
+
+
+def test_tag_changes():
+	game = prepare_game()
+	changes = game.manager.track_changes()
+	assert game.manager.track_changes() is changes
+	wisp = game.player1.give(WISP)
+	tags = changed(changes)
+	assert tags[wisp, GameTag.ATK] == 1
+	assert tags[wisp, GameTag.ZONE] == Zone.HAND
+	assert tags[wisp, GameTag.DAMAGE] == 0
+	assert not changed(changes)
+
+	wisp.play()
+	tags = changed(changes)
+	assert tags[wisp, GameTag.ZONE] == Zone.PLAY
+	assert (wisp, GameTag.ATK) not in tags
+
+	game.cheat_action(game.player1.hero, [Hit(game.player2.hero, 2)])
+	tags = changed(changes)
+	assert tags[game.player2.hero, GameTag.DAMAGE] == 2
+	assert wisp not in [entity for entity, tag in tags]
+
+
+def test_tag_changes_derived():
+	game = prepare_game()
+	changes = game.manager.track_changes()
+	wisp = game.player1.give(WISP)
+	wisp.play()
+	leader = game.player1.give("CS2_122")
+	leader.play()
+	assert changed(changes)[wisp, GameTag.ATK] == 1 + 1
+
+	# Only the buffs of the wisp change
+	game.player1.give(SILENCE).play(target=leader)
+	assert changed(changes)[wisp, GameTag.ATK] == 1
+
+	# The positions in hand of the other cards
+	moonfire = game.player1.give(MOONFIRE)
+	hand = list(game.player1.hand)
+	assert changed(changes)[moonfire, GameTag.ZONE_POSITION] == len(hand)
+	hand[0].discard()
+	tags = changed(changes)
+	for i, card in enumerate(hand[1:]):
+		assert tags[card, GameTag.ZONE_POSITION] == i + 1
+
+
+def test_tag_changes_clone():
+	game = prepare_game()
+	changes = game.manager.track_changes()
+	game.player1.give(WISP).play()
+	changed(changes)
+	clone = game.clone()
+	wisp = clone.player1.field[0]
+	clone.player1.give(MOONFIRE).play(target=wisp)
+	assert not changed(changes)
+	assert changed(clone.manager.changes)[wisp, GameTag.ZONE] == Zone.GRAVEYARD
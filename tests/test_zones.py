@@ -0,0 +1,69 @@
+import pytest
+from utils import *
+from fireplace.utils import IndexedCardList
+
+
+def test_indexed_card_list():
+	game = prepare_empty_game()
+	wisps = [game.player1.card(WISP) for i in range(4)]
+	zone = IndexedCardList(wisps[:3])
+	# the wisps are equal, but looked up by identity
+	assert wisps[3] not in zone
+	assert zone.index(wisps[2]) == 2
+	zone.remove(wisps[0])
+	assert wisps[0] not in zone
+	assert zone.index(wisps[2]) == 1
+	zone.insert(0, wisps[3])
+	assert zone.index(wisps[3]) == 0
+	assert zone.index(wisps[2]) == 2
+	zone.append(wisps[0])
+	assert zone.pop() is wisps[0]
+	assert wisps[0] not in zone
+	zone.reverse()
+	assert zone.index(wisps[3]) == 2
+	with pytest.raises(ValueError):
+		zone.remove(wisps[0])
+
+
+def test_zone_position():
+	game = prepare_game()
+	wisp1 = game.player1.give(WISP)
+	wisp1.play()
+	wisp2 = game.player1.give(WISP)
+	wisp2.play(index=0)
+	assert wisp2.zone_position == 1
+	assert wisp1.zone_position == 2
+	game.player1.give(MOONFIRE).play(target=wisp2)
+	assert wisp1.zone_position == 1
+	assert game.player1.hand[-1].zone_position == len(game.player1.hand)
+
+
+def test_views():
+	game = prepare_game()
+	board = game.board
+	characters = game.characters
+	assert game.board is board
+	wisp = game.player2.summon(WISP)
+	assert game.board is not board
+	assert wisp not in board
+	assert list(game.board) == [wisp]
+	assert game.characters is not characters
+	assert list(game.characters) == [game.player1.hero, game.player2.hero, wisp]
+
+	entities = game.entities
+	game.player1.give("CS2_092").play(target=wisp)
+	assert game.entities is not entities
+	assert wisp.buffs[0] in game.entities
+
+
+def test_views_clone():
+	game = prepare_game()
+	wisp = game.player1.summon(WISP)
+	assert wisp in game.board
+	clone = game.clone()
+	cloned_wisp = clone.player1.field[0]
+	assert cloned_wisp in clone.board
+	assert wisp not in clone.board
+	assert cloned_wisp in clone.player1.field
+	assert wisp not in clone.player1.field
+	assert cloned_wisp.zone_position == 1